@@ -31,14 +31,18 @@ export const ForecastPanel = component$<ForecastPanelProps>(({ forecast }) => {
         </div>
         <div>
           <span class="mb-1 block text-sm font-medium tracking-wider text-slate-400 uppercase">
-            Forecast (T+1)
+            Forecast (T+1 min)
           </span>
           <div
             class={`flex items-center gap-2 text-4xl font-bold tracking-tight ${forecast.trend === "increasing" ? "text-red-400" : "text-emerald-400"}`}
           >
             {forecast.forecast_temperature?.toFixed(1)}°C
             <span class="text-lg">
-              {forecast.trend === "increasing" ? "↑" : "↓"}
+              {forecast.trend === "increasing"
+                ? "↑"
+                : forecast.trend === "stable"
+                  ? "→"
+                  : "↓"}
             </span>
           </div>
         </div>
@@ -16,11 +16,13 @@ export function useTwinSocket(
     $(() => {
       socketService.connect();
 
-      socketService.onTelemetryUpdate((data) => {
+      socketService.onTelemetryUpdate((updates) => {
+        const byId = new Map(updates.map((u) => [u._id, u]));
         const currentSelectedTwin = selectedTwin.value;
 
         const updatedTwins = twins.value.map((t) => {
-          if (t._id === data._id) {
+          const data = byId.get(t._id);
+          if (data) {
             const updated = { ...t, ...data };
 
             if (currentSelectedTwin?._id === data._id) {
@@ -6,10 +6,19 @@ export interface HistoryItem {
   cpu_usage: number;
 }
 
+export interface FieldForecast {
+  current: number;
+  slope_per_hour: number;
+  points: number;
+  predictions: { horizon_seconds: number; value: number }[];
+}
+
 export interface Forecast {
   current_temperature: number;
   forecast_temperature: number;
   trend: string;
+  horizons?: number[];
+  forecasts?: Partial<Record<"temperature" | "battery_health", FieldForecast>>;
 }
 
 export enum UsageTrend {
@@ -7,13 +7,45 @@ import { getSocketUrl } from "./api";
  * Follows Clean Architecture: separates transport layer from business logic
  */
 
-export type TelemetryUpdateCallback = (
-  data: Partial<ProductTwin> & { _id: string },
-) => void;
+export type TelemetryUpdate = Partial<ProductTwin> & { _id: string };
+
+/**
+ * Receives a batch of per-twin updates; each update only carries the
+ * fields that changed since the previous batch for that twin.
+ */
+export type TelemetryUpdateCallback = (updates: TelemetryUpdate[]) => void;
+
+/**
+ * Raised by the server as soon as a reading deviates from the device's
+ * running statistics.
+ */
+export interface AnomalyAlert {
+  _id: string;
+  serial_number: string;
+  field: string;
+  timestamp: string;
+  value: number;
+  expected: number;
+  z_score: number;
+  type: "High" | "Low";
+}
+
+export type AnomalyAlertCallback = (alert: AnomalyAlert) => void;
+
+/**
+ * Narrows the telemetry stream to specific twins, regions, or fleet
+ * summaries. An empty subscription receives the whole fleet.
+ */
+export interface TelemetrySubscription {
+  serials?: string[];
+  regions?: string[];
+  fleet_summary?: boolean;
+}
 
 export class SocketService {
   private socket: Socket | null = null;
   private telemetryCallbacks: TelemetryUpdateCallback[] = [];
+  private anomalyCallbacks: AnomalyAlertCallback[] = [];
 
   /**
    * Initialize and connect to the Socket.IO server
@@ -36,13 +68,35 @@ export class SocketService {
       console.log("Disconnected from Real-time Twin Stream");
     });
 
-    this.socket.on("telemetry_update", (data) => {
-      this.telemetryCallbacks.forEach((callback) => {
-        callback(data);
+    this.socket.on("telemetry_batch", (updates: TelemetryUpdate[]) => {
+      this.emitTelemetry(updates);
+    });
+
+    // Single-update event kept for compatibility with older servers
+    this.socket.on("telemetry_update", (data: TelemetryUpdate) => {
+      this.emitTelemetry([data]);
+    });
+
+    this.socket.on("anomaly_alert", (alert: AnomalyAlert) => {
+      this.anomalyCallbacks.forEach((callback) => {
+        callback(alert);
       });
     });
   }
 
+  private emitTelemetry(updates: TelemetryUpdate[]): void {
+    this.telemetryCallbacks.forEach((callback) => {
+      callback(updates);
+    });
+  }
+
+  /**
+   * Replace the current subscription (defaults to the whole fleet)
+   */
+  subscribe(subscription: TelemetrySubscription = {}): void {
+    this.socket?.emit("subscribe", subscription);
+  }
+
   /**
    * Register a callback for telemetry updates
    */
@@ -61,6 +115,24 @@ export class SocketService {
     );
   }
 
+  /**
+   * Register a callback for real-time anomaly alerts
+   */
+  onAnomalyAlert(callback: AnomalyAlertCallback): void {
+    if (!this.anomalyCallbacks.includes(callback)) {
+      this.anomalyCallbacks.push(callback);
+    }
+  }
+
+  /**
+   * Unregister a callback for anomaly alerts
+   */
+  offAnomalyAlert(callback: AnomalyAlertCallback): void {
+    this.anomalyCallbacks = this.anomalyCallbacks.filter(
+      (cb) => cb !== callback,
+    );
+  }
+
   /**
    * Disconnect from the Socket.IO server
    */
@@ -69,6 +141,7 @@ export class SocketService {
       this.socket.disconnect();
       this.socket = null;
       this.telemetryCallbacks = [];
+      this.anomalyCallbacks = [];
     }
   }
 
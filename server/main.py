@@ -1,4 +1,5 @@
 import asyncio
+import os
 
 import socketio
 import uvicorn
@@ -9,7 +10,11 @@ from database import client
 from routes import analytics, sales, twin_routes
 from services.analytics_scheduler import analytics_scheduler_loop
 from services.analytics_worker import AnalyticsWorker
-from services.rabbitmq import _connection, consume_telemetry
+from services.device_models import device_models
+from services.indexes import ensure_indexes
+from services.rabbitmq import SIM_SHARDS, _connection, consume_telemetry
+from services.retention import retention_loop
+from services.twin_index import twin_index
 from simulation.device_sim import run_simulation
 from sio_instance import sio
 
@@ -23,27 +28,53 @@ app = socketio.ASGIApp(sio, api)
 
 _background_tasks = set()
 
+# "embedded" runs the simulator inside the API process, "external" expects the
+# standalone sharded simulator (python -m simulation) to be running instead
+SIMULATOR_MODE = os.getenv("SIMULATOR_MODE", "embedded")
+
 
 @api.on_event("startup")
 async def startup_event():
     print("⚡ PokeCake API with Socket.IO initialized ⚡")
+    try:
+        await ensure_indexes()
+    except Exception as e:
+        print(f"Index bootstrap failed: {e}")
+    try:
+        await twin_index.warm()
+    except Exception as e:
+        # The index falls back to database lookups until it is populated
+        print(f"Twin index warm-up failed: {e}")
+    try:
+        await device_models.load()
+    except Exception as e:
+        # Models rebuild from incoming telemetry if they cannot be restored
+        print(f"Device model restore failed: {e}")
+
     telemetry_task = asyncio.create_task(consume_telemetry(sio))
-    simulation_task = asyncio.create_task(run_simulation())
 
     # Analytics Tasks
     analytics_worker = AnalyticsWorker()
     worker_task = asyncio.create_task(analytics_worker.run())
     scheduler_task = asyncio.create_task(analytics_scheduler_loop())
+    retention_task = asyncio.create_task(retention_loop())
 
     _background_tasks.add(telemetry_task)
-    _background_tasks.add(simulation_task)
     _background_tasks.add(worker_task)
     _background_tasks.add(scheduler_task)
+    _background_tasks.add(retention_task)
 
     telemetry_task.add_done_callback(_background_tasks.discard)
-    simulation_task.add_done_callback(_background_tasks.discard)
     worker_task.add_done_callback(_background_tasks.discard)
     scheduler_task.add_done_callback(_background_tasks.discard)
+    retention_task.add_done_callback(_background_tasks.discard)
+
+    if SIMULATOR_MODE == "embedded":
+        # One task per shard, so every commands queue has a consumer
+        for shard in range(SIM_SHARDS):
+            simulation_task = asyncio.create_task(run_simulation(shard, SIM_SHARDS))
+            _background_tasks.add(simulation_task)
+            simulation_task.add_done_callback(_background_tasks.discard)
 
 
 @api.on_event("shutdown")
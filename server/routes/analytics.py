@@ -1,4 +1,6 @@
-from fastapi import APIRouter, HTTPException
+from typing import Literal
+
+from fastapi import APIRouter, HTTPException, Query
 
 from services.analytics import (
     detect_anomalies,
@@ -6,16 +8,42 @@ from services.analytics import (
     train_model_and_forecast,
     get_device_analytics,
 )
+from services.analytics_cache import analytics_cache
+from services.anomalies import detect_fleet_anomalies
+from services.forecasting import forecast_fleet
 
 router = APIRouter()
 
 
+@router.post("/fleet/anomalies")
+async def run_fleet_anomalies():
+    """
+    Detect anomalies for every device in one vectorized pass and store them
+    in the device analytics records.
+    """
+    return await detect_fleet_anomalies()
+
+
+@router.post("/fleet/forecasts")
+async def run_fleet_forecasts():
+    """
+    Forecast every device in one batched fit and store the results in the
+    device analytics records.
+    """
+    return await forecast_fleet()
+
+
 @router.get("/{serial_number}/history")
-async def get_history(serial_number: str):
+async def get_history(
+    serial_number: str,
+    resolution: Literal["raw", "minute", "hour", "day"] = "raw",
+    limit: int = Query(default=100, ge=1, le=5000),
+):
     """
     Get historical telemetry data for a device.
+    Coarser resolutions are served from rollups (mean values, plus min/max/last).
     """
-    history = await get_telemetry_history(serial_number)
+    history = await get_telemetry_history(serial_number, limit, resolution)
     if not history:
         raise HTTPException(status_code=404, detail="No history found for this device")
 
@@ -44,11 +72,18 @@ async def get_analytics_overview(serial_number: str):
 
 
 @router.get("/{serial_number}/forecast")
-async def get_forecast(serial_number: str):
+async def get_forecast(serial_number: str, fresh: bool = False):
     """
     Get AI-driven forecast for the device.
+    Served from the analytics cache until new telemetry arrives;
+    `fresh=true` forces a recompute.
     """
-    prediction = await train_model_and_forecast(serial_number)
+    prediction = await analytics_cache.get_or_compute(
+        "forecast",
+        serial_number,
+        lambda: train_model_and_forecast(serial_number),
+        fresh=fresh,
+    )
     if "error" in prediction:
         # Instead of 400, return null/empty so UI handles gracefully
         return None 
@@ -56,9 +91,16 @@ async def get_forecast(serial_number: str):
 
 
 @router.get("/{serial_number}/anomalies")
-async def get_anomalies(serial_number: str):
+async def get_anomalies(serial_number: str, fresh: bool = False):
     """
     Get detected anomalies in recent data.
+    Served from the analytics cache until new telemetry arrives;
+    `fresh=true` forces a recompute.
     """
-    anomalies = await detect_anomalies(serial_number)
+    anomalies = await analytics_cache.get_or_compute(
+        "anomalies",
+        serial_number,
+        lambda: detect_anomalies(serial_number),
+        fresh=fresh,
+    )
     return anomalies
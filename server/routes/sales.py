@@ -8,6 +8,7 @@ from services.sales import (
     get_sales_summary,
     update_sale_record,
 )
+from services.twin_index import twin_index
 
 router = APIRouter()
 
@@ -26,7 +27,9 @@ async def record_sale(sale: SaleRecordCreate):
     Record a new sale for a device twin.
     Each call creates a separate record — one twin can have multiple sale records.
     """
-    return await create_sale_record(sale.model_dump())
+    record = await create_sale_record(sale.model_dump())
+    await twin_index.refresh_region(record["serial_number"])
+    return record
 
 
 @router.get("/{serial_number}")
@@ -46,6 +49,7 @@ async def update_sale(serial_number: str, sale_id: str, sale: SaleRecordCreate):
     record = await update_sale_record(sale_id, sale.model_dump())
     if not record:
         raise HTTPException(status_code=404, detail="Sale record not found")
+    await twin_index.refresh_region(record["serial_number"])
     return record
 
 
@@ -57,3 +61,4 @@ async def delete_sale(serial_number: str, sale_id: str):
     deleted = await delete_sale_record(sale_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Sale record not found")
+    await twin_index.refresh_region(serial_number)
@@ -3,10 +3,16 @@ from typing import List
 
 from bson import ObjectId
 from fastapi import APIRouter, Depends, HTTPException, status
+from pymongo.errors import DuplicateKeyError
 
 from database import get_database
 from models.twin_models import ProductTwin, ProductTwinCreate, ProductTwinUpdate
-from services.rabbitmq import publish_command
+from services.analytics_cache import analytics_cache
+from services.analytics_scheduler import analytics_scheduler
+from services.device_models import device_models
+from services.rabbitmq import forget_device, publish_command
+from services.telemetry_buffer import telemetry_buffers
+from services.twin_index import twin_index
 
 router = APIRouter()
 
@@ -14,7 +20,13 @@ router = APIRouter()
 @router.post("/twins", response_model=ProductTwin, status_code=status.HTTP_201_CREATED)
 async def create_twin(twin: ProductTwinCreate, db=Depends(get_database)):
     twin_dict = twin.model_dump()
-    result = await db.twins.insert_one(twin_dict)
+    try:
+        result = await db.twins.insert_one(twin_dict)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=409, detail="A twin with this serial number already exists"
+        )
+    twin_index.add(twin_dict["serial_number"], result.inserted_id)
     created_twin = await db.twins.find_one({"_id": result.inserted_id})
     created_twin["_id"] = str(created_twin["_id"])
     return created_twin
@@ -81,9 +93,17 @@ async def delete_twin(twin_id: str, db=Depends(get_database)):
     if not ObjectId.is_valid(twin_id):
         raise HTTPException(status_code=400, detail="Invalid ID format")
 
-    result = await db.twins.delete_one({"_id": ObjectId(twin_id)})
-    if result.deleted_count == 0:
+    deleted = await db.twins.find_one_and_delete(
+        {"_id": ObjectId(twin_id)}, {"serial_number": 1}
+    )
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Twin not found")
+    twin_index.discard(deleted["serial_number"])
+    telemetry_buffers.discard(deleted["serial_number"])
+    device_models.discard(deleted["serial_number"])
+    analytics_scheduler.discard(deleted["serial_number"])
+    analytics_cache.invalidate([deleted["serial_number"]])
+    forget_device(deleted["serial_number"], twin_id)
     return None
 
 
@@ -1,8 +1,9 @@
-import pandas as pd
-from sklearn.linear_model import LinearRegression
-
 from database import db
-
+from services.anomalies import detect_device_anomalies
+from services.device_models import device_models
+from services.forecasting import forecast_device
+from services.rollups import ROLLUP_TIERS, read_rollups
+from services.telemetry_buffer import telemetry_buffers
 
 
 async def get_device_analytics(serial_number: str):
@@ -19,90 +20,34 @@ async def get_device_analytics(serial_number: str):
     return analytics
 
 
-async def get_telemetry_history(serial_number: str, limit: int = 100):
+async def get_telemetry_history(
+    serial_number: str, limit: int = 100, resolution: str = "raw"
+):
     """
     Retrieve historical telemetry data for a specific twin.
+    "raw" returns individual readings; "minute", "hour" and "day" return
+    pre-aggregated rollups so long ranges stay cheap.
+    Recent raw readings are served from the in-memory ring buffer.
     """
-    cursor = (
-        db.telemetry_history.find({"serial_number": serial_number})
-        .sort("last_synced", -1)
-        .limit(limit)
-    )
-    history = await cursor.to_list(length=limit)
-    # Reverse to have chronological order for plotting
-    return history[::-1]
+    if resolution in ROLLUP_TIERS:
+        return await read_rollups(serial_number, resolution, limit)
+    return await telemetry_buffers.recent(serial_number, limit)
 
 
 async def train_model_and_forecast(serial_number: str):
     """
-    Fetch history, train a simple linear regression model, and forecast the next value.
+    Forecast temperature and battery at several horizons from the device's
+    incremental model; devices without a warm model get a least-squares fit
+    over their recent readings instead.
     """
-    # Fetch data (more data points for training)
-    data = await get_telemetry_history(serial_number, limit=50)
-
-    if len(data) < 10:
-        return {"error": "Not enough data to forecast"}
-
-    df = pd.DataFrame(data)
-
-    # Preprocessing
-    # Convert timestamp to ordinal for regression
-    df["time_ordinal"] = pd.to_datetime(df["last_synced"]).map(pd.Timestamp.toordinal)
-
-    # We will predict 'temperature'
-    if "temperature" not in df.columns:
-        return {"error": "Temperature data missing"}
-
-    X = df[["time_ordinal"]].values
-    y = df["temperature"].values
-
-    model = LinearRegression()
-    model.fit(X, y)
-
-    # Predict next step (e.g., next timestamp)
-    # Just adding a small increment to the last time ordinal for simulation
-    next_time_ordinal = X[-1][0] + 1
-    prediction = model.predict([[next_time_ordinal]])
-
-    return {
-        "current_temperature": float(y[-1]),
-        "forecast_temperature": float(prediction[0]),
-        "trend": "increasing" if prediction[0] > y[-1] else "decreasing",
-    }
+    forecast = device_models.forecast(serial_number)
+    if "error" not in forecast:
+        return forecast
+    return await forecast_device(serial_number)
 
 
 async def detect_anomalies(serial_number: str):
     """
-    Simple Z-score based anomaly detection for temperature.
+    Z-score based anomaly detection for temperature over recent readings.
     """
-    data = await get_telemetry_history(serial_number, limit=50)
-
-    if len(data) < 10:
-        return []
-
-    df = pd.DataFrame(data)
-
-    if "temperature" not in df.columns:
-        return []
-
-    mean_temp = df["temperature"].mean()
-    std_temp = df["temperature"].std()
-
-    anomalies = []
-
-    if std_temp == 0:
-        return anomalies
-
-    for index, row in df.iterrows():
-        z_score = (row["temperature"] - mean_temp) / std_temp
-        if abs(z_score) > 2:  # Threshold of 2 standard deviations
-            anomalies.append(
-                {
-                    "timestamp": row["last_synced"],
-                    "temperature": row["temperature"],
-                    "z_score": float(z_score),
-                    "type": "High Temp" if z_score > 0 else "Low Temp",
-                }
-            )
-
-    return anomalies
+    return await detect_device_anomalies(serial_number)
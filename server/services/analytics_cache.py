@@ -0,0 +1,84 @@
+import os
+import time
+from collections import OrderedDict
+
+# Results are reused until new telemetry arrives, at most this long
+ANALYTICS_CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL", "30"))
+ANALYTICS_CACHE_SIZE = int(os.getenv("ANALYTICS_CACHE_SIZE", "10000"))
+
+
+class AnalyticsCache:
+    """
+    In-process TTL/LRU cache of per-device analytics results, keyed by
+    (kind, serial_number). The telemetry ingestor invalidates a device's
+    entries when new readings arrive, so dashboard polling between readings
+    is served without recomputing.
+    """
+
+    def __init__(
+        self,
+        ttl: float = ANALYTICS_CACHE_TTL,
+        max_size: int = ANALYTICS_CACHE_SIZE,
+        clock=time.monotonic,
+    ):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        # (kind, serial_number) -> (expires_at, value)
+        self._entries: OrderedDict[tuple[str, str], tuple[float, object]] = (
+            OrderedDict()
+        )
+        self._kinds: set[str] = set()
+        # Bumped on invalidation, so a computation that raced with new
+        # telemetry doesn't store its now-stale result
+        self._generations: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, kind: str, serial_number: str):
+        entry = self._entries.get((kind, serial_number))
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if self.clock() >= expires_at:
+            del self._entries[(kind, serial_number)]
+            return None
+        self._entries.move_to_end((kind, serial_number))
+        return value
+
+    def put(self, kind: str, serial_number: str, value, generation: int | None = None):
+        if generation is not None and generation != self._generations.get(
+            serial_number, 0
+        ):
+            return
+        self._kinds.add(kind)
+        self._entries[(kind, serial_number)] = (self.clock() + self.ttl, value)
+        self._entries.move_to_end((kind, serial_number))
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(
+        self, kind: str, serial_number: str, compute, fresh: bool = False
+    ):
+        """Cached result, or `await compute()` stored for later requests."""
+        if not fresh:
+            value = self.get(kind, serial_number)
+            if value is not None:
+                return value
+        generation = self._generations.get(serial_number, 0)
+        value = await compute()
+        self.put(kind, serial_number, value, generation)
+        return value
+
+    def invalidate(self, serial_numbers):
+        """Drops the cached results of devices with new telemetry."""
+        for serial_number in serial_numbers:
+            self._generations[serial_number] = (
+                self._generations.get(serial_number, 0) + 1
+            )
+            for kind in self._kinds:
+                self._entries.pop((kind, serial_number), None)
+
+
+analytics_cache = AnalyticsCache()
@@ -1,28 +1,152 @@
 import asyncio
+import os
+import time
+
 from database import db
-from services.rabbitmq import publish_analytics_job
 
-async def analytics_scheduler_loop():
+SCHEDULER_TICK = float(os.getenv("ANALYTICS_SCHEDULER_TICK", "5"))
+# Per-device analysis interval: starts at the base, shrinks to the minimum for
+# unhealthy or anomalous devices and doubles up to the maximum while quiet
+ANALYTICS_INTERVAL = float(os.getenv("ANALYTICS_INTERVAL", "60"))
+ANALYTICS_MIN_INTERVAL = float(os.getenv("ANALYTICS_MIN_INTERVAL", "15"))
+ANALYTICS_MAX_INTERVAL = float(os.getenv("ANALYTICS_MAX_INTERVAL", "600"))
+# A job not completed within this long is assumed lost and may be re-sent
+PENDING_TIMEOUT = float(os.getenv("ANALYTICS_PENDING_TIMEOUT", "600"))
+# Serials per job message
+ANALYTICS_JOB_BATCH = int(os.getenv("ANALYTICS_JOB_BATCH", "100"))
+
+
+class AnalyticsScheduler:
     """
-    Periodically fetches all active devices and queues them for analysis.
+    Change-driven analytics scheduling. The telemetry ingestor marks devices
+    dirty; every tick the scheduler enqueues dirty devices whose interval has
+    elapsed and that have no job pending, in batched job messages. The worker
+    reports each result back, which clears the pending job and adapts the
+    device's interval to its health.
     """
-    print("⏰ Starting Analytics Scheduler (Interval: 60s)...")
-    
-    try:
+
+    def __init__(self, tick: float = SCHEDULER_TICK, clock=time.monotonic):
+        self.tick = tick
+        self.clock = clock
+        self._dirty: set[str] = set()
+        # serial_number -> when its job was enqueued
+        self._pending: dict[str, float] = {}
+        # serial_number -> (next due time, current interval)
+        self._schedule: dict[str, tuple[float, float]] = {}
+
+    def mark_dirty(self, serial_numbers):
+        """Records devices with new telemetry since their last analysis."""
+        self._dirty.update(serial_numbers)
+
+    def due(self) -> list[str]:
+        """Takes the dirty devices that should be analysed now."""
+        now = self.clock()
+        for serial_number, enqueued_at in list(self._pending.items()):
+            if now - enqueued_at > PENDING_TIMEOUT:
+                del self._pending[serial_number]
+
+        due = []
+        for serial_number in self._dirty:
+            if serial_number in self._pending:
+                continue
+            next_due, _ = self._schedule.get(serial_number, (0.0, 0.0))
+            if now >= next_due:
+                due.append(serial_number)
+
+        for serial_number in due:
+            self._dirty.discard(serial_number)
+            self._pending[serial_number] = now
+        return due
+
+    def complete(self, serial_number: str, record: dict):
+        """Clears the pending job and schedules the next analysis."""
+        self._pending.pop(serial_number, None)
+        _, interval = self._schedule.get(serial_number, (0.0, 0.0))
+
+        if record.get("anomalies") or record.get("health_score", 100) < 50:
+            interval = ANALYTICS_MIN_INTERVAL
+        elif (
+            record.get("health_score", 100) >= 80
+            and record.get("usage_trend") == "stable"
+            and interval
+        ):
+            interval = min(ANALYTICS_MAX_INTERVAL, interval * 2)
+        else:
+            interval = ANALYTICS_INTERVAL
+
+        self._schedule[serial_number] = (self.clock() + interval, interval)
+
+    def fail(self, serial_number: str):
+        """Gives up on a dropped job; the device is retried after the base interval."""
+        self._pending.pop(serial_number, None)
+        self._schedule[serial_number] = (
+            self.clock() + ANALYTICS_INTERVAL,
+            ANALYTICS_INTERVAL,
+        )
+        self._dirty.add(serial_number)
+
+    def discard(self, serial_number: str):
+        self._dirty.discard(serial_number)
+        self._pending.pop(serial_number, None)
+        self._schedule.pop(serial_number, None)
+
+    async def seed(self):
+        """
+        Marks devices whose latest telemetry is newer than their last
+        analysis, so a restart picks up where the previous run stopped.
+        """
+        analyzed = {
+            doc["serial_number"]: doc.get("last_analyzed")
+            async for doc in db.device_analytics.find(
+                {}, {"serial_number": 1, "last_analyzed": 1}
+            )
+        }
+        async for twin in db.twins.find(
+            {"last_synced": {"$exists": True}}, {"serial_number": 1, "last_synced": 1}
+        ):
+            last_analyzed = analyzed.get(twin["serial_number"])
+            if last_analyzed is None or twin["last_synced"] > last_analyzed:
+                self._dirty.add(twin["serial_number"])
+
+    async def publish_due(self) -> int:
+        # Imported here: the rabbitmq module pulls in the ingestor, which
+        # reports into this scheduler
+        from services.rabbitmq import publish_analytics_jobs
+
+        due = self.due()
+        for i in range(0, len(due), ANALYTICS_JOB_BATCH):
+            batch = due[i : i + ANALYTICS_JOB_BATCH]
+            if not await publish_analytics_jobs(batch):
+                # Not enqueued: retry these devices on the next tick
+                for serial_number in batch:
+                    self._pending.pop(serial_number, None)
+                self._dirty.update(batch)
+        return len(due)
+
+    async def run(self):
+        print(f"⏰ Starting Analytics Scheduler (tick: {self.tick}s)...")
+        try:
+            await self.seed()
+        except Exception as e:
+            print(f"Analytics Scheduler seed failed: {e}")
+
         while True:
-            # 1. Get all active serial numbers
-            cursor = db.twins.find({}, {"serial_number": 1})
-            serials = [doc["serial_number"] async for doc in cursor]
-
-            if serials:
-                # print(f"Queueing analysis for {len(serials)} devices...")
-                for serial in serials:
-                    await publish_analytics_job(serial)
-            
-            # Wait for next cycle (e.g., every 60 seconds)
-            await asyncio.sleep(60)
+            try:
+                await self.publish_due()
+            except Exception as e:
+                print(f"Analytics Scheduler Error: {e}")
+            await asyncio.sleep(self.tick)
+
 
+analytics_scheduler = AnalyticsScheduler()
+
+
+async def analytics_scheduler_loop():
+    """
+    Queues devices with new telemetry for analysis, at most one pending job
+    per device and no more often than the device's adaptive interval.
+    """
+    try:
+        await analytics_scheduler.run()
     except asyncio.CancelledError:
         print("Analytics scheduler stopped.")
-    except Exception as e:
-        print(f"Analytics Scheduler Error: {e}")
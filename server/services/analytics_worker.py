@@ -1,104 +1,314 @@
 import asyncio
 import json
 import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
 from datetime import datetime
 
 import aio_pika
+import numpy as np
+from pymongo import UpdateOne
 
 from database import db
-from services.analytics import detect_anomalies, train_model_and_forecast
+from services.analytics_scheduler import analytics_scheduler
+from services.anomalies import ANOMALY_WINDOW, zscore_anomalies
+from services.device_models import device_models
+from services.forecasting import FORECAST_FIELDS, FORECAST_WINDOW, forecast_windows
 from services.rabbitmq import ANALYTICS_QUEUE, get_rabbitmq
-from services.sales import get_sales_by_serial
+from services.telemetry_buffer import stack_windows, telemetry_buffers
 
 logger = logging.getLogger(__name__)
 
+# Jobs analysed together; a partial batch is processed after ANALYTICS_BATCH_WAIT
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "100"))
+ANALYTICS_BATCH_WAIT = float(os.getenv("ANALYTICS_BATCH_WAIT", "1.0"))
+# Batches in flight at once
+ANALYTICS_CONCURRENCY = int(os.getenv("ANALYTICS_CONCURRENCY", "2"))
+# Worker processes for the numeric work (0 = a thread in this process)
+ANALYTICS_PROCESSES = int(
+    os.getenv("ANALYTICS_PROCESSES", str(min(4, os.cpu_count() or 1)))
+)
+
+
+def analyze_windows(
+    t: np.ndarray, values: dict[str, np.ndarray], forecast_rows: list[int]
+) -> tuple[list[list[dict]], list[dict]]:
+    """
+    CPU-bound part of a batch: anomalies for stacked windows, and forecasts
+    for the `forecast_rows` among them. Pure NumPy on picklable arrays, so it
+    runs in a worker process.
+    """
+    anomalies = zscore_anomalies(
+        t[:, -ANOMALY_WINDOW:], values["temperature"][:, -ANOMALY_WINDOW:]
+    )
+    if not forecast_rows:
+        return anomalies, []
+    rows = np.asarray(forecast_rows)
+    forecasts = forecast_windows(
+        t[rows, -FORECAST_WINDOW:],
+        {field: v[rows, -FORECAST_WINDOW:] for field, v in values.items()},
+    )
+    return anomalies, forecasts
+
 
 class AnalyticsWorker:
-    def __init__(self):
+    """
+    Consumes analytics jobs in batches. Each batch gathers its devices' recent
+    telemetry from the ring buffers, runs the numeric work in a process pool,
+    loads twins and sales with one query each and writes every result with a
+    single bulk_write; messages are acked once that write succeeded. A failed
+    batch is retried device by device; jobs whose devices still fail are
+    requeued once and then dropped.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = ANALYTICS_BATCH_SIZE,
+        batch_wait: float = ANALYTICS_BATCH_WAIT,
+        concurrency: int = ANALYTICS_CONCURRENCY,
+        processes: int = ANALYTICS_PROCESSES,
+    ):
         self.running = False
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.concurrency = max(1, concurrency)
+        self.processes = processes
+        self._executor: Executor | None = None
+        self._messages: asyncio.Queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._inflight = set()
 
-    async def process_job(self, message: aio_pika.IncomingMessage):
-        async with message.process():
-            try:
-                data = json.loads(message.body)
-                serial_number = data.get("serial_number")
-
-                if not serial_number:
-                    return
-
-                # 1. Run telemetry analysis
-                anomalies = await detect_anomalies(serial_number)
-                forecast = await train_model_and_forecast(serial_number)
-
-                # 2. Calculate Health Score
-                twin = await db.twins.find_one({"serial_number": serial_number})
-                battery_health = twin.get("battery_health", 100) if twin else 100
-                health_score = max(0, min(100, battery_health - len(anomalies) * 5))
-
-                # 3. Determine Usage Trend
-                trend = (
-                    forecast.get("trend", "stable")
-                    if forecast and "trend" in forecast
-                    else "stable"
-                )
+    def _get_executor(self) -> Executor | None:
+        if self._executor is None and self.processes > 0:
+            # Spawned workers don't inherit the event loop or driver threads
+            self._executor = ProcessPoolExecutor(
+                self.processes, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
 
-                # 4. Join SaleRecords to derive financial risk metrics
-                # A twin may have multiple sale records; we aggregate across all of them.
-                now = datetime.utcnow()
-                sales = await get_sales_by_serial(serial_number)
-                if sales:
-                    # Most recent sale drives warranty / time-based risk
-                    most_recent = sales[0]
-                    days_since_sale = (now - most_recent["sold_at"]).days
-                    return_risk_flag = health_score < 40 and days_since_sale < 365
-                    # Revenue at risk is the sum across ALL sale records for this twin
-                    total_revenue = sum(s["price_usd"] for s in sales)
-                    revenue_at_risk = round(total_revenue * (1 - health_score / 100), 2)
-                else:
-                    days_since_sale = None
-                    revenue_at_risk = None
-                    return_risk_flag = None
-
-                # 5. Persist enriched analytics record
-                analytics_record = {
-                    "serial_number": serial_number,
-                    "last_analyzed": now,
-                    "health_score": int(health_score),
-                    "predicted_failure_date": None,
-                    "anomalies": anomalies,
-                    "usage_trend": trend,
-                    "revenue_at_risk": revenue_at_risk,
-                    "return_risk_flag": return_risk_flag,
-                    "days_since_sale": days_since_sale,
+    async def _analyze(self, serials: list[str]):
+        window = max(ANOMALY_WINDOW, FORECAST_WINDOW)
+        windows = await telemetry_buffers.windows(serials, window)
+        t, values = stack_windows(windows, window, FORECAST_FIELDS)
+
+        # The incremental model is fresher than a window refit, so only
+        # devices without a warm model are fitted in the pool
+        forecasts = [device_models.forecast(s) for s in serials]
+        cold = [row for row, forecast in enumerate(forecasts) if "error" in forecast]
+
+        loop = asyncio.get_running_loop()
+        anomalies, fitted = await loop.run_in_executor(
+            self._get_executor(), analyze_windows, t, values, cold
+        )
+        for row, forecast in zip(cold, fitted):
+            forecasts[row] = forecast
+        return anomalies, forecasts
+
+    async def _load_context(self, serials: list[str]):
+        """Battery levels and sales totals for the batch, one query each."""
+        batteries = {
+            doc["serial_number"]: doc.get("battery_health", 100)
+            async for doc in db.twins.find(
+                {"serial_number": {"$in": serials}},
+                {"serial_number": 1, "battery_health": 1},
+            )
+        }
+        sales_pipeline = [
+            {"$match": {"serial_number": {"$in": serials}}},
+            {"$sort": {"sold_at": -1}},
+            {
+                "$group": {
+                    "_id": "$serial_number",
+                    "sold_at": {"$first": "$sold_at"},
+                    "total_revenue": {"$sum": "$price_usd"},
                 }
+            },
+        ]
+        sales = {
+            doc["_id"]: doc async for doc in db.sale_records.aggregate(sales_pipeline)
+        }
+        return batteries, sales
 
-                await db.device_analytics.update_one(
-                    {"serial_number": serial_number},
-                    {"$set": analytics_record},
+    async def _process(self, serials: list[str]) -> list[dict]:
+        """Analyses devices and stores their records; raises on failure."""
+        anomalies, forecasts = await self._analyze(serials)
+        batteries, sales = await self._load_context(serials)
+        now = datetime.utcnow()
+
+        records = [
+            self._build_record(
+                serial_number,
+                found,
+                forecast,
+                batteries.get(serial_number, 100),
+                sales.get(serial_number),
+                now,
+            )
+            for serial_number, found, forecast in zip(serials, anomalies, forecasts)
+        ]
+        await db.device_analytics.bulk_write(
+            [
+                UpdateOne(
+                    {"serial_number": record["serial_number"]},
+                    {"$set": record},
                     upsert=True,
                 )
+                for record in records
+            ],
+            ordered=False,
+        )
+        return records
+
+    async def process_batch(self, messages: list[aio_pika.IncomingMessage]):
+        jobs = []
+        for message in messages:
+            try:
+                payload = json.loads(message.body)
+                # Batched jobs list many devices, legacy jobs a single one
+                job_serials = payload.get("serial_numbers") or [
+                    payload.get("serial_number")
+                ]
+            except Exception:
+                job_serials = []
+            jobs.append([s for s in job_serials if s])
+        # Insertion-ordered set: duplicate jobs for a device collapse into one
+        serials = list(dict.fromkeys(s for job in jobs for s in job))
 
+        failed = set()
+        records = []
+        if serials:
+            try:
+                records = await self._process(serials)
             except Exception as e:
-                logger.error(f"Error processing analytics job: {e}")
+                logger.error(f"Error processing analytics batch: {e}")
+                # Device by device, so one bad device doesn't fail the rest
+                for serial_number in serials:
+                    try:
+                        records.extend(await self._process([serial_number]))
+                    except Exception as e:
+                        logger.error(f"Error analysing {serial_number}: {e}")
+                        failed.add(serial_number)
+        for record in records:
+            analytics_scheduler.complete(record["serial_number"], record)
+
+        for message, job in zip(messages, jobs):
+            job_failed = failed.intersection(job)
+            try:
+                if not job_failed:
+                    await message.ack()
+                elif not message.redelivered:
+                    await message.nack(requeue=True)
+                else:
+                    # Failed twice: a persistent error, don't retry forever
+                    logger.error(f"Dropping analytics job for {sorted(job_failed)}")
+                    await message.reject(requeue=False)
+                    for serial_number in job_failed:
+                        analytics_scheduler.fail(serial_number)
+            except Exception as e:
+                # The channel went away; the broker redelivers the job
+                logger.error(f"Error settling analytics job: {e}")
+
+    @staticmethod
+    def _build_record(
+        serial_number: str,
+        anomalies: list[dict],
+        forecast: dict,
+        battery_health: float,
+        sale: dict | None,
+        now: datetime,
+    ) -> dict:
+        # 1. Calculate Health Score
+        health_score = max(0, min(100, battery_health - len(anomalies) * 5))
+
+        # 2. Determine Usage Trend
+        trend = forecast.get("trend", "stable") if forecast else "stable"
+
+        # 3. Join SaleRecords to derive financial risk metrics
+        # A twin may have multiple sale records; totals span all of them.
+        if sale:
+            # Most recent sale drives warranty / time-based risk
+            days_since_sale = (now - sale["sold_at"]).days
+            return_risk_flag = health_score < 40 and days_since_sale < 365
+            revenue_at_risk = round(sale["total_revenue"] * (1 - health_score / 100), 2)
+        else:
+            days_since_sale = None
+            revenue_at_risk = None
+            return_risk_flag = None
+
+        return {
+            "serial_number": serial_number,
+            "last_analyzed": now,
+            "health_score": int(health_score),
+            "predicted_failure_date": None,
+            "anomalies": anomalies,
+            "usage_trend": trend,
+            "revenue_at_risk": revenue_at_risk,
+            "return_risk_flag": return_risk_flag,
+            "days_since_sale": days_since_sale,
+        }
+
+    async def _next_batch(self) -> list[aio_pika.IncomingMessage]:
+        """Waits for a job, then gathers more until full or the wait elapses."""
+        batch = [await self._messages.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._messages.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run_batch(self, batch):
+        try:
+            await self.process_batch(batch)
+        finally:
+            self._slots.release()
+
+    async def _dispatch(self):
+        """Starts batches as long as fewer than `concurrency` are running."""
+        while True:
+            batch = await self._next_batch()
+            await self._slots.acquire()
+            task = asyncio.create_task(self._run_batch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
 
     async def run(self):
-        print("🧠 Starting Analytics Worker...")
+        print(
+            f"🧠 Starting Analytics Worker (batch {self.batch_size}, "
+            f"concurrency {self.concurrency}, processes {self.processes})..."
+        )
         self.running = True
+        dispatch_task = asyncio.create_task(self._dispatch())
 
-        while self.running:
-            try:
-                _, channel = await get_rabbitmq()
-                await channel.set_qos(prefetch_count=1)
+        try:
+            while self.running:
+                try:
+                    connection, _ = await get_rabbitmq()
+                    # Dedicated channel: its prefetch covers every batch in flight
+                    channel = await connection.channel()
+                    await channel.set_qos(
+                        prefetch_count=self.batch_size * self.concurrency
+                    )
 
-                queue = await channel.declare_queue(ANALYTICS_QUEUE, durable=True)
+                    queue = await channel.declare_queue(ANALYTICS_QUEUE, durable=True)
 
-                async with queue.iterator() as queue_iter:
-                    async for message in queue_iter:
-                        await self.process_job(message)
+                    async with queue.iterator() as queue_iter:
+                        async for message in queue_iter:
+                            await self._messages.put(message)
 
-            except asyncio.CancelledError:
-                print("Analytics worker cancelled.")
-                break
-            except Exception as e:
-                print(f"Analytics Worker Connection Error: {e}. Retrying in 5s...")
-                await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    print("Analytics worker cancelled.")
+                    break
+                except Exception as e:
+                    print(f"Analytics Worker Connection Error: {e}. Retrying in 5s...")
+                    await asyncio.sleep(5)
+        finally:
+            dispatch_task.cancel()
+            if self._executor:
+                self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,100 @@
+import os
+from datetime import datetime
+
+import numpy as np
+from pymongo import UpdateOne
+
+from database import db
+from services.telemetry_buffer import stack_windows, telemetry_buffers
+
+ANOMALY_WINDOW = int(os.getenv("ANOMALY_WINDOW", "50"))
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "2"))
+# Windows with fewer temperature readings are not scored
+ANOMALY_MIN_POINTS = 10
+
+
+def zscore_anomalies(
+    t: np.ndarray, values: np.ndarray, threshold: float = ANOMALY_Z_THRESHOLD
+) -> list[list[dict]]:
+    """
+    Scores many temperature windows at once. `values` is a (devices, window)
+    matrix padded with NaN and `t` the matching timestamps; returns the
+    anomalies of each row, using the sample standard deviation of the row.
+    """
+    anomalies = [[] for _ in range(len(values))]
+    counts = np.count_nonzero(~np.isnan(values), axis=1)
+    rows = np.flatnonzero(counts >= ANOMALY_MIN_POINTS)
+    if not len(rows):
+        return anomalies
+
+    scored = values[rows]
+    mean = np.nanmean(scored, axis=1, keepdims=True)
+    std = np.nanstd(scored, axis=1, ddof=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = (scored - mean) / std
+    # NaN compares False, which drops padding and flat (std == 0) windows
+    hit_rows, hit_cols = np.nonzero(np.abs(z) > threshold)
+
+    timestamps = t[rows][hit_rows, hit_cols].tolist()
+    temperatures = scored[hit_rows, hit_cols].tolist()
+    z_scores = z[hit_rows, hit_cols].tolist()
+    for row, ts, temperature, z_score in zip(
+        rows[hit_rows].tolist(), timestamps, temperatures, z_scores
+    ):
+        anomalies[row].append(
+            {
+                "timestamp": ts,
+                "temperature": temperature,
+                "z_score": z_score,
+                "type": "High Temp" if z_score > 0 else "Low Temp",
+            }
+        )
+    return anomalies
+
+
+async def detect_device_anomalies(
+    serial_number: str, window: int = ANOMALY_WINDOW
+) -> list[dict]:
+    ring = await telemetry_buffers.ring(serial_number, window)
+    if ring is None or not len(ring):
+        return []
+    t, values = stack_windows([ring.window(window)], window)
+    return zscore_anomalies(t, values["temperature"])[0]
+
+
+async def detect_fleet_anomalies(
+    serial_numbers: list[str] | None = None, window: int = ANOMALY_WINDOW
+) -> dict:
+    """
+    Scores every device in one vectorized pass over the ring buffers (cold
+    devices are loaded with a single aggregation) and stores the results in
+    device_analytics with one bulk write.
+    """
+    if serial_numbers is None:
+        serial_numbers = [
+            doc["serial_number"]
+            async for doc in db.twins.find({}, {"serial_number": 1})
+        ]
+    windows = await telemetry_buffers.windows(serial_numbers, window)
+    t, values = stack_windows(windows, window)
+    anomalies = zscore_anomalies(t, values["temperature"])
+
+    now = datetime.utcnow()
+    updates = [
+        UpdateOne(
+            {"serial_number": serial_number},
+            {"$set": {"anomalies": found, "anomalies_analyzed": now}},
+            upsert=True,
+        )
+        for serial_number, found in zip(serial_numbers, anomalies)
+    ]
+    if updates:
+        await db.device_analytics.bulk_write(updates, ordered=False)
+
+    flagged = {s: found for s, found in zip(serial_numbers, anomalies) if found}
+    return {
+        "analyzed_at": now,
+        "devices": len(serial_numbers),
+        "devices_with_anomalies": len(flagged),
+        "anomalies": flagged,
+    }
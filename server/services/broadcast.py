@@ -0,0 +1,125 @@
+import asyncio
+import os
+from collections import defaultdict
+
+from services.twin_index import twin_index
+from sio_instance import (
+    FLEET_ROOM,
+    SUMMARY_ROOM,
+    region_room,
+    room_members,
+    twin_room,
+)
+
+BROADCAST_HZ = float(os.getenv("BROADCAST_HZ", "4"))
+
+
+class TelemetryBroadcaster:
+    """
+    Coalesces telemetry updates per twin (latest wins) and emits them as one
+    `telemetry_batch` event per frame, carrying only the fields that changed
+    since the last frame sent for that twin.
+    Each frame goes to the fleet room in full, and per twin to the twin and
+    region rooms that currently have subscribers. Clients joining a room get
+    a `snapshot` of its twins first, so they don't miss fields that last
+    changed before they subscribed.
+    """
+
+    def __init__(self, sio, hz: float = BROADCAST_HZ):
+        self.sio = sio
+        self.interval = 1.0 / hz
+
+        # twin_id -> fields received since the last frame
+        self._pending: dict[str, dict] = {}
+        # twin_id -> fields as last broadcast
+        self._sent: dict[str, dict] = {}
+        # twin_id -> serial_number, for room routing
+        self._serials: dict[str, str] = {}
+
+    def publish(self, twin_id: str, serial_number: str, update: dict):
+        self._serials[twin_id] = serial_number
+        self._pending.setdefault(twin_id, {}).update(update)
+
+    def forget(self, twin_id: str):
+        self._pending.pop(twin_id, None)
+        self._sent.pop(twin_id, None)
+        self._serials.pop(twin_id, None)
+
+    def _build_frame(self) -> list[dict]:
+        pending, self._pending = self._pending, {}
+
+        frame = []
+        for twin_id, update in pending.items():
+            sent = self._sent.setdefault(twin_id, {})
+            changed = {k: v for k, v in update.items() if sent.get(k) != v}
+            if not changed:
+                continue
+            sent.update(changed)
+            frame.append({"_id": twin_id, **changed})
+        return frame
+
+    def _route(self, frame: list[dict]) -> dict[str, list[dict]]:
+        """Splits a frame into per-room batches for subscribed rooms only."""
+        rooms = defaultdict(list)
+        if FLEET_ROOM in room_members:
+            rooms[FLEET_ROOM] = frame
+
+        for entry in frame:
+            serial_number = self._serials[entry["_id"]]
+            room = twin_room(serial_number)
+            if room in room_members:
+                rooms[room].append(entry)
+
+            region = twin_index.region(serial_number)
+            if region and region_room(region) in room_members:
+                rooms[region_room(region)].append(entry)
+
+        return rooms
+
+    def snapshot(self, rooms: set[str]) -> list[dict]:
+        """Full latest broadcast state of every twin covered by `rooms`."""
+        entries = []
+        for twin_id, state in self._sent.items():
+            serial_number = self._serials[twin_id]
+            region = twin_index.region(serial_number)
+            if (
+                FLEET_ROOM in rooms
+                or twin_room(serial_number) in rooms
+                or (region and region_room(region) in rooms)
+            ):
+                entries.append({"_id": twin_id, **state})
+        return entries
+
+    def fleet_summary(self) -> dict:
+        """Fleet-wide aggregates over the latest broadcast state of every twin."""
+        states = self._sent.values()
+        summary = {"devices": len(self._sent)}
+        for field in ("cpu_usage", "temperature", "battery_health"):
+            values = [s[field] for s in states if field in s]
+            summary[f"avg_{field}"] = (
+                round(sum(values) / len(values), 1) if values else None
+            )
+        summary["charging"] = sum(1 for s in states if s.get("is_charging"))
+        return summary
+
+    async def flush(self):
+        frame = self._build_frame()
+        if not frame:
+            return
+
+        for room, batch in self._route(frame).items():
+            await self.sio.emit("telemetry_batch", batch, room=room)
+
+        if SUMMARY_ROOM in room_members:
+            await self.sio.emit(
+                "fleet_summary", self.fleet_summary(), room=SUMMARY_ROOM
+            )
+
+    async def run(self):
+        """Emits at most one frame per interval, regardless of device count."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Telemetry broadcast error: {e}")
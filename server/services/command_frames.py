@@ -0,0 +1,63 @@
+import json
+import struct
+from datetime import datetime, timedelta
+
+from services.telemetry_frames import JSON_CONTENT_TYPE, WIRE_FORMAT
+
+COMMAND_CONTENT_TYPE = "application/vnd.twin.command.v1"
+# Actions with a binary code; anything else is sent as JSON
+COMMAND_ACTIONS = ("RUN_DIAGNOSTICS", "SOFTWARE_UPDATE")
+
+# Binary command: version, action code, timestamp (microseconds since epoch)
+# and a length-prefixed target serial
+_BINARY_VERSION = 1
+_BINARY_COMMAND = struct.Struct("<BBq")
+_EPOCH = datetime(1970, 1, 1)
+
+
+def encode_binary(command: dict) -> bytes:
+    """Packs a command into the binary layout. Raises if it does not fit."""
+    if set(command) - {"target_serial", "action", "timestamp"}:
+        raise ValueError("Command has fields without a binary encoding")
+
+    timestamp = datetime.fromisoformat(command["timestamp"])
+    micros = (timestamp - _EPOCH) // timedelta(microseconds=1)
+    serial = command["target_serial"].encode()
+    return (
+        _BINARY_COMMAND.pack(
+            _BINARY_VERSION, COMMAND_ACTIONS.index(command["action"]), micros
+        )
+        + bytes((len(serial),))
+        + serial
+    )
+
+
+def decode_binary(body: bytes) -> dict:
+    version, action, micros = _BINARY_COMMAND.unpack_from(body, 0)
+    if version != _BINARY_VERSION:
+        raise ValueError(f"Unsupported binary command version {version}")
+
+    offset = _BINARY_COMMAND.size
+    length = body[offset]
+    offset += 1
+    return {
+        "target_serial": body[offset : offset + length].decode(),
+        "action": COMMAND_ACTIONS[action],
+        "timestamp": str(_EPOCH + timedelta(microseconds=micros)),
+    }
+
+
+def encode_command(command: dict, wire_format: str = WIRE_FORMAT) -> tuple[bytes, str]:
+    """Encodes a command and returns it with its content-type."""
+    if wire_format == "binary":
+        try:
+            return encode_binary(command), COMMAND_CONTENT_TYPE
+        except (KeyError, TypeError, ValueError, OverflowError, struct.error):
+            pass
+    return json.dumps(command).encode(), JSON_CONTENT_TYPE
+
+
+def decode_command(body: bytes, content_type: str | None = None) -> dict:
+    if content_type == COMMAND_CONTENT_TYPE:
+        return decode_binary(body)
+    return json.loads(body)
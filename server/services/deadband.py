@@ -0,0 +1,62 @@
+import os
+from datetime import datetime, timedelta
+
+# A reading is only persisted when a field moved at least this far since the
+# last persisted reading of the device (0 = any change counts)
+DEADBANDS = {
+    "cpu_usage": float(os.getenv("DEADBAND_CPU_USAGE", "2")),
+    "temperature": float(os.getenv("DEADBAND_TEMPERATURE", "0.2")),
+    "battery_health": float(os.getenv("DEADBAND_BATTERY_HEALTH", "1")),
+}
+# Unchanged devices still persist a reading this often, so they look alive
+DEADBAND_HEARTBEAT_SECONDS = float(os.getenv("DEADBAND_HEARTBEAT_SECONDS", "60"))
+
+# Absorbs float noise such as 31.4 - 31.2 == 0.19999999999999929
+_EPSILON = 1e-9
+
+
+class DeadbandFilter:
+    """
+    Drops near-duplicate readings: a reading passes when any field left its
+    dead-band, the charging state flipped, or the device has been silent for
+    longer than the heartbeat.
+    """
+
+    def __init__(
+        self,
+        deadbands: dict[str, float] = DEADBANDS,
+        heartbeat: float = DEADBAND_HEARTBEAT_SECONDS,
+    ):
+        self.deadbands = deadbands
+        self.heartbeat = timedelta(seconds=heartbeat)
+        # serial_number -> (last persisted reading, persisted at)
+        self._last: dict[str, tuple[dict, datetime]] = {}
+
+    def accept(self, serial_number: str, reading: dict, now: datetime) -> bool:
+        previous = self._last.get(serial_number)
+        if previous is None or self._changed(previous[0], reading):
+            changed = True
+        else:
+            changed = now - previous[1] >= self.heartbeat
+
+        if changed:
+            self._last[serial_number] = (reading, now)
+        return changed
+
+    def _changed(self, previous: dict, reading: dict) -> bool:
+        if previous.get("is_charging") != reading.get("is_charging"):
+            return True
+        for field, band in self.deadbands.items():
+            old, new = previous.get(field), reading.get(field)
+            if old is None or new is None:
+                if old is not new:
+                    return True
+                continue
+            if abs(new - old) + _EPSILON >= band:
+                return True
+        return False
+
+    def forget(self, serial_numbers):
+        """Drops state so the next reading of these devices always passes."""
+        for serial_number in serial_numbers:
+            self._last.pop(serial_number, None)
@@ -0,0 +1,179 @@
+import asyncio
+import math
+import os
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from database import db
+from services.forecasting import (
+    FORECAST_FIELDS,
+    FORECAST_HORIZONS,
+    FORECAST_MIN_POINTS,
+    summarize_forecasts,
+)
+
+# Older readings lose half their weight every MODEL_HALF_LIFE seconds
+MODEL_HALF_LIFE = float(os.getenv("MODEL_HALF_LIFE", "300"))
+MODEL_FLUSH_INTERVAL = float(os.getenv("MODEL_FLUSH_INTERVAL", "30"))
+
+_BOUNDS = {"battery_health": (0.0, 100.0)}
+
+
+class DecayedRegression:
+    """
+    Exponentially decayed sufficient statistics (n, Σx, Σy, Σx², Σxy) of a
+    line fit. x is seconds relative to the latest reading, so each update
+    shifts and decays the sums and adds the new point at x = 0; a fit is a
+    handful of arithmetic operations.
+    """
+
+    __slots__ = ("n", "sx", "sy", "sxx", "sxy", "y_last", "t_last")
+
+    def __init__(self, state: list[float] | None = None, t_last=None):
+        n, sx, sy, sxx, sxy, y_last = state or (0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        self.n, self.sx, self.sy, self.sxx, self.sxy = n, sx, sy, sxx, sxy
+        self.y_last = y_last
+        self.t_last: datetime | None = t_last
+
+    def update(self, t: datetime, y: float, decay_rate: float):
+        if self.t_last is not None:
+            dt = max(0.0, (t - self.t_last).total_seconds())
+            # Re-anchor x on the new reading: x_old -> x_old - dt
+            self.sxx += -2 * dt * self.sx + dt * dt * self.n
+            self.sxy -= dt * self.sy
+            self.sx -= dt * self.n
+            w = math.exp(-decay_rate * dt)
+            self.n *= w
+            self.sx *= w
+            self.sy *= w
+            self.sxx *= w
+            self.sxy *= w
+
+        self.n += 1.0
+        self.sy += y
+        self.y_last = y
+        self.t_last = t
+
+    def fit(self) -> tuple[float, float]:
+        """(slope per second, value at the latest reading)."""
+        denominator = self.n * self.sxx - self.sx * self.sx
+        if self.n <= 0:
+            return 0.0, self.y_last
+        if denominator <= 1e-9:
+            return 0.0, self.sy / self.n
+        slope = (self.n * self.sxy - self.sx * self.sy) / denominator
+        return slope, (self.sy - slope * self.sx) / self.n
+
+    def state(self) -> list[float]:
+        return [self.n, self.sx, self.sy, self.sxx, self.sxy, self.y_last]
+
+
+class DeviceModelStore:
+    """
+    Per-device incremental regression models, updated by the telemetry
+    ingestor and persisted to device_models, so forecasts are O(1) reads
+    instead of fetch-and-refit.
+    """
+
+    def __init__(
+        self,
+        half_life: float = MODEL_HALF_LIFE,
+        flush_interval: float = MODEL_FLUSH_INTERVAL,
+    ):
+        self.decay_rate = math.log(2) / half_life
+        self.flush_interval = flush_interval
+        # serial_number -> field -> model
+        self._models: dict[str, dict[str, DecayedRegression]] = {}
+        self._dirty: set[str] = set()
+
+    def __contains__(self, serial_number: str) -> bool:
+        return serial_number in self._models
+
+    def observe(self, history: list[dict]):
+        """Folds readings (chronological per serial) into the models."""
+        for reading in history:
+            serial_number = reading["serial_number"]
+            models = self._models.setdefault(serial_number, {})
+            for field in FORECAST_FIELDS:
+                value = reading.get(field)
+                if value is None:
+                    continue
+                model = models.get(field)
+                if model is None:
+                    model = models[field] = DecayedRegression()
+                model.update(reading["last_synced"], value, self.decay_rate)
+            self._dirty.add(serial_number)
+
+    def forecast(self, serial_number: str, horizons=FORECAST_HORIZONS) -> dict:
+        """Forecast in the same shape as `forecasting.forecast_device`."""
+        forecasts = {}
+        for field, model in self._models.get(serial_number, {}).items():
+            if model.n < FORECAST_MIN_POINTS:
+                continue
+            slope, intercept = model.fit()
+            predictions = []
+            for horizon in horizons:
+                value = intercept + slope * horizon
+                if field in _BOUNDS:
+                    value = min(max(value, _BOUNDS[field][0]), _BOUNDS[field][1])
+                predictions.append(
+                    {"horizon_seconds": int(horizon), "value": round(value, 2)}
+                )
+            forecasts[field] = {
+                "current": model.y_last,
+                "slope_per_hour": round(slope * 3600, 4),
+                "points": round(model.n),
+                "predictions": predictions,
+            }
+        return summarize_forecasts(forecasts, horizons)
+
+    def discard(self, serial_number: str):
+        self._models.pop(serial_number, None)
+        self._dirty.discard(serial_number)
+
+    async def load(self):
+        """Restores persisted models (at startup)."""
+        async for doc in db.device_models.find({}, {"_id": 0}):
+            self._models[doc["serial_number"]] = {
+                field: DecayedRegression(model["s"], model["t"])
+                for field, model in doc.get("fields", {}).items()
+            }
+        print(f"📈 Loaded {len(self._models)} device models")
+
+    async def flush(self):
+        """Persists the models changed since the last flush in one bulk write."""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+
+        updates = []
+        for serial_number in dirty:
+            models = self._models.get(serial_number)
+            if not models:
+                continue
+            fields = {
+                field: {"s": model.state(), "t": model.t_last}
+                for field, model in models.items()
+            }
+            updates.append(
+                UpdateOne(
+                    {"serial_number": serial_number},
+                    {"$set": {"fields": fields, "updated_at": datetime.utcnow()}},
+                    upsert=True,
+                )
+            )
+        try:
+            if updates:
+                await db.device_models.bulk_write(updates, ordered=False)
+        except Exception as e:
+            print(f"Error persisting device models: {e}")
+            self._dirty |= dirty
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+device_models = DeviceModelStore()
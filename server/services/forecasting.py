@@ -0,0 +1,168 @@
+import os
+from datetime import datetime
+
+import numpy as np
+from pymongo import UpdateOne
+
+from database import db
+from services.telemetry_buffer import stack_windows, telemetry_buffers
+
+FORECAST_FIELDS = ("temperature", "battery_health")
+# Seconds ahead of the latest reading to predict
+FORECAST_HORIZONS = tuple(
+    int(h) for h in os.getenv("FORECAST_HORIZONS", "60,300,900").split(",")
+)
+FORECAST_WINDOW = int(os.getenv("FORECAST_WINDOW", "50"))
+FORECAST_MIN_POINTS = 10
+# A predicted temperature change below this (°C at the first horizon) is stable
+FORECAST_STABLE_DELTA = float(os.getenv("FORECAST_STABLE_DELTA", "0.05"))
+
+_BOUNDS = {"battery_health": (0.0, 100.0)}
+
+
+def fit_lines(x: np.ndarray, y: np.ndarray):
+    """
+    Closed-form least squares for every row of NaN-padded (devices, window)
+    matrices at once. Returns (slope, intercept, points) per row; rows whose x
+    values are all equal get a flat line.
+    """
+    mask = ~np.isnan(x) & ~np.isnan(y)
+    points = mask.sum(axis=1)
+    safe_points = np.maximum(points, 1)
+
+    mean_x = np.where(mask, x, 0.0).sum(axis=1) / safe_points
+    mean_y = np.where(mask, y, 0.0).sum(axis=1) / safe_points
+    dx = np.where(mask, x - mean_x[:, None], 0.0)
+    dy = np.where(mask, y - mean_y[:, None], 0.0)
+    sxx = (dx * dx).sum(axis=1)
+    sxy = (dx * dy).sum(axis=1)
+
+    slope = np.divide(sxy, sxx, out=np.zeros_like(sxy), where=sxx > 0)
+    intercept = mean_y - slope * mean_x
+    return slope, intercept, points
+
+
+def _last_valid(values: np.ndarray) -> np.ndarray:
+    """Latest non-NaN value of each row (NaN for empty rows)."""
+    valid = ~np.isnan(values)
+    last = values.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1)
+    return np.where(valid.any(axis=1), values[np.arange(len(values)), last], np.nan)
+
+
+def forecast_windows(
+    t: np.ndarray,
+    values: dict[str, np.ndarray],
+    horizons=FORECAST_HORIZONS,
+) -> list[dict]:
+    """
+    Fits every device and field in one batched operation. Time is measured in
+    seconds relative to each device's latest reading, so horizons are offsets
+    from "now" for that device.
+    """
+    # Windows are right-aligned, so the last column holds the latest reading
+    x = (t - t[:, -1:]) / np.timedelta64(1, "s")
+    h = np.asarray(horizons, dtype=float)
+
+    fits = {}
+    for field, y in values.items():
+        slope, intercept, points = fit_lines(x, y)
+        predicted = intercept[:, None] + slope[:, None] * h[None, :]
+        if field in _BOUNDS:
+            predicted = np.clip(predicted, *_BOUNDS[field])
+        fits[field] = (slope, predicted, points, _last_valid(y))
+
+    results = []
+    for row in range(len(t)):
+        forecasts = {}
+        for field, (slope, predicted, points, current) in fits.items():
+            if points[row] < FORECAST_MIN_POINTS:
+                continue
+            forecasts[field] = {
+                "current": float(current[row]),
+                "slope_per_hour": round(float(slope[row]) * 3600, 4),
+                "points": int(points[row]),
+                "predictions": [
+                    {"horizon_seconds": int(hs), "value": round(float(v), 2)}
+                    for hs, v in zip(horizons, predicted[row])
+                ],
+            }
+        results.append(summarize_forecasts(forecasts, horizons))
+    return results
+
+
+def summarize_forecasts(forecasts: dict, horizons) -> dict:
+    """Shapes a device's forecasts, keeping the temperature headline fields."""
+    temperature = forecasts.get("temperature")
+    if temperature is None:
+        return {"error": "Not enough data to forecast"}
+
+    current = temperature["current"]
+    predicted = temperature["predictions"][0]["value"]
+    # From the fitted slope: the latest reading's noise around the line must
+    # not decide the direction
+    change = temperature["slope_per_hour"] * horizons[0] / 3600
+    if abs(change) < FORECAST_STABLE_DELTA:
+        trend = "stable"
+    else:
+        trend = "increasing" if change > 0 else "decreasing"
+
+    return {
+        "current_temperature": current,
+        "forecast_temperature": predicted,
+        "trend": trend,
+        "horizons": list(horizons),
+        "forecasts": forecasts,
+    }
+
+
+async def forecast_device(serial_number: str, window: int = FORECAST_WINDOW) -> dict:
+    ring = await telemetry_buffers.ring(serial_number, window)
+    if ring is None or not len(ring):
+        return {"error": "Not enough data to forecast"}
+    t, values = stack_windows([ring.window(window)], window, FORECAST_FIELDS)
+    return forecast_windows(t, values)[0]
+
+
+async def forecast_fleet(
+    serial_numbers: list[str] | None = None, window: int = FORECAST_WINDOW
+) -> dict:
+    """
+    Forecasts every device in one batched fit over the ring buffers and stores
+    the results in device_analytics with one bulk write.
+    """
+    if serial_numbers is None:
+        serial_numbers = [
+            doc["serial_number"]
+            async for doc in db.twins.find({}, {"serial_number": 1})
+        ]
+    windows = await telemetry_buffers.windows(serial_numbers, window)
+    t, values = stack_windows(windows, window, FORECAST_FIELDS)
+    forecasts = forecast_windows(t, values)
+
+    now = datetime.utcnow()
+    updates = [
+        UpdateOne(
+            {"serial_number": serial_number},
+            {
+                "$set": {
+                    "forecast": forecast,
+                    "forecast_at": now,
+                    "usage_trend": forecast["trend"],
+                }
+            },
+            upsert=True,
+        )
+        for serial_number, forecast in zip(serial_numbers, forecasts)
+        if "error" not in forecast
+    ]
+    if updates:
+        await db.device_analytics.bulk_write(updates, ordered=False)
+
+    return {
+        "forecast_at": now,
+        "devices": len(serial_numbers),
+        "forecasted": len(updates),
+        "forecasts": {
+            s: f for s, f in zip(serial_numbers, forecasts) if "error" not in f
+        },
+    }
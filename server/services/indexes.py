@@ -0,0 +1,247 @@
+import argparse
+import asyncio
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from database import db
+from services.retention import ensure_ttl_indexes
+
+# Indexes the app's queries rely on, per collection. TTL indexes are owned by
+# services.retention since their settings follow the retention config.
+INDEXES = {
+    "twins": [
+        IndexModel(
+            [("serial_number", ASCENDING)], name="serial_number_unique", unique=True
+        ),
+    ],
+    "sale_records": [
+        IndexModel(
+            [("serial_number", ASCENDING), ("sold_at", DESCENDING)],
+            name="serial_number_sold_at",
+        ),
+    ],
+    "device_analytics": [
+        IndexModel(
+            [("serial_number", ASCENDING)], name="serial_number_unique", unique=True
+        ),
+        IndexModel([("return_risk_flag", ASCENDING)], name="return_risk_flag"),
+        IndexModel([("revenue_at_risk", ASCENDING)], name="revenue_at_risk"),
+    ],
+    "device_models": [
+        IndexModel(
+            [("serial_number", ASCENDING)], name="serial_number_unique", unique=True
+        ),
+    ],
+    "telemetry_buckets": [
+        IndexModel(
+            [
+                ("serial_number", ASCENDING),
+                ("bucket_start", DESCENDING),
+                ("last", DESCENDING),
+            ],
+            name="serial_number_bucket_start_last",
+        ),
+    ],
+    "telemetry_rollups": [
+        IndexModel(
+            [
+                ("serial_number", ASCENDING),
+                ("resolution", ASCENDING),
+                ("bucket_start", DESCENDING),
+            ],
+            name="serial_number_resolution_bucket_start",
+            unique=True,
+        ),
+    ],
+    "telemetry_history": [
+        IndexModel(
+            [("serial_number", ASCENDING), ("last_synced", DESCENDING)],
+            name="serial_number_last_synced",
+        ),
+    ],
+}
+
+
+async def ensure_indexes():
+    """
+    Creates every declared index (a no-op for existing ones). A collection
+    whose index cannot be built, e.g. a unique index over duplicate data, is
+    reported and skipped so the others are still created.
+    """
+    for collection_name, indexes in INDEXES.items():
+        try:
+            await db[collection_name].create_indexes(indexes)
+        except Exception as e:
+            print(f"Index creation failed for {collection_name}: {e}")
+    await ensure_ttl_indexes()
+    print(f"🗂️ Indexes ensured for {len(INDEXES)} collections")
+
+
+# Representative service queries: (name, collection, command body, full scan ok)
+_PROBE_SERIAL = "EXPLAIN-PROBE"
+_PROBE_ID = ObjectId("000000000000000000000000")
+
+SERVICE_QUERIES = [
+    (
+        "analytics.get_device_analytics",
+        "device_analytics",
+        {"filter": {"serial_number": _PROBE_SERIAL}, "limit": 1},
+        False,
+    ),
+    (
+        "telemetry_store.read_history (buckets)",
+        "telemetry_buckets",
+        {
+            "filter": {"serial_number": _PROBE_SERIAL},
+            "sort": {"bucket_start": -1, "last": -1},
+        },
+        False,
+    ),
+    (
+        "telemetry_store.read_history (legacy)",
+        "telemetry_history",
+        {
+            "filter": {"serial_number": _PROBE_SERIAL},
+            "sort": {"last_synced": -1},
+            "limit": 100,
+        },
+        False,
+    ),
+    (
+        "rollups.read_rollups",
+        "telemetry_rollups",
+        {
+            "filter": {"serial_number": _PROBE_SERIAL, "resolution": "hour"},
+            "sort": {"bucket_start": -1},
+            "limit": 100,
+        },
+        False,
+    ),
+    (
+        "sales.get_sales_by_serial",
+        "sale_records",
+        {"filter": {"serial_number": _PROBE_SERIAL}, "sort": {"sold_at": -1}},
+        False,
+    ),
+    (
+        "sales.update_sale_record",
+        "sale_records",
+        {"filter": {"_id": _PROBE_ID}, "limit": 1},
+        False,
+    ),
+    (
+        "sales.get_sales_summary (at risk count)",
+        "device_analytics",
+        {"filter": {"return_risk_flag": True}},
+        False,
+    ),
+    (
+        "sales.get_sales_summary (revenue at risk)",
+        "device_analytics",
+        {"filter": {"revenue_at_risk": {"$gt": 0}}},
+        False,
+    ),
+    (
+        "sales.get_sales_summary (revenue totals)",
+        "sale_records",
+        {"filter": {}},
+        True,
+    ),
+    ("twin_routes.list_twins", "twins", {"filter": {}}, True),
+    (
+        "twin_routes.get_twin",
+        "twins",
+        {"filter": {"_id": _PROBE_ID}, "limit": 1},
+        False,
+    ),
+    (
+        "analytics_worker twin lookup",
+        "twins",
+        {"filter": {"serial_number": _PROBE_SERIAL}, "limit": 1},
+        False,
+    ),
+]
+
+
+def plan_stages(node) -> list[str]:
+    """Every stage name in an explain winning plan, outermost first."""
+    stages = []
+    if isinstance(node, dict):
+        if "stage" in node:
+            stages.append(node["stage"])
+        for value in node.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(node, list):
+        for value in node:
+            stages.extend(plan_stages(value))
+    return stages
+
+
+def winning_plans(explain: dict) -> list[dict]:
+    """Winning plans of an explain result, wherever the server nested them."""
+    plans = []
+    for key, value in explain.items():
+        if key == "winningPlan":
+            plans.append(value)
+        elif isinstance(value, dict):
+            plans.extend(winning_plans(value))
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict):
+                    plans.extend(winning_plans(item))
+    return plans
+
+
+async def explain_queries() -> list[dict]:
+    """Explains each service query and flags unexpected collection scans."""
+    results = []
+    for name, collection, body, full_scan_ok in SERVICE_QUERIES:
+        explain = await db.command(
+            "explain", {"find": collection, **body}, verbosity="queryPlanner"
+        )
+        stages = [s for plan in winning_plans(explain) for s in plan_stages(plan)]
+        collscan = "COLLSCAN" in stages
+        results.append(
+            {
+                "query": name,
+                "collection": collection,
+                "stages": stages,
+                "collscan": collscan,
+                "flagged": collscan and not full_scan_ok,
+            }
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Create the app's MongoDB indexes and verify query plans."
+    )
+    parser.add_argument(
+        "--explain",
+        action="store_true",
+        help="explain each service query and flag collection scans",
+    )
+    parser.add_argument("--no-create", action="store_true", help="skip index creation")
+    args = parser.parse_args()
+
+    async def main() -> int:
+        if not args.no_create:
+            await ensure_indexes()
+        if not args.explain:
+            return 0
+
+        flagged = 0
+        for result in await explain_queries():
+            if result["flagged"]:
+                status = "❌ COLLSCAN"
+                flagged += 1
+            elif result["collscan"]:
+                status = "⚠️ COLLSCAN (expected)"
+            else:
+                status = "✅"
+            print(f"{status} {result['query']}: {' <- '.join(result['stages'])}")
+        return 1 if flagged else 0
+
+    raise SystemExit(asyncio.run(main()))
@@ -1,11 +1,22 @@
 import asyncio
 import json
 import os
-from datetime import datetime
+import zlib
 
 import aio_pika
 
-from database import db
+from services.broadcast import TelemetryBroadcaster
+from services.command_frames import encode_command
+from services.deadband import DeadbandFilter
+from services.device_models import device_models
+from services.rollups import RollupAccumulator
+from services.streaming_stats import StreamingAnomalyDetector
+from services.telemetry_ingest import (
+    INGEST_BATCH_SIZE,
+    INGEST_PARTITIONS,
+    TelemetryIngestor,
+)
+from sio_instance import set_snapshot_source
 
 RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "localhost")
 RABBITMQ_USER = os.getenv("RABBITMQ_DEFAULT_USER", "user")
@@ -13,12 +24,33 @@ RABBITMQ_PASS = os.getenv("RABBITMQ_DEFAULT_PASS", "password")
 RABBITMQ_URL = f"amqp://{RABBITMQ_USER}:{RABBITMQ_PASS}@{RABBITMQ_HOST}:5672/"
 
 QUEUE_NAME = "telemetry_updates"
+# Unacked telemetry messages the broker may push to the consumer at once.
+# Messages are acked only after their flush, so the default lets at least one
+# partition fill a batch even with single-reading messages.
+TELEMETRY_PREFETCH = int(
+    os.getenv("TELEMETRY_PREFETCH", str(INGEST_BATCH_SIZE * INGEST_PARTITIONS))
+)
 COMMANDS_QUEUE = "device_commands"
 ANALYTICS_QUEUE = "analytics_jobs"
 
+# Number of simulator shards; each shard consumes its own commands queue
+SIM_SHARDS = max(1, int(os.getenv("SIM_SHARDS", "1")))
+
 _connection = None
 _channel = None
 _lock = asyncio.Lock()
+# The running telemetry consumer's ingestor, for per-device cleanup
+_ingestor = None
+
+
+def shard_for(serial_number: str, shards: int = SIM_SHARDS) -> int:
+    """Stable shard index for a serial (crc32, so identical across processes)."""
+    return zlib.crc32(serial_number.encode()) % shards
+
+
+def commands_queue_name(shard: int = 0, shards: int = SIM_SHARDS) -> str:
+    """Commands queue owned by a simulator shard."""
+    return COMMANDS_QUEUE if shards == 1 else f"{COMMANDS_QUEUE}.{shard}"
 
 
 async def get_rabbitmq():
@@ -31,19 +63,22 @@ async def get_rabbitmq():
 
         if _channel is None or _channel.is_closed:
             _channel = await _connection.channel()
-            await _channel.declare_queue(COMMANDS_QUEUE, durable=True)
+            for shard in range(SIM_SHARDS):
+                await _channel.declare_queue(commands_queue_name(shard), durable=True)
             await _channel.declare_queue(QUEUE_NAME, durable=True)
 
         return _connection, _channel
 
 
 async def publish_command(command: dict):
-    """Publishes a command to the commands queue."""
+    """Publishes a command to the commands queue of the owning simulator shard."""
     try:
         _, channel = await get_rabbitmq()
-        message_body = json.dumps(command).encode()
+        message_body, content_type = encode_command(command)
+        shard = shard_for(command.get("target_serial", ""))
         await channel.default_exchange.publish(
-            aio_pika.Message(body=message_body), routing_key=COMMANDS_QUEUE
+            aio_pika.Message(body=message_body, content_type=content_type),
+            routing_key=commands_queue_name(shard),
         )
     except Exception as e:
         print(f"Failed to publish command: {e}")
@@ -51,77 +86,76 @@ async def publish_command(command: dict):
 
 async def publish_analytics_job(serial_number: str):
     """Publishes a job to the analytics queue."""
+    await publish_analytics_jobs([serial_number])
+
+
+async def publish_analytics_jobs(serial_numbers: list[str]) -> bool:
+    """Publishes one analytics job message covering many devices."""
     try:
         _, channel = await get_rabbitmq()
-        message_body = json.dumps({"serial_number": serial_number}).encode()
+        message_body = json.dumps({"serial_numbers": serial_numbers}).encode()
         await channel.default_exchange.publish(
             aio_pika.Message(body=message_body), routing_key=ANALYTICS_QUEUE
         )
+        return True
     except Exception as e:
         print(f"Failed to publish analytics job: {e}")
+        return False
 
 
-async def process_message(message: aio_pika.IncomingMessage, sio=None):
-    async with message.process():
-        try:
-            data = json.loads(message.body)
-            serial_number = data.get("serial_number")
-
-            if not serial_number:
-                return
-
-            update_data = {}
-            if "cpu_usage" in data:
-                update_data["cpu_usage"] = data["cpu_usage"]
-            if "temperature" in data:
-                update_data["temperature"] = data["temperature"]
-            if "battery_health" in data:
-                update_data["battery_health"] = data["battery_health"]
-            if "is_charging" in data:
-                update_data["is_charging"] = data["is_charging"]
-
-            if update_data:
-                update_data["last_synced"] = datetime.utcnow()
-
-                await db.twins.update_one(
-                    {"serial_number": serial_number}, {"$set": update_data}
-                )
-
-                # Persist history for analytics
-                history_entry = {"serial_number": serial_number, **update_data}
-                await db.telemetry_history.insert_one(history_entry)
-
-                if sio:
-                    twin = await db.twins.find_one(
-                        {"serial_number": serial_number}, {"_id": 1}
-                    )
-
-                    if twin:
-                        update_payload = {
-                            "_id": str(twin["_id"]),
-                            **update_data,
-                            "last_synced": str(update_data["last_synced"]),
-                        }
-                        await sio.emit("telemetry_update", update_payload)
-        except Exception as e:
-            print(f"Error processing telemetry: {e}")
+def forget_device(serial_number: str, twin_id: str):
+    """Drops the telemetry consumer's in-memory state for a deleted twin."""
+    if _ingestor:
+        _ingestor.forget(serial_number, twin_id)
 
 
 async def consume_telemetry(sio=None):
-    """Consumer loop for telemetry data."""
+    """
+    Consumer loop for telemetry data.
+    Messages are buffered by the ingestor and acked after their bulk flush;
+    near-duplicate readings are dropped by the dead-band filter.
+    """
+    global _ingestor
     print("Starting Telemetry Consumer...")
-    while True:
-        try:
-            _, channel = await get_rabbitmq()
-            queue = await channel.declare_queue(QUEUE_NAME, durable=True)
-
-            async with queue.iterator() as queue_iter:
-                async for message in queue_iter:
-                    await process_message(message, sio)
-
-        except asyncio.CancelledError:
-            print("Telemetry consumer cancelled.")
-            break
-        except Exception as e:
-            print(f"Telemetry Consumer Error: {e}. Reconnecting in 5s...")
-            await asyncio.sleep(5)
+    broadcaster = TelemetryBroadcaster(sio) if sio else None
+    if broadcaster:
+        set_snapshot_source(broadcaster.snapshot)
+    rollups = RollupAccumulator()
+    ingestor = TelemetryIngestor(
+        broadcaster, rollups, DeadbandFilter(), StreamingAnomalyDetector(sio)
+    )
+    _ingestor = ingestor
+    flush_task = asyncio.create_task(ingestor.run())
+    rollup_task = asyncio.create_task(rollups.run())
+    model_task = asyncio.create_task(device_models.run())
+    broadcast_task = asyncio.create_task(broadcaster.run()) if broadcaster else None
+    try:
+        while True:
+            try:
+                connection, _ = await get_rabbitmq()
+                # Dedicated channel: manual acks must not be shared with publishers
+                channel = await connection.channel()
+                # Bounded prefetch keeps enough messages in flight to fill a
+                # batch without letting the backlog pile up in memory
+                await channel.set_qos(prefetch_count=TELEMETRY_PREFETCH)
+                queue = await channel.declare_queue(QUEUE_NAME, durable=True)
+
+                async with queue.iterator() as queue_iter:
+                    async for message in queue_iter:
+                        await ingestor.submit(message)
+
+            except asyncio.CancelledError:
+                print("Telemetry consumer cancelled.")
+                break
+            except Exception as e:
+                print(f"Telemetry Consumer Error: {e}. Reconnecting in 5s...")
+                await asyncio.sleep(5)
+    finally:
+        flush_task.cancel()
+        rollup_task.cancel()
+        model_task.cancel()
+        if broadcast_task:
+            broadcast_task.cancel()
+        await ingestor.flush()
+        await rollups.flush()
+        await device_models.flush()
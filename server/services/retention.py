@@ -0,0 +1,249 @@
+import asyncio
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import bson
+from pymongo import ASCENDING
+
+from database import db
+from services.rollups import RollupAccumulator
+
+# Raw readings (buckets and legacy per-reading documents) kept this many days
+RAW_RETENTION_DAYS = int(os.getenv("TELEMETRY_RAW_RETENTION_DAYS", "7"))
+# When set, expired raw buckets are written here as gzipped NDJSON before delete
+ARCHIVE_DIR = os.getenv("TELEMETRY_ARCHIVE_DIR", "")
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", "3600"))
+# TTL indexes trail the retention job by this much, so it can archive first
+TTL_GRACE = timedelta(days=1)
+
+_BATCH = 1000
+# Rollup writes tried per compaction batch before giving up on this run
+_COMPACT_ATTEMPTS = 3
+
+
+def raw_ttl_seconds() -> int:
+    """TTL for raw data; 0 disables the index."""
+    if not RAW_RETENTION_DAYS:
+        return 0
+    ttl = timedelta(days=RAW_RETENTION_DAYS)
+    if ARCHIVE_DIR:
+        ttl += TTL_GRACE
+    return int(ttl.total_seconds())
+
+
+def ttl_indexes() -> dict[str, tuple[str, str, int]]:
+    """collection -> (index name, field, expireAfterSeconds or None to drop)."""
+    raw_ttl = raw_ttl_seconds()
+    return {
+        # Legacy telemetry_history gets no TTL: it must be compacted first
+        "telemetry_buckets": ("last_ttl", "last", raw_ttl or None),
+        # Rollup documents carry their own tier-specific expiry time
+        "telemetry_rollups": ("expire_at_ttl", "expire_at", 0),
+    }
+
+
+async def ensure_ttl_indexes():
+    """Creates, retunes or drops the app-managed TTL indexes to match config."""
+    for collection_name, (name, field, seconds) in ttl_indexes().items():
+        collection = db[collection_name]
+        existing = (await collection.index_information()).get(name)
+
+        if seconds is None:
+            if existing:
+                await collection.drop_index(name)
+        elif existing is None:
+            await collection.create_index(
+                [(field, ASCENDING)], name=name, expireAfterSeconds=seconds
+            )
+        elif existing.get("expireAfterSeconds") != seconds:
+            await db.command(
+                "collMod",
+                collection_name,
+                index={"name": name, "expireAfterSeconds": seconds},
+            )
+
+
+async def _collection_bytes(collection, query: dict) -> tuple[int, int]:
+    """(documents, total BSON bytes) matching a query."""
+    pipeline = [
+        {"$match": query},
+        {
+            "$group": {
+                "_id": None,
+                "count": {"$sum": 1},
+                "bytes": {"$sum": {"$bsonSize": "$$ROOT"}},
+            }
+        },
+    ]
+    result = await collection.aggregate(pipeline).to_list(length=1)
+    if not result:
+        return 0, 0
+    return result[0]["count"], result[0]["bytes"]
+
+
+def _archive(docs: list[dict], path: Path):
+    """Appends documents to a gzipped NDJSON file."""
+    with gzip.open(path, "at", encoding="utf-8") as f:
+        for doc in docs:
+            f.write(json.dumps(doc, default=str) + "\n")
+
+
+async def _archive_and_delete(collection, query: dict, path: Path) -> tuple[int, int]:
+    """Streams matching documents to a gzipped NDJSON file, then deletes them."""
+    deleted = 0
+    reclaimed = 0
+    with gzip.open(path, "at", encoding="utf-8") as f:
+        ids = []
+        async for doc in collection.find(query):
+            reclaimed += len(bson.encode(doc))
+            f.write(json.dumps(doc, default=str) + "\n")
+            ids.append(doc["_id"])
+            if len(ids) >= _BATCH:
+                deleted += (
+                    await collection.delete_many({"_id": {"$in": ids}})
+                ).deleted_count
+                ids = []
+        if ids:
+            deleted += (
+                await collection.delete_many({"_id": {"$in": ids}})
+            ).deleted_count
+    return deleted, reclaimed
+
+
+async def _compact_batch(
+    rollups: RollupAccumulator, docs: list[dict], archive_path: Path | None
+) -> tuple[int, int]:
+    rollups.add(docs)
+    for attempt in range(_COMPACT_ATTEMPTS):
+        if attempt:
+            await asyncio.sleep(2**attempt)
+        # Partials that failed stay in the accumulator and are retried alone
+        if await rollups.flush():
+            break
+    else:
+        raise RuntimeError("rollup write failed; legacy readings kept")
+
+    if archive_path:
+        _archive(docs, archive_path)
+    result = await db.telemetry_history.delete_many(
+        {"_id": {"$in": [doc["_id"] for doc in docs]}}
+    )
+    return result.deleted_count, sum(len(bson.encode(doc)) for doc in docs)
+
+
+async def compact_legacy_history(
+    cutoff: datetime, archive_path: Path | None = None
+) -> tuple[int, int, int]:
+    """
+    Folds legacy per-reading documents older than `cutoff` into the rollup
+    tiers, then archives (optionally) and deletes them, batch by batch. A
+    batch is only removed once its rollups are confirmed written, so a failed
+    write raises with those readings still in place.
+    Returns (compacted, deleted, bytes reclaimed).
+    """
+    rollups = RollupAccumulator()
+    compacted = deleted = reclaimed = 0
+    cursor = db.telemetry_history.find({"last_synced": {"$lt": cutoff}}).sort(
+        [("serial_number", ASCENDING), ("last_synced", ASCENDING)]
+    )
+
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= _BATCH:
+            batch_deleted, batch_bytes = await _compact_batch(
+                rollups, batch, archive_path
+            )
+            compacted += len(batch)
+            deleted += batch_deleted
+            reclaimed += batch_bytes
+            batch = []
+    if batch:
+        batch_deleted, batch_bytes = await _compact_batch(rollups, batch, archive_path)
+        compacted += len(batch)
+        deleted += batch_deleted
+        reclaimed += batch_bytes
+
+    return compacted, deleted, reclaimed
+
+
+async def apply_retention() -> dict:
+    """
+    Enforces raw retention and returns a report of what was reclaimed.
+    Buckets are archived (if ARCHIVE_DIR is set) or deleted; legacy readings
+    are compacted into rollups first. Rollup tiers expire through their TTL.
+    """
+    report = {
+        "raw_retention_days": RAW_RETENTION_DAYS,
+        "buckets_deleted": 0,
+        "legacy_compacted": 0,
+        "legacy_deleted": 0,
+        "bytes_reclaimed": 0,
+        "archive_file": None,
+    }
+    if not RAW_RETENTION_DAYS:
+        return report
+
+    cutoff = datetime.utcnow() - timedelta(days=RAW_RETENTION_DAYS)
+    report["cutoff"] = cutoff
+    bucket_query = {"last": {"$lt": cutoff}}
+
+    path = None
+    if ARCHIVE_DIR:
+        archive_dir = Path(ARCHIVE_DIR)
+        archive_dir.mkdir(parents=True, exist_ok=True)
+        path = archive_dir / f"telemetry-{cutoff:%Y%m%d%H%M%S}.ndjson.gz"
+        report["archive_file"] = str(path)
+
+        deleted, reclaimed = await _archive_and_delete(
+            db.telemetry_buckets, bucket_query, path
+        )
+    else:
+        _, reclaimed = await _collection_bytes(db.telemetry_buckets, bucket_query)
+        deleted = (await db.telemetry_buckets.delete_many(bucket_query)).deleted_count
+    report["buckets_deleted"] = deleted
+    report["bytes_reclaimed"] += reclaimed
+
+    try:
+        compacted, deleted, reclaimed = await compact_legacy_history(cutoff, path)
+    except Exception as e:
+        report["legacy_error"] = str(e)
+    else:
+        report["legacy_compacted"] = compacted
+        report["legacy_deleted"] = deleted
+        report["bytes_reclaimed"] += reclaimed
+
+    return report
+
+
+async def retention_loop():
+    """Runs retention periodically; TTL indexes are ensured at startup."""
+    print(f"🧹 Starting Telemetry Retention (raw: {RAW_RETENTION_DAYS} days)...")
+    try:
+        while True:
+            try:
+                report = await apply_retention()
+                if (
+                    report["buckets_deleted"]
+                    or report["legacy_deleted"]
+                    or "legacy_error" in report
+                ):
+                    print(f"🧹 Retention report: {json.dumps(report, default=str)}")
+            except Exception as e:
+                print(f"Retention Error: {e}")
+            await asyncio.sleep(RETENTION_INTERVAL)
+    except asyncio.CancelledError:
+        print("Retention task stopped.")
+
+
+if __name__ == "__main__":
+
+    async def main():
+        await ensure_ttl_indexes()
+        report = await apply_retention()
+        print(json.dumps(report, default=str, indent=2))
+
+    asyncio.run(main())
@@ -0,0 +1,211 @@
+import asyncio
+import os
+from datetime import timedelta
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import db
+from services.telemetry_store import bucket_start
+
+# Resolution name -> window length in seconds
+ROLLUP_TIERS = {"minute": 60, "hour": 3600, "day": 86400}
+ROLLUP_FIELDS = ("cpu_usage", "temperature", "battery_health")
+ROLLUP_FLUSH_INTERVAL = float(os.getenv("ROLLUP_FLUSH_INTERVAL", "5"))
+# Days each tier is kept (0 = forever); enforced by a TTL index on expire_at
+ROLLUP_RETENTION_DAYS = {
+    "minute": int(os.getenv("ROLLUP_MINUTE_RETENTION_DAYS", "30")),
+    "hour": int(os.getenv("ROLLUP_HOUR_RETENTION_DAYS", "365")),
+    "day": int(os.getenv("ROLLUP_DAY_RETENTION_DAYS", "0")),
+}
+
+
+def _add(path: str, value) -> dict:
+    """Pipeline expression adding `value` to a possibly missing field."""
+    return {"$add": [{"$ifNull": [f"${path}", 0]}, value]}
+
+
+class RollupAccumulator:
+    """
+    Maintains per-serial minute/hour/day aggregates (min/max/mean/last) of
+    incoming telemetry. Readings are folded into in-memory partials and
+    merged into telemetry_rollups with pipeline upserts on an interval, so
+    one flush covers many readings per window.
+    """
+
+    def __init__(self, flush_interval: float = ROLLUP_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        # (serial_number, resolution, bucket_start) -> partial aggregate
+        self._partials: dict[tuple, dict] = {}
+        self._flush_lock = asyncio.Lock()
+
+    def add(self, history: list[dict]):
+        """Folds readings (in per-serial order) into the partial aggregates."""
+        for reading in history:
+            ts = reading["last_synced"]
+            for resolution, seconds in ROLLUP_TIERS.items():
+                key = (reading["serial_number"], resolution, bucket_start(ts, seconds))
+                partial = self._partials.get(key)
+                if partial is None:
+                    partial = self._partials[key] = {"count": 0, "last_t": ts}
+
+                partial["count"] += 1
+                partial["last_t"] = max(partial["last_t"], ts)
+                for field in ROLLUP_FIELDS:
+                    value = reading.get(field)
+                    if value is None:
+                        continue
+                    stats = partial.get(field)
+                    if stats is None:
+                        partial[field] = {
+                            "min": value,
+                            "max": value,
+                            "sum": value,
+                            "n": 1,
+                            "last": value,
+                        }
+                    else:
+                        stats["min"] = min(stats["min"], value)
+                        stats["max"] = max(stats["max"], value)
+                        stats["sum"] += value
+                        stats["n"] += 1
+                        stats["last"] = value
+
+    def _updates(self, partials: dict) -> list[UpdateOne]:
+        """
+        One pipeline upsert per partial. "last" only moves forward: legacy
+        compaction can fold readings older than the stored ones into a window.
+        """
+        updates = []
+        for (serial_number, resolution, start), partial in partials.items():
+            last_t = partial["last_t"]
+            newer = {"$gte": [last_t, {"$ifNull": ["$last_t", last_t]}]}
+            fields = {
+                "count": _add("count", partial["count"]),
+                "last_t": {"$max": ["$last_t", last_t]},
+            }
+            for field in ROLLUP_FIELDS:
+                stats = partial.get(field)
+                if stats is None:
+                    continue
+                fields[f"{field}.sum"] = _add(f"{field}.sum", stats["sum"])
+                fields[f"{field}.n"] = _add(f"{field}.n", stats["n"])
+                fields[f"{field}.min"] = {"$min": [f"${field}.min", stats["min"]]}
+                fields[f"{field}.max"] = {"$max": [f"${field}.max", stats["max"]]}
+                fields[f"{field}.last"] = {
+                    "$cond": [
+                        newer,
+                        stats["last"],
+                        {"$ifNull": [f"${field}.last", stats["last"]]},
+                    ]
+                }
+
+            retention_days = ROLLUP_RETENTION_DAYS[resolution]
+            if retention_days:
+                expire_at = (
+                    start
+                    + timedelta(seconds=ROLLUP_TIERS[resolution])
+                    + timedelta(days=retention_days)
+                )
+                fields["expire_at"] = {"$max": ["$expire_at", expire_at]}
+
+            updates.append(
+                UpdateOne(
+                    {
+                        "serial_number": serial_number,
+                        "resolution": resolution,
+                        "bucket_start": start,
+                    },
+                    [{"$set": fields}],
+                    upsert=True,
+                )
+            )
+        return updates
+
+    async def flush(self) -> bool:
+        """Writes the partials; False if some were kept for the next flush."""
+        # Flushes are serialized so "last" values are applied in arrival order
+        async with self._flush_lock:
+            if not self._partials:
+                return True
+            partials, self._partials = self._partials, {}
+            try:
+                await db.telemetry_rollups.bulk_write(
+                    self._updates(partials), ordered=False
+                )
+                return True
+            except BulkWriteError as e:
+                print(f"Error flushing telemetry rollups: {e}")
+                # Unordered: every op not listed as failed was applied, and
+                # re-applying its sums would double-count
+                keys = list(partials)
+                failed = {keys[error["index"]] for error in e.details["writeErrors"]}
+                self._restore({key: partials[key] for key in failed})
+            except Exception as e:
+                print(f"Error flushing telemetry rollups: {e}")
+                self._restore(partials)
+            return False
+
+    def _restore(self, partials: dict):
+        """Merges unflushed partials back under newer ones for the next flush."""
+        for key, older in partials.items():
+            newer = self._partials.get(key)
+            if newer is None:
+                self._partials[key] = older
+                continue
+
+            newer["count"] += older["count"]
+            newer["last_t"] = max(newer["last_t"], older["last_t"])
+            for field in ROLLUP_FIELDS:
+                old_stats = older.get(field)
+                if old_stats is None:
+                    continue
+                stats = newer.get(field)
+                if stats is None:
+                    newer[field] = old_stats
+                    continue
+                # "last" stays with the newer partial
+                stats["min"] = min(stats["min"], old_stats["min"])
+                stats["max"] = max(stats["max"], old_stats["max"])
+                stats["sum"] += old_stats["sum"]
+                stats["n"] += old_stats["n"]
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+def format_rollup(doc: dict) -> dict:
+    """Shapes a rollup document like a history point, with means as values."""
+    point = {
+        "serial_number": doc["serial_number"],
+        "resolution": doc["resolution"],
+        "last_synced": doc["bucket_start"],
+        "count": doc.get("count", 0),
+        "min": {},
+        "max": {},
+        "last": {},
+    }
+    for field in ROLLUP_FIELDS:
+        stats = doc.get(field)
+        if not stats or not stats.get("n"):
+            continue
+        point[field] = round(stats["sum"] / stats["n"], 2)
+        point["min"][field] = stats["min"]
+        point["max"][field] = stats["max"]
+        point["last"][field] = stats["last"]
+    return point
+
+
+async def read_rollups(serial_number: str, resolution: str, limit: int = 100):
+    """Latest `limit` aggregates at the given resolution, chronological."""
+    cursor = (
+        db.telemetry_rollups.find(
+            {"serial_number": serial_number, "resolution": resolution}
+        )
+        .sort("bucket_start", -1)
+        .limit(limit)
+    )
+    docs = await cursor.to_list(length=limit)
+    return [format_rollup(doc) for doc in reversed(docs)]
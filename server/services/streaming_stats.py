@@ -0,0 +1,148 @@
+import math
+import os
+
+from pymongo import UpdateOne
+
+from database import db
+from services.twin_index import twin_index
+from sio_instance import FLEET_ROOM, region_room, room_members, twin_room
+
+STREAM_FIELDS = ("temperature",)
+# Weight of each new reading in the running mean/variance (EWMA)
+STREAM_EWMA_ALPHA = float(os.getenv("STREAM_EWMA_ALPHA", "0.05"))
+STREAM_Z_THRESHOLD = float(os.getenv("STREAM_Z_THRESHOLD", "3"))
+# Readings needed before a device's statistics are trusted
+STREAM_MIN_SAMPLES = int(os.getenv("STREAM_MIN_SAMPLES", "20"))
+# Live alerts kept per device in device_analytics
+LIVE_ANOMALIES_KEPT = 50
+
+
+class StreamingStats:
+    """Exponentially weighted mean and variance of one field, O(1) per update."""
+
+    __slots__ = ("count", "mean", "var")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+
+    def zscore(self, value: float) -> float | None:
+        if self.count < STREAM_MIN_SAMPLES or self.var <= 0:
+            return None
+        return (value - self.mean) / math.sqrt(self.var)
+
+    def update(self, value: float, alpha: float):
+        self.count += 1
+        if self.count == 1:
+            self.mean = value
+            return
+        diff = value - self.mean
+        increment = alpha * diff
+        self.mean += increment
+        self.var = (1 - alpha) * (self.var + diff * increment)
+
+
+class StreamingAnomalyDetector:
+    """
+    Keeps running statistics per device and field, updated by the telemetry
+    ingestor, and raises an alert as soon as a reading's z-score crosses the
+    threshold. Alerts are emitted as `anomaly_alert` to the rooms following
+    the device and appended to its live_anomalies in device_analytics.
+    """
+
+    def __init__(
+        self,
+        sio=None,
+        alpha: float = STREAM_EWMA_ALPHA,
+        threshold: float = STREAM_Z_THRESHOLD,
+    ):
+        self.sio = sio
+        self.alpha = alpha
+        self.threshold = threshold
+        # (serial_number, field) -> running statistics
+        self._stats: dict[tuple[str, str], StreamingStats] = {}
+
+    def observe(self, history: list[dict]) -> list[dict]:
+        """Folds readings into the statistics and returns the alerts raised."""
+        alerts = []
+        for reading in history:
+            serial_number = reading["serial_number"]
+            for field in STREAM_FIELDS:
+                value = reading.get(field)
+                if value is None:
+                    continue
+                key = (serial_number, field)
+                stats = self._stats.get(key)
+                if stats is None:
+                    stats = self._stats[key] = StreamingStats()
+
+                z_score = stats.zscore(value)
+                if z_score is not None and abs(z_score) > self.threshold:
+                    alerts.append(
+                        {
+                            "serial_number": serial_number,
+                            "field": field,
+                            "timestamp": reading["last_synced"],
+                            "value": value,
+                            "expected": round(stats.mean, 2),
+                            "z_score": round(z_score, 2),
+                            "type": "High" if z_score > 0 else "Low",
+                        }
+                    )
+                stats.update(value, self.alpha)
+        return alerts
+
+    def forget(self, serial_number: str):
+        for field in STREAM_FIELDS:
+            self._stats.pop((serial_number, field), None)
+
+    async def publish(self, alerts: list[dict]):
+        """Pushes alerts to Socket.IO subscribers and device_analytics."""
+        if not alerts:
+            return
+
+        by_serial = {}
+        for alert in alerts:
+            by_serial.setdefault(alert["serial_number"], []).append(alert)
+
+        await db.device_analytics.bulk_write(
+            [
+                UpdateOne(
+                    {"serial_number": serial_number},
+                    {
+                        "$push": {
+                            "live_anomalies": {
+                                "$each": found,
+                                "$slice": -LIVE_ANOMALIES_KEPT,
+                            }
+                        },
+                        "$set": {"last_anomaly_at": found[-1]["timestamp"]},
+                    },
+                    upsert=True,
+                )
+                for serial_number, found in by_serial.items()
+            ],
+            ordered=False,
+        )
+
+        if self.sio is None:
+            return
+
+        twin_ids = await twin_index.get_many(by_serial)
+        for alert in alerts:
+            serial_number = alert["serial_number"]
+            rooms = [FLEET_ROOM, twin_room(serial_number)]
+            region = twin_index.region(serial_number)
+            if region:
+                rooms.append(region_room(region))
+            rooms = [room for room in rooms if room in room_members]
+            if not rooms:
+                continue
+
+            payload = {
+                **alert,
+                "_id": str(twin_ids.get(serial_number, "")),
+                "timestamp": str(alert["timestamp"]),
+            }
+            await self.sio.emit("anomaly_alert", payload, room=rooms)
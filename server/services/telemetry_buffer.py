@@ -0,0 +1,276 @@
+import os
+from datetime import datetime
+
+import numpy as np
+
+from database import db
+from services.telemetry_store import READING_FIELDS, read_history, unpack_bucket
+
+# Recent readings kept in memory per device
+RING_BUFFER_SIZE = int(os.getenv("TELEMETRY_RING_BUFFER_SIZE", "256"))
+
+_INT_FIELDS = ("cpu_usage", "battery_health")
+
+
+class TelemetryRing:
+    """
+    Fixed-size ring of one device's most recent readings. Fields live in
+    NumPy arrays (NaN marks a missing value), so analytics can slice a
+    window without building per-reading objects.
+    """
+
+    def __init__(self, serial_number: str, capacity: int = RING_BUFFER_SIZE):
+        self.serial_number = serial_number
+        self.capacity = capacity
+        # Millisecond precision, like MongoDB dates, so backfills line up
+        self.t = np.empty(capacity, dtype="datetime64[ms]")
+        self.values = {f: np.full(capacity, np.nan) for f in READING_FIELDS}
+        self._start = 0
+        self._size = 0
+        # Set once older readings were loaded from MongoDB
+        self.backfilled = False
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, reading: dict):
+        if self._size < self.capacity:
+            i = (self._start + self._size) % self.capacity
+            self._size += 1
+        else:
+            # Full: overwrite the oldest slot
+            i = self._start
+            self._start = (self._start + 1) % self.capacity
+
+        self.t[i] = reading["last_synced"]
+        for field, values in self.values.items():
+            value = reading.get(field)
+            values[i] = np.nan if value is None else value
+
+    def _order(self, limit: int | None = None) -> np.ndarray:
+        """Slot indices of the latest `limit` readings, oldest first."""
+        n = self._size if limit is None else min(limit, self._size)
+        return (self._start + self._size - n + np.arange(n)) % self.capacity
+
+    def window(self, limit: int | None = None) -> dict[str, np.ndarray]:
+        """Latest readings as chronological arrays: "t" plus one per field."""
+        order = self._order(limit)
+        arrays = {"t": self.t[order]}
+        for field, values in self.values.items():
+            arrays[field] = values[order]
+        return arrays
+
+    def readings(self, limit: int | None = None) -> list[dict]:
+        """Latest readings as history dicts, oldest first."""
+        arrays = self.window(limit)
+        columns = {f: arrays[f].tolist() for f in READING_FIELDS}
+        readings = []
+        for i, ts in enumerate(arrays["t"].tolist()):
+            reading = {"serial_number": self.serial_number, "last_synced": ts}
+            for field, values in columns.items():
+                value = values[i]
+                if value != value:  # NaN
+                    continue
+                if field in _INT_FIELDS:
+                    value = int(value)
+                elif field == "is_charging":
+                    value = bool(value)
+                reading[field] = value
+            readings.append(reading)
+        return readings
+
+    def prepend(self, older: list[dict]):
+        """Inserts chronological readings that predate everything buffered."""
+        if self._size:
+            oldest = self.t[self._start].astype(datetime)
+            older = [r for r in older if r["last_synced"] < oldest]
+        current = self.readings()
+        self._start = self._size = 0
+        for reading in (older + current)[-self.capacity :]:
+            self.append(reading)
+
+
+def stack_windows(
+    windows: list[dict], size: int, fields=("temperature",)
+) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    """
+    Right-aligns ring windows into (devices, size) arrays: timestamps (NaT
+    padded) and one NaN-padded matrix per field, for batched analytics.
+    """
+    t = np.full((len(windows), size), np.datetime64("NaT"), dtype="datetime64[ms]")
+    values = {f: np.full((len(windows), size), np.nan) for f in fields}
+    for row, window in enumerate(windows):
+        n = len(window["t"])
+        if n:
+            t[row, size - n :] = window["t"]
+            for field in fields:
+                values[field][row, size - n :] = window[field]
+    return t, values
+
+
+class TelemetryBuffers:
+    """
+    Per-serial rings fed by the telemetry ingestor. Reads are served from
+    memory; a device seen only briefly since startup is backfilled once from
+    MongoDB, so analytics jobs and history requests stop re-querying it.
+    """
+
+    def __init__(self, capacity: int = RING_BUFFER_SIZE):
+        self.capacity = capacity
+        self._rings: dict[str, TelemetryRing] = {}
+        # Serials found to have no stored telemetry, so backfills skip them
+        self._missing: set[str] = set()
+
+    def __contains__(self, serial_number: str) -> bool:
+        return serial_number in self._rings
+
+    def _ring(self, serial_number: str) -> TelemetryRing:
+        ring = self._rings.get(serial_number)
+        if ring is None:
+            ring = self._rings[serial_number] = TelemetryRing(
+                serial_number, self.capacity
+            )
+            if serial_number in self._missing:
+                # Nothing older is stored: the ring is complete as it fills
+                self._missing.discard(serial_number)
+                ring.backfilled = True
+        return ring
+
+    def extend(self, history: list[dict]):
+        """Appends flushed readings (chronological per serial)."""
+        for reading in history:
+            self._ring(reading["serial_number"]).append(reading)
+
+    def discard(self, serial_number: str):
+        self._rings.pop(serial_number, None)
+        self._missing.discard(serial_number)
+
+    def get(self, serial_number: str) -> TelemetryRing | None:
+        """The device's ring as buffered, without any database fallback."""
+        return self._rings.get(serial_number)
+
+    def _is_cold(self, serial_number: str, limit: int) -> bool:
+        if serial_number in self._missing:
+            return False
+        ring = self._rings.get(serial_number)
+        return ring is None or (len(ring) < limit and not ring.backfilled)
+
+    async def backfill_many(self, serial_numbers, limit: int):
+        """
+        Fills the rings of every device holding fewer than `limit` readings,
+        with a single aggregation instead of one query per device. Buckets
+        are read newest first until the ring's capacity is covered, however
+        sparse they are; devices whose buckets run out fall back to legacy
+        telemetry_history documents (one more aggregation), like
+        `read_history`. Every device is backfilled at most once, including
+        those with nothing stored.
+        """
+        cold = [s for s in dict.fromkeys(serial_numbers) if self._is_cold(s, limit)]
+        if not cold:
+            return
+
+        pipeline = [
+            {"$match": {"serial_number": {"$in": cold}}},
+            {
+                "$setWindowFields": {
+                    "partitionBy": "$serial_number",
+                    "sortBy": {"bucket_start": -1, "last": -1},
+                    "output": {
+                        # Readings in the device's newer buckets
+                        "newer": {
+                            "$sum": "$count",
+                            "window": {"documents": ["unbounded", -1]},
+                        }
+                    },
+                }
+            },
+            # Keep buckets until the newer ones cover the ring
+            {"$match": {"newer": {"$lt": self.capacity}}},
+        ]
+        buckets = {}
+        async for bucket in db.telemetry_buckets.aggregate(pipeline):
+            buckets.setdefault(bucket["serial_number"], []).append(bucket)
+
+        found = {}
+        for serial_number, device_buckets in buckets.items():
+            device_buckets.sort(key=lambda b: (b["bucket_start"], b["last"]))
+            readings = []
+            for bucket in device_buckets:
+                readings.extend(unpack_bucket(bucket))
+            found[serial_number] = readings[-self.capacity :]
+
+        short = [s for s in cold if len(found.get(s, ())) < self.capacity]
+        if short:
+            # Legacy documents only fill in before each device's oldest bucket
+            match = [
+                {"serial_number": s, "last_synced": {"$lt": found[s][0]["last_synced"]}}
+                for s in short
+                if found.get(s)
+            ]
+            without_buckets = [s for s in short if not found.get(s)]
+            if without_buckets:
+                match.append({"serial_number": {"$in": without_buckets}})
+            pipeline = [
+                {"$match": {"$or": match}},
+                {
+                    "$group": {
+                        "_id": "$serial_number",
+                        "readings": {
+                            "$topN": {
+                                "n": self.capacity,
+                                "sortBy": {"last_synced": -1},
+                                "output": "$$ROOT",
+                            }
+                        },
+                    }
+                },
+            ]
+            async for doc in db.telemetry_history.aggregate(pipeline):
+                older = doc["readings"][::-1]
+                readings = found.get(doc["_id"], [])
+                found[doc["_id"]] = (older + readings)[-self.capacity :]
+
+        for serial_number in cold:
+            readings = found.get(serial_number)
+            if readings:
+                self._ring(serial_number).prepend(readings)
+            ring = self._rings.get(serial_number)
+            if ring is None:
+                self._missing.add(serial_number)
+            else:
+                ring.backfilled = True
+
+    async def windows(self, serial_numbers, limit: int) -> list[dict]:
+        """Latest `limit` readings of many devices as arrays (see `window`)."""
+        await self.backfill_many(serial_numbers, limit)
+        empty = {"t": np.empty(0, dtype="datetime64[ms]")}
+        empty.update({f: np.empty(0) for f in READING_FIELDS})
+        windows = []
+        for serial_number in serial_numbers:
+            ring = self._rings.get(serial_number)
+            windows.append(ring.window(limit) if ring else empty)
+        return windows
+
+    async def ring(self, serial_number: str, limit: int) -> TelemetryRing | None:
+        """
+        The device's ring holding its latest `limit` readings, backfilled from
+        MongoDB on first use. None if `limit` exceeds the ring capacity.
+        """
+        if limit > self.capacity:
+            return None
+
+        await self.backfill_many([serial_number], limit)
+        # Unknown device: an empty ring, not kept around
+        return self._rings.get(serial_number) or TelemetryRing(
+            serial_number, self.capacity
+        )
+
+    async def recent(self, serial_number: str, limit: int) -> list[dict]:
+        """Latest `limit` readings, oldest first; falls back to MongoDB."""
+        ring = await self.ring(serial_number, limit)
+        if ring is None:
+            return await read_history(serial_number, limit)
+        return ring.readings(limit)
+
+
+telemetry_buffers = TelemetryBuffers()
@@ -0,0 +1,113 @@
+import json
+import os
+import struct
+
+# A frame carries readings for many devices in one AMQP message
+TELEMETRY_BATCH_TYPE = "telemetry_batch"
+FRAME_VERSION = 1
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", "500"))
+
+# "binary" publishes compact struct frames, "json" the legacy JSON frames.
+# Consumers pick the decoder from the AMQP content-type, so both interoperate.
+WIRE_FORMAT = os.getenv("WIRE_FORMAT", "binary")
+JSON_CONTENT_TYPE = "application/json"
+TELEMETRY_CONTENT_TYPE = "application/vnd.twin.telemetry.v1"
+
+# Binary frame: version + reading count, then per reading a length-prefixed
+# serial and cpu %, temperature in tenths of a degree, battery % and charging
+_BINARY_VERSION = 1
+_BINARY_HEADER = struct.Struct("<BH")
+_BINARY_READING = struct.Struct("<BhB?")
+
+
+def encode_batch(readings: list[dict]) -> bytes:
+    """Encodes many single-device readings into one batched frame."""
+    return json.dumps(
+        {"type": TELEMETRY_BATCH_TYPE, "v": FRAME_VERSION, "readings": readings}
+    ).encode()
+
+
+def encode_binary(readings: list[dict]) -> bytes:
+    """
+    Packs readings into the fixed binary layout. Raises if a reading lacks a
+    field or a value does not fit its slot.
+    """
+    parts = [_BINARY_HEADER.pack(_BINARY_VERSION, len(readings))]
+    for reading in readings:
+        serial = reading["serial_number"].encode()
+        parts.append(bytes((len(serial),)))
+        parts.append(serial)
+        parts.append(
+            _BINARY_READING.pack(
+                reading["cpu_usage"],
+                round(reading["temperature"] * 10),
+                reading["battery_health"],
+                reading["is_charging"],
+            )
+        )
+    return b"".join(parts)
+
+
+def decode_binary(body: bytes) -> list[dict]:
+    version, count = _BINARY_HEADER.unpack_from(body, 0)
+    if version != _BINARY_VERSION:
+        raise ValueError(f"Unsupported binary telemetry version {version}")
+
+    readings = []
+    offset = _BINARY_HEADER.size
+    for _ in range(count):
+        length = body[offset]
+        offset += 1
+        serial = body[offset : offset + length].decode()
+        offset += length
+        cpu, temperature, battery, charging = _BINARY_READING.unpack_from(body, offset)
+        offset += _BINARY_READING.size
+        readings.append(
+            {
+                "serial_number": serial,
+                "cpu_usage": cpu,
+                "temperature": temperature / 10,
+                "battery_health": battery,
+                "is_charging": charging,
+            }
+        )
+    return readings
+
+
+def encode_frame(
+    readings: list[dict], wire_format: str = WIRE_FORMAT
+) -> tuple[bytes, str]:
+    """
+    Encodes a frame in the configured wire format and returns it with its
+    content-type. Readings that do not fit the binary layout fall back to JSON.
+    """
+    if wire_format == "binary":
+        try:
+            return encode_binary(readings), TELEMETRY_CONTENT_TYPE
+        except (KeyError, TypeError, ValueError, OverflowError, struct.error):
+            pass
+    return encode_batch(readings), JSON_CONTENT_TYPE
+
+
+def chunk_readings(readings: list[dict], size: int = TELEMETRY_BATCH_SIZE):
+    """Splits readings into frame-sized chunks to keep messages bounded."""
+    for i in range(0, len(readings), size):
+        yield readings[i : i + size]
+
+
+def decode_readings(body: bytes, content_type: str | None = None) -> list[dict]:
+    """
+    Decodes a telemetry message body into a list of readings.
+    Understands binary frames (by content-type), the legacy single-device
+    message and batched JSON frames.
+    """
+    if content_type == TELEMETRY_CONTENT_TYPE:
+        return decode_binary(body)
+
+    payload = json.loads(body)
+
+    if isinstance(payload, dict) and payload.get("type") == TELEMETRY_BATCH_TYPE:
+        return [r for r in payload.get("readings", []) if isinstance(r, dict)]
+    if isinstance(payload, dict):
+        return [payload]
+    return []
@@ -0,0 +1,231 @@
+import asyncio
+import os
+import zlib
+from datetime import datetime
+
+import aio_pika
+from pymongo import UpdateOne
+
+from database import db
+from services.analytics_cache import analytics_cache
+from services.analytics_scheduler import analytics_scheduler
+from services.device_models import device_models
+from services.telemetry_buffer import telemetry_buffers
+from services.telemetry_frames import decode_readings
+from services.telemetry_store import write_readings
+from services.twin_index import twin_index
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "1000"))
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "0.5"))
+# Concurrent flush pipelines; each serial always lands in the same partition
+INGEST_PARTITIONS = int(os.getenv("INGEST_PARTITIONS", "4"))
+
+TELEMETRY_FIELDS = ("cpu_usage", "temperature", "battery_health", "is_charging")
+
+
+class PendingMessage:
+    """
+    Acks an AMQP message only once every reading it carried has been flushed.
+    A frame may be split across flushes, so each flush resolves its share.
+    """
+
+    def __init__(self, message: aio_pika.IncomingMessage, parts: int):
+        self.message = message
+        self.remaining = parts
+
+    async def resolve(self):
+        self.remaining -= 1
+        if self.remaining == 0:
+            await self.message.ack()
+
+
+class IngestPartition:
+    """Buffer for the serials hashed to one partition; flushed one at a time."""
+
+    def __init__(self):
+        # (serial_number, update_data, pending message) in arrival order
+        self.buffer = []
+        self.lock = asyncio.Lock()
+
+
+def partition_for(serial_number: str, partitions: int) -> int:
+    return zlib.crc32(serial_number.encode()) % partitions
+
+
+class TelemetryIngestor:
+    """
+    Accumulates telemetry readings and writes them to MongoDB in bulk when
+    either `batch_size` readings are buffered or `flush_interval` elapses.
+    Readings are partitioned by serial: partitions flush concurrently (one
+    Mongo round trip each at most), while flushes within a partition are
+    serialized, which preserves per-serial ordering. A failed flush keeps
+    its readings (and their messages unacked) at the head of the partition
+    and retries them before anything newer.
+    With a dead-band filter, near-duplicate readings are acked and rolled up
+    but neither persisted nor broadcast. With a streaming detector, every
+    reading is scored as it is flushed and anomalies are alerted right away.
+    """
+
+    def __init__(
+        self,
+        broadcaster=None,
+        rollups=None,
+        deadband=None,
+        detector=None,
+        batch_size: int = INGEST_BATCH_SIZE,
+        flush_interval: float = INGEST_FLUSH_INTERVAL,
+        partitions: int = INGEST_PARTITIONS,
+    ):
+        self.broadcaster = broadcaster
+        self.rollups = rollups
+        self.deadband = deadband
+        self.detector = detector
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._partitions = [IngestPartition() for _ in range(max(1, partitions))]
+        # Size-triggered flushes running in the background
+        self._inflight = set()
+
+    async def submit(self, message: aio_pika.IncomingMessage):
+        """
+        Buffers the readings of one message. A full partition is flushed in the
+        background so the consumer keeps pulling messages meanwhile.
+        """
+        try:
+            readings = decode_readings(message.body, message.content_type)
+        except Exception as e:
+            print(f"Error decoding telemetry: {e}")
+            await message.reject(requeue=False)
+            return
+
+        # Stamped on receipt, so a backlog flushed at once keeps its spacing
+        received_at = datetime.utcnow()
+        entries = []
+        for data in readings:
+            serial_number = data.get("serial_number")
+            update_data = {f: data[f] for f in TELEMETRY_FIELDS if f in data}
+            if serial_number and update_data:
+                update_data["last_synced"] = received_at
+                entries.append((serial_number, update_data))
+
+        if not entries:
+            await message.ack()
+            return
+
+        pending = PendingMessage(message, len(entries))
+        full = set()
+        for serial_number, update_data in entries:
+            index = partition_for(serial_number, len(self._partitions))
+            partition = self._partitions[index]
+            partition.buffer.append((serial_number, update_data, pending))
+            if len(partition.buffer) >= self.batch_size:
+                full.add(index)
+
+        for index in full:
+            task = asyncio.create_task(self._flush_partition(self._partitions[index]))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    def forget(self, serial_number: str, twin_id: str):
+        """Drops the per-device state kept for a deleted twin."""
+        if self.deadband:
+            self.deadband.forget([serial_number])
+        if self.broadcaster:
+            self.broadcaster.forget(twin_id)
+        if self.detector:
+            self.detector.forget(serial_number)
+
+    async def flush(self):
+        """Flushes every partition concurrently, after any in-flight flushes."""
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        await asyncio.gather(*(self._flush_partition(p) for p in self._partitions))
+
+    async def _flush_partition(self, partition: IngestPartition):
+        async with partition.lock:
+            if not partition.buffer:
+                return
+            batch, partition.buffer = partition.buffer, []
+
+            latest = {}
+            history = []
+            received = []
+            for serial_number, update_data, _ in batch:
+                reading = {"serial_number": serial_number, **update_data}
+                received.append(reading)
+                if self.deadband and not self.deadband.accept(
+                    serial_number, update_data, update_data["last_synced"]
+                ):
+                    continue
+                # Latest reading wins for the twin's current state
+                latest[serial_number] = update_data
+                history.append(reading)
+
+            try:
+                if latest:
+                    await db.twins.bulk_write(
+                        [
+                            UpdateOne({"serial_number": s}, {"$set": u})
+                            for s, u in latest.items()
+                        ],
+                        ordered=False,
+                    )
+                # Persist history for analytics, bucketed per serial and window
+                await write_readings(history)
+            except Exception as e:
+                print(f"Error flushing telemetry batch: {e}")
+                if self.deadband:
+                    # The retried readings must not be filtered against
+                    # values that never reached the database
+                    self.deadband.forget(latest)
+                # Requeueing to the broker would let newer readings of these
+                # serials be written first; retry ahead of them instead
+                partition.buffer[:0] = batch
+                return
+
+            for _, _, pending in batch:
+                try:
+                    await pending.resolve()
+                except Exception as e:
+                    # The channel went away; the broker redelivers the message
+                    print(f"Error settling telemetry message: {e}")
+
+            # Recent readings stay in memory for analytics, and every
+            # reading refines the device's incremental trend model
+            telemetry_buffers.extend(received)
+            device_models.observe(received)
+            analytics_scheduler.mark_dirty(latest)
+            analytics_cache.invalidate({r["serial_number"] for r in received})
+
+            # Rollups see every reading, so aggregates stay exact
+            if self.rollups:
+                self.rollups.add(received)
+
+            if self.broadcaster and latest:
+                await self._broadcast(latest)
+
+            if self.detector:
+                try:
+                    await self.detector.publish(self.detector.observe(received))
+                except Exception as e:
+                    print(f"Error publishing anomaly alerts: {e}")
+
+    async def _broadcast(self, latest: dict):
+        twin_ids = await twin_index.get_many(latest)
+        for serial_number, twin_id in twin_ids.items():
+            update_data = latest[serial_number]
+            self.broadcaster.publish(
+                str(twin_id),
+                serial_number,
+                {**update_data, "last_synced": str(update_data["last_synced"])},
+            )
+
+    async def run(self):
+        """Time-based flush trigger, so small batches are not held back."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Telemetry flush error: {e}")
@@ -0,0 +1,107 @@
+import os
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from database import db
+
+# One document per serial per time window, holding parallel arrays of readings
+BUCKET_SECONDS = int(os.getenv("TELEMETRY_BUCKET_SECONDS", "3600"))
+# A full bucket rolls over into a new document for the same window
+BUCKET_MAX_READINGS = int(os.getenv("TELEMETRY_BUCKET_MAX_READINGS", "2000"))
+
+READING_FIELDS = ("cpu_usage", "temperature", "battery_health", "is_charging")
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def bucket_start(ts: datetime, seconds: int = BUCKET_SECONDS) -> datetime:
+    """Floors a naive UTC timestamp to the start of its window."""
+    window = timedelta(seconds=seconds)
+    return _EPOCH + (ts - _EPOCH) // window * window
+
+
+def bucket_updates(history: list[dict]) -> list[UpdateOne]:
+    """
+    Groups readings (each with serial_number and last_synced) into one upsert
+    per bucket, appending them in order to the bucket's arrays.
+    """
+    buckets = {}
+    for reading in history:
+        key = (reading["serial_number"], bucket_start(reading["last_synced"]))
+        buckets.setdefault(key, []).append(reading)
+
+    updates = []
+    for (serial_number, start), readings in buckets.items():
+        push = {"t": {"$each": [r["last_synced"] for r in readings]}}
+        for field in READING_FIELDS:
+            push[field] = {"$each": [r.get(field) for r in readings]}
+
+        updates.append(
+            UpdateOne(
+                {
+                    "serial_number": serial_number,
+                    "bucket_start": start,
+                    "count": {"$lt": BUCKET_MAX_READINGS},
+                },
+                {
+                    "$push": push,
+                    "$inc": {"count": len(readings)},
+                    "$min": {"first": readings[0]["last_synced"]},
+                    "$max": {"last": readings[-1]["last_synced"]},
+                },
+                upsert=True,
+            )
+        )
+    return updates
+
+
+async def write_readings(history: list[dict]):
+    """Appends readings to their time buckets in a single bulk write."""
+    if history:
+        await db.telemetry_buckets.bulk_write(bucket_updates(history), ordered=False)
+
+
+def unpack_bucket(bucket: dict) -> list[dict]:
+    """Expands a bucket document back into chronological reading dicts."""
+    readings = []
+    for i, ts in enumerate(bucket["t"]):
+        reading = {"serial_number": bucket["serial_number"], "last_synced": ts}
+        for field in READING_FIELDS:
+            values = bucket.get(field)
+            if values and values[i] is not None:
+                reading[field] = values[i]
+        readings.append(reading)
+    return readings
+
+
+async def read_history(serial_number: str, limit: int = 100) -> list[dict]:
+    """
+    Returns the latest `limit` readings for a device in chronological order.
+    Reads whole buckets newest first, and falls back to legacy per-reading
+    documents in telemetry_history for anything older than the first bucket.
+    """
+    newest_first = []
+    cursor = db.telemetry_buckets.find({"serial_number": serial_number}).sort(
+        [("bucket_start", -1), ("last", -1)]
+    )
+    async for bucket in cursor:
+        newest_first.extend(reversed(unpack_bucket(bucket)))
+        if len(newest_first) >= limit:
+            break
+    newest_first = newest_first[:limit]
+
+    if len(newest_first) < limit:
+        query = {"serial_number": serial_number}
+        if newest_first:
+            query["last_synced"] = {"$lt": newest_first[-1]["last_synced"]}
+        remaining = limit - len(newest_first)
+        legacy = (
+            db.telemetry_history.find(query, {"_id": 0})
+            .sort("last_synced", -1)
+            .limit(remaining)
+        )
+        newest_first.extend(await legacy.to_list(length=remaining))
+
+    # Reverse to have chronological order for plotting
+    return newest_first[::-1]
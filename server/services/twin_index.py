@@ -0,0 +1,80 @@
+from bson import ObjectId
+
+from database import db
+
+
+class TwinIndex:
+    """
+    In-process serial_number -> twin ObjectId map used on the telemetry hot
+    path. Warmed at startup, maintained by the twin create/delete routes, and
+    backed by a database lookup on a miss.
+    Also tracks each device's sales region (from its most recent sale) for
+    region-scoped Socket.IO rooms.
+    """
+
+    def __init__(self):
+        self._ids: dict[str, ObjectId] = {}
+        self._regions: dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    async def warm(self):
+        cursor = db.twins.find({}, {"serial_number": 1})
+        self._ids = {doc["serial_number"]: doc["_id"] async for doc in cursor}
+
+        latest_sale_region = [
+            {"$sort": {"sold_at": -1}},
+            {"$group": {"_id": "$serial_number", "region": {"$first": "$region"}}},
+        ]
+        cursor = db.sale_records.aggregate(latest_sale_region)
+        self._regions = {doc["_id"]: doc["region"] async for doc in cursor}
+        print(f"📇 Twin index warmed with {len(self._ids)} devices")
+
+    def add(self, serial_number: str, twin_id: ObjectId):
+        self._ids[serial_number] = twin_id
+
+    def discard(self, serial_number: str):
+        self._ids.pop(serial_number, None)
+        self._regions.pop(serial_number, None)
+
+    def region(self, serial_number: str) -> str | None:
+        return self._regions.get(serial_number)
+
+    async def refresh_region(self, serial_number: str):
+        """Re-derives the region after a device's sale records changed."""
+        sale = await db.sale_records.find_one(
+            {"serial_number": serial_number}, {"region": 1}, sort=[("sold_at", -1)]
+        )
+        if sale:
+            self._regions[serial_number] = sale["region"]
+        else:
+            self._regions.pop(serial_number, None)
+
+    async def get(self, serial_number: str) -> ObjectId | None:
+        ids = await self.get_many([serial_number])
+        return ids.get(serial_number)
+
+    async def get_many(self, serial_numbers) -> dict[str, ObjectId]:
+        """Resolves many serials at once; misses cost a single $in query."""
+        found = {}
+        missing = []
+        for serial_number in serial_numbers:
+            twin_id = self._ids.get(serial_number)
+            if twin_id is None:
+                missing.append(serial_number)
+            else:
+                found[serial_number] = twin_id
+
+        if missing:
+            cursor = db.twins.find(
+                {"serial_number": {"$in": missing}}, {"serial_number": 1}
+            )
+            async for doc in cursor:
+                self._ids[doc["serial_number"]] = doc["_id"]
+                found[doc["serial_number"]] = doc["_id"]
+
+        return found
+
+
+twin_index = TwinIndex()
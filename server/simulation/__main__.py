@@ -0,0 +1,24 @@
+import argparse
+
+from services.rabbitmq import SIM_SHARDS
+from simulation.runner import supervise
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Standalone device simulator sharded across worker processes."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=SIM_SHARDS,
+        help="Number of shard processes (must match SIM_SHARDS seen by the API)",
+    )
+    args = parser.parse_args()
+
+    if args.workers != SIM_SHARDS:
+        parser.error(
+            f"--workers={args.workers} does not match SIM_SHARDS={SIM_SHARDS}; "
+            "commands would be routed to shards nobody consumes"
+        )
+
+    supervise(args.workers)
@@ -1,158 +1,229 @@
-import numpy as np
-import pandas as pd
-from sklearn.linear_model import LinearRegression
+import asyncio
 import os
 import random
-import json
-import asyncio
+import struct
 import time
 
 import aio_pika
-from database import db
+import numpy as np
+
+from services.command_frames import decode_command
+from services.rabbitmq import SIM_SHARDS, commands_queue_name
+from services.telemetry_frames import (
+    TELEMETRY_BATCH_TYPE,
+    chunk_readings,
+    encode_frame,
+)
+from simulation.physics_model import SimulationModel
+from simulation.sessions import SessionScheduler
 
 RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "localhost")
 RABBITMQ_USER = os.getenv("RABBITMQ_DEFAULT_USER", "user")
 RABBITMQ_PASS = os.getenv("RABBITMQ_DEFAULT_PASS", "password")
 RABBITMQ_URL = f"amqp://{RABBITMQ_USER}:{RABBITMQ_PASS}@{RABBITMQ_HOST}:5672/"
 
+LIVE_DURATION = 30  # seconds
+# Idle devices release their simulator slot after this long without commands
+IDLE_EVICTION_SECONDS = float(os.getenv("SIM_IDLE_EVICTION_SECONDS", "600"))
+
+# Compact evicted state: cpu, temp, battery (float32) + charging flag
+_SNAPSHOT = struct.Struct("<fff?")
+
 
-class SimulationModel:
+class FleetSimulator:
     """
-    Physics-based model for device simulation trained on synthetic data.
-    Uses scikit-learn to learn relationships between CPU load, Temperature, and Battery.
+    Vectorized simulator for a whole fleet of devices.
+    All device state lives in contiguous NumPy arrays (one slot per serial) so
+    that every active device is advanced with a single batched model prediction.
     """
-    _instance = None
-    _is_trained = False
-
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(SimulationModel, cls).__new__(cls)
-            cls._instance.temp_model = LinearRegression()
-            cls._instance.battery_model = LinearRegression()
-            cls._instance.train()
-        return cls._instance
-
-    def train(self):
-        if self._is_trained:
+
+    def __init__(self, capacity: int = 64, rng: np.random.Generator | None = None):
+        self.model = SimulationModel()
+        # A seeded generator makes runs reproducible; None keeps global RNG state
+        self.rng = rng
+
+        self.cpu = np.zeros(capacity, dtype=np.float64)
+        self.temp = np.full(capacity, 25.0, dtype=np.float64)
+        self.battery = np.zeros(capacity, dtype=np.float64)
+        self.charging = np.zeros(capacity, dtype=bool)
+        self.high_load = np.zeros(capacity, dtype=bool)
+
+        # serial -> slot index, plus the reverse mapping for building telemetry
+        self._slots = {}
+        self._serials = [None] * capacity
+        self._free = list(range(capacity - 1, -1, -1))
+        # serial -> packed state of devices evicted while idle
+        self._snapshots = {}
+
+    def __contains__(self, serial_number) -> bool:
+        return serial_number in self._slots
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _grow(self):
+        old = len(self._serials)
+        new = old * 2
+        self.cpu = np.resize(self.cpu, new)
+        self.temp = np.resize(self.temp, new)
+        self.battery = np.resize(self.battery, new)
+        self.charging = np.resize(self.charging, new)
+        self.high_load = np.resize(self.high_load, new)
+        self._serials.extend([None] * (new - old))
+        self._free.extend(range(new - 1, old - 1, -1))
+
+    def add(self, serial_number) -> int:
+        """Registers a device with a fresh initial state and returns its slot."""
+        if serial_number in self._slots:
+            return self._slots[serial_number]
+        if not self._free:
+            self._grow()
+
+        slot = self._free.pop()
+        snapshot = self._snapshots.pop(serial_number, None)
+        if snapshot is not None:
+            cpu, temp, battery, charging = _SNAPSHOT.unpack(snapshot)
+        else:
+            cpu, temp, charging = 0.0, 25.0, False
+            battery = float(
+                self.rng.integers(40, 91) if self.rng else random.randint(40, 90)
+            )
+
+        self.cpu[slot] = cpu
+        self.temp[slot] = temp
+        self.battery[slot] = battery
+        self.charging[slot] = charging
+        self.high_load[slot] = False
+
+        self._slots[serial_number] = slot
+        self._serials[slot] = serial_number
+        return slot
+
+    def remove(self, serial_number):
+        slot = self._slots.pop(serial_number, None)
+        if slot is not None:
+            self._serials[slot] = None
+            self._free.append(slot)
+
+    def evict(self, serial_number):
+        """Releases a device's slot, keeping its state as a compact snapshot."""
+        slot = self._slots.get(serial_number)
+        if slot is None:
             return
+        self._snapshots[serial_number] = _SNAPSHOT.pack(
+            self.cpu[slot], self.temp[slot], self.battery[slot], self.charging[slot]
+        )
+        self.remove(serial_number)
 
-        print("🧠 Training Physics Simulation Models...")
-        # Synthetic Data Generation
-        n_samples = 1000
-        
-        # Features: CPU Load (0-100), Current Temp (20-90)
-        X_cpu = np.random.uniform(0, 100, n_samples)
-        X_temp = np.random.uniform(20, 90, n_samples)
-        
-        # Target Physics Laws (Approximation)
-        # 1. Temperature approaches a steady state based on CPU load
-        steady_state_temp = 30 + (X_cpu / 100.0) * 50
-        y_temp_delta = 0.1 * (steady_state_temp - X_temp) + np.random.normal(0, 0.5, n_samples)
-        
-        # 2. Battery Drain depends on CPU and Temp
-        y_battery_delta = -(0.01 + (X_cpu / 1000.0) * 0.5 + (X_temp / 100.0) * 0.05) + np.random.normal(0, 0.001, n_samples)
-
-        # Prepare DataFrame for Training
-        df = pd.DataFrame({
-            'cpu': X_cpu,
-            'temp': X_temp,
-            'target_temp_delta': y_temp_delta,
-            'target_battery_delta': y_battery_delta
-        })
-
-        # Train Scikit-Learn Models
-        self.temp_model.fit(df[['cpu', 'temp']], df['target_temp_delta'])
-        self.battery_model.fit(df[['cpu', 'temp']], df['target_battery_delta'])
-        
-        self._is_trained = True
-        print("✅ Models Trained.")
-
-    def predict(self, current_state: pd.DataFrame):
+    def trigger_diagnostics(self, serial_number):
+        # Force high CPU usage for the duration of activity
+        slot = self.add(serial_number)
+        self.high_load[slot] = True
+        self.cpu[slot] = 95.0
+
+    def trigger_update(self, serial_number):
+        # Moderate load for software updates
+        slot = self.add(serial_number)
+        self.high_load[slot] = True
+        self.cpu[slot] = 45.0
+
+    def cooldown(self, serial_number):
+        slot = self._slots.get(serial_number)
+        if slot is not None:
+            self.high_load[slot] = False
+
+    def update(self, serial_numbers) -> list[dict]:
         """
-        Predicts deltas for user state.
-        Expects DataFrame with columns: ['cpu', 'temp']
+        Advances the given devices by one tick and returns their telemetry,
+        in the same order and format as `DeviceSimulator.update`.
         """
-        temp_delta = self.temp_model.predict(current_state[['cpu', 'temp']])
-        battery_delta = self.battery_model.predict(current_state[['cpu', 'temp']])
-        
-        return temp_delta, battery_delta
+        serials = [s for s in serial_numbers if s in self._slots]
+        if not serials:
+            return []
+
+        idx = np.fromiter(
+            (self._slots[s] for s in serials), dtype=np.intp, count=len(serials)
+        )
+
+        # 1. Determine Next CPU State
+        current_cpu = self.cpu[idx]
+        # High load maintains the current level, idle devices target low CPU
+        target_cpu = current_cpu.copy()
+        idle = ~self.high_load[idx]
+        uniform = self.rng.uniform if self.rng else np.random.uniform
+        target_cpu[idle] = uniform(0.0, 5.0, int(idle.sum()))
+        next_cpu = 0.7 * current_cpu + 0.3 * target_cpu
+        self.cpu[idx] = next_cpu
+
+        # 2. Predict Physics (Temp & Battery) for all devices at once
+        current_temp = self.temp[idx]
+        temp_delta, battery_delta = self.model.predict_batch(next_cpu, current_temp)
+        self.temp[idx] = np.clip(current_temp + temp_delta, 20.0, 100.0)
+
+        # 3. Charging Logic
+        charging = self.charging[idx]
+        battery = np.where(
+            charging,
+            np.minimum(100.0, self.battery[idx] + 0.5),
+            np.maximum(0.0, self.battery[idx] + battery_delta),
+        )
+        self.battery[idx] = battery
+        self.charging[idx] = np.where(charging, battery < 100, battery < 10.0)
+
+        cpu_out = self.cpu[idx].astype(np.int64).tolist()
+        temp_out = self.temp[idx].tolist()
+        battery_out = self.battery[idx].astype(np.int64).tolist()
+        charging_out = self.charging[idx].tolist()
+
+        return [
+            {
+                "serial_number": serial,
+                "cpu_usage": cpu,
+                "temperature": round(temp, 1),
+                "battery_health": battery,
+                "is_charging": is_charging,
+            }
+            for serial, cpu, temp, battery, is_charging in zip(
+                serials, cpu_out, temp_out, battery_out, charging_out
+            )
+        ]
 
 
 class DeviceSimulator:
+    """
+    Single-device facade over `FleetSimulator`, kept for callers that drive
+    one device at a time.
+    """
+
     def __init__(self, serial_number):
         self.serial_number = serial_number
-        self.model = SimulationModel()
-        
-        # Initial State
-        self.state = pd.DataFrame([{
-            'cpu': 0.0,
-            'temp': 25.0,
-            'battery': float(random.randint(40, 90)),
-            'charging': 0.0  # 0 or 1
-        }])
-        
-        self.is_high_load = False
+        self.fleet = FleetSimulator(capacity=1)
+        self.fleet.add(serial_number)
+
+    @property
+    def is_high_load(self) -> bool:
+        return bool(self.fleet.high_load[0])
 
     def trigger_diagnostics(self):
-        # Force high CPU usage for the duration of activity
-        self.is_high_load = True
-        self.state.loc[0, 'cpu'] = 95.0
+        self.fleet.trigger_diagnostics(self.serial_number)
 
     def trigger_update(self):
-        # Moderate load for software updates
-        self.is_high_load = True
-        self.state.loc[0, 'cpu'] = 45.0
+        self.fleet.trigger_update(self.serial_number)
 
     def cooldown(self):
-        self.is_high_load = False
+        self.fleet.cooldown(self.serial_number)
 
     def update(self):
-        # 1. Determine Next CPU State
-        current_cpu = self.state.loc[0, 'cpu']
-        
-        if self.is_high_load:
-            # Maintain higher load if triggered
-            target_cpu = current_cpu
-        else:
-            # Idle/Normal behavior: Target low CPU
-            target_cpu = np.random.uniform(0.0, 5.0)
-
-        # Smooth CPU transition
-        next_cpu = 0.7 * current_cpu + 0.3 * target_cpu
-        self.state.loc[0, 'cpu'] = next_cpu
-
-        # 2. Predict Physics (Temp & Battery) using ML Model
-        current_temp = self.state.loc[0, 'temp']
-        temp_delta, battery_delta = self.model.predict(self.state[['cpu', 'temp']])
-        
-        # Apply deltas
-        self.state.loc[0, 'temp'] = np.clip(current_temp + temp_delta[0], 20.0, 100.0)
-        
-        # Handle Charging Logic
-        is_charging = self.state.loc[0, 'charging'] > 0.5
-        current_battery = self.state.loc[0, 'battery']
-        
-        if is_charging:
-             self.state.loc[0, 'battery'] = min(100.0, current_battery + 0.5)
-             if self.state.loc[0, 'battery'] >= 100:
-                 self.state.loc[0, 'charging'] = 0.0
-        else:
-             self.state.loc[0, 'battery'] = max(0.0, current_battery + battery_delta[0])
-             if self.state.loc[0, 'battery'] < 10.0:
-                 self.state.loc[0, 'charging'] = 1.0
+        return self.fleet.update([self.serial_number])[0]
 
-        return {
-            "serial_number": self.serial_number,
-            "cpu_usage": int(self.state.loc[0, 'cpu']),
-            "temperature": round(float(self.state.loc[0, 'temp']), 1),
-            "battery_health": int(self.state.loc[0, 'battery']),
-            "is_charging": bool(self.state.loc[0, 'charging'] > 0.5),
-        }
 
-
-async def run_simulation():
-    """Event-driven simulator background task."""
-    print("🚀 Starting Event-Driven Device Simulation Task...")
+async def run_simulation(shard: int = 0, shards: int = SIM_SHARDS):
+    """
+    Event-driven simulator background task.
+    Owns only the devices whose serial hashes to `shard`, by consuming that
+    shard's commands queue.
+    """
+    print(f"🚀 Starting Event-Driven Device Simulation Task (shard {shard})...")
 
     connection = None
     try:
@@ -160,35 +231,33 @@ async def run_simulation():
         channel = await connection.channel()
         exchange = channel.default_exchange
 
-        command_queue = await channel.declare_queue("device_commands", durable=True)
+        command_queue = await channel.declare_queue(
+            commands_queue_name(shard, shards), durable=True
+        )
 
-        simulators = {}
-        # Active sessions registry: serial -> expiry_timestamp
-        active_sessions = {}
-        
-        LIVE_DURATION = 30 # seconds
+        fleet = FleetSimulator()
+        sessions = SessionScheduler(LIVE_DURATION, IDLE_EVICTION_SECONDS)
 
         async def on_command(message: aio_pika.IncomingMessage):
             async with message.process():
                 try:
-                    payload = json.loads(message.body)
+                    payload = decode_command(message.body, message.content_type)
                     serial = payload.get("target_serial")
                     action = payload.get("action")
-                    
+
                     if not serial:
                         return
 
-                    if serial not in simulators:
-                        simulators[serial] = DeviceSimulator(serial)
-                    
+                    fleet.add(serial)
+
                     print(f" [!] Waking up hardware for {serial}: {action}")
-                    active_sessions[serial] = time.time() + LIVE_DURATION
-                    
+                    sessions.touch(serial, time.time())
+
                     if action == "RUN_DIAGNOSTICS":
-                        simulators[serial].trigger_diagnostics()
+                        fleet.trigger_diagnostics(serial)
                     elif action == "SOFTWARE_UPDATE":
-                        simulators[serial].trigger_update()
-                        
+                        fleet.trigger_update(serial)
+
                 except Exception as e:
                     print(f"Error handling command in simulator: {e}")
 
@@ -196,26 +265,28 @@ async def run_simulation():
 
         while True:
             now = time.time()
-            
-            # Prune and process active sessions
-            active_serials = list(active_sessions.keys())
-            for serial in active_serials:
-                expiry = active_sessions[serial]
-                
-                if now > expiry:
-                    print(f" [-] Device {serial} going back to idle.")
-                    if serial in simulators:
-                        simulators[serial].cooldown()
-                    del active_sessions[serial]
-                    continue
-                
-                # Update and emit telemetry
-                if serial in simulators:
-                    data = simulators[serial].update()
-                    await exchange.publish(
-                        aio_pika.Message(body=json.dumps(data).encode()),
-                        routing_key="telemetry_updates",
-                    )
+
+            # Only sessions that are due are popped from the expiry heap
+            for serial in sessions.pop_expired(now):
+                print(f" [-] Device {serial} going back to idle.")
+                fleet.cooldown(serial)
+
+            for serial in sessions.pop_evictable(now):
+                fleet.evict(serial)
+
+            # Advance every active device in one batched step and emit the
+            # readings as a few batched frames instead of one message per device
+            readings = fleet.update(sessions.active.keys())
+            for chunk in chunk_readings(readings):
+                body, content_type = encode_frame(chunk)
+                await exchange.publish(
+                    aio_pika.Message(
+                        body=body,
+                        type=TELEMETRY_BATCH_TYPE,
+                        content_type=content_type,
+                    ),
+                    routing_key="telemetry_updates",
+                )
 
             await asyncio.sleep(2)
 
@@ -0,0 +1,218 @@
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from simulation.device_sim import LIVE_DURATION, FleetSimulator
+from simulation.sessions import SessionScheduler
+
+TICK_SECONDS = 2.0
+DEFAULT_BATCH_SIZE = 5000
+
+
+class VirtualClock:
+    """Simulated clock that only moves when the simulation advances it."""
+
+    def __init__(self, start: datetime):
+        self.start = start
+        self.elapsed = 0.0
+
+    def time(self) -> float:
+        return self.elapsed
+
+    def now(self) -> datetime:
+        return self.start + timedelta(seconds=self.elapsed)
+
+    def advance(self, seconds: float):
+        self.elapsed += seconds
+
+
+class NDJSONSink:
+    def __init__(self, path: str):
+        self.file = open(path, "w", encoding="utf-8")
+
+    async def write(self, readings: list[dict]):
+        self.file.writelines(json.dumps(r, default=str) + "\n" for r in readings)
+
+    async def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    def __init__(self, path: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise SystemExit(
+                "Parquet output requires 'pyarrow' to be installed."
+            ) from e
+
+        self.pa = pa
+        self.schema = pa.schema(
+            [
+                ("serial_number", pa.string()),
+                ("cpu_usage", pa.int16()),
+                ("temperature", pa.float32()),
+                ("battery_health", pa.int16()),
+                ("is_charging", pa.bool_()),
+                ("last_synced", pa.timestamp("ms")),
+            ]
+        )
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    async def write(self, readings: list[dict]):
+        self.writer.write_table(self.pa.Table.from_pylist(readings, schema=self.schema))
+
+    async def close(self):
+        self.writer.close()
+
+
+class MongoSink:
+    """
+    Bulk-writes readings straight into the bucketed telemetry history and
+    the rollup tiers, so generated data survives raw retention.
+    """
+
+    def __init__(self):
+        from services.rollups import RollupAccumulator
+        from services.telemetry_store import write_readings
+
+        self.write_readings = write_readings
+        self.rollups = RollupAccumulator()
+
+    async def write(self, readings: list[dict]):
+        await self.write_readings(readings)
+        self.rollups.add(readings)
+        await self.rollups.flush()
+
+    async def close(self):
+        await self.rollups.flush()
+
+
+def open_sink(output: str):
+    if output == "mongo":
+        return MongoSink()
+    if output.endswith(".parquet"):
+        return ParquetSink(output)
+    return NDJSONSink(output)
+
+
+async def run_headless(
+    devices: int,
+    hours: float,
+    output: str,
+    seed: int = 42,
+    tick: float = TICK_SECONDS,
+    commands_per_hour: float = 1.0,
+    start: datetime | None = None,
+    serial_prefix: str = "HL",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> int:
+    """
+    Runs `devices` simulated devices for `hours` of virtual time as fast as the
+    CPU allows and streams every reading to `output`.
+    Devices report on every tick; random commands put them under load for
+    LIVE_DURATION virtual seconds, mirroring the live simulator.
+    Returns the number of readings written.
+    """
+    rng = np.random.default_rng(seed)
+    clock = VirtualClock(start or datetime.utcnow() - timedelta(hours=hours))
+    fleet = FleetSimulator(capacity=devices, rng=rng)
+    sessions = SessionScheduler(LIVE_DURATION, float("inf"))
+
+    serials = [f"{serial_prefix}{i:06d}" for i in range(devices)]
+    for serial in serials:
+        fleet.add(serial)
+
+    # Per-tick probability that a device receives a command
+    command_p = min(1.0, commands_per_hour * tick / 3600.0)
+    ticks = int(hours * 3600 / tick)
+
+    sink = open_sink(output)
+    buffer = []
+    written = 0
+    started = time.perf_counter()
+
+    try:
+        for step in range(ticks):
+            for i in np.flatnonzero(rng.random(devices) < command_p):
+                serial = serials[i]
+                if rng.random() < 0.5:
+                    fleet.trigger_diagnostics(serial)
+                else:
+                    fleet.trigger_update(serial)
+                sessions.touch(serial, clock.time())
+
+            for serial in sessions.pop_expired(clock.time()):
+                fleet.cooldown(serial)
+
+            synced_at = clock.now()
+            for reading in fleet.update(serials):
+                reading["last_synced"] = synced_at
+                buffer.append(reading)
+
+            if len(buffer) >= batch_size:
+                await sink.write(buffer)
+                written += len(buffer)
+                buffer = []
+
+            clock.advance(tick)
+
+            if step and step % 1800 == 0:
+                print(f" [~] {clock.now()} | {written} readings written")
+
+        if buffer:
+            await sink.write(buffer)
+            written += len(buffer)
+    finally:
+        await sink.close()
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"✅ Simulated {devices} devices for {hours}h: "
+        f"{written} readings in {elapsed:.1f}s"
+    )
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate telemetry history with an accelerated virtual clock."
+    )
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--hours", type=float, default=24.0)
+    parser.add_argument(
+        "--out",
+        default="mongo",
+        help="'mongo' for the telemetry history, or a .ndjson / .parquet file path",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--tick", type=float, default=TICK_SECONDS)
+    parser.add_argument("--commands-per-hour", type=float, default=1.0)
+    parser.add_argument(
+        "--start",
+        type=datetime.fromisoformat,
+        default=None,
+        help="ISO start time of the simulated window (default: now - hours)",
+    )
+    parser.add_argument("--serial-prefix", default="HL")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    asyncio.run(
+        run_headless(
+            devices=args.devices,
+            hours=args.hours,
+            output=args.out,
+            seed=args.seed,
+            tick=args.tick,
+            commands_per_hour=args.commands_per_hour,
+            start=args.start,
+            serial_prefix=args.serial_prefix,
+            batch_size=args.batch_size,
+        )
+    )
@@ -0,0 +1,43 @@
+import asyncio
+import multiprocessing
+import time
+
+from simulation.device_sim import run_simulation
+
+
+def run_shard(shard: int, shards: int):
+    try:
+        asyncio.run(run_simulation(shard=shard, shards=shards))
+    except KeyboardInterrupt:
+        pass
+
+
+def supervise(workers: int):
+    """Runs one simulator process per shard and restarts any that exit."""
+    ctx = multiprocessing.get_context("spawn")
+    processes = {}
+
+    def start(shard: int):
+        process = ctx.Process(
+            target=run_shard, args=(shard, workers), name=f"simulator-{shard}"
+        )
+        process.start()
+        processes[shard] = process
+
+    for shard in range(workers):
+        start(shard)
+    print(f"🚀 Started {workers} simulator worker(s)")
+
+    try:
+        while True:
+            time.sleep(1)
+            for shard, process in list(processes.items()):
+                if not process.is_alive():
+                    print(f" [!] Simulator shard {shard} exited, restarting...")
+                    start(shard)
+    except KeyboardInterrupt:
+        print("🛑 Stopping simulator workers...")
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
@@ -0,0 +1,63 @@
+import heapq
+
+
+class SessionScheduler:
+    """
+    Tracks live hardware sessions and idle devices with min-heaps keyed by
+    deadline, so each tick only touches sessions that are actually due.
+    Heap entries are invalidated lazily: a popped entry is ignored unless it
+    still matches the current deadline for that serial.
+    """
+
+    def __init__(self, live_duration: float, idle_eviction: float):
+        self.live_duration = live_duration
+        self.idle_eviction = idle_eviction
+
+        # Active sessions registry: serial -> expiry_timestamp
+        self.active = {}
+        # Idle devices still holding simulator state: serial -> evict_timestamp
+        self.idle = {}
+
+        self._expiry_heap = []
+        self._eviction_heap = []
+
+    def __len__(self) -> int:
+        return len(self.active)
+
+    def touch(self, serial_number, now: float):
+        """Starts or extends a live session for a device."""
+        expiry = now + self.live_duration
+        self.active[serial_number] = expiry
+        self.idle.pop(serial_number, None)
+        heapq.heappush(self._expiry_heap, (expiry, serial_number))
+
+    def pop_expired(self, now: float) -> list:
+        """Returns serials whose session ended and schedules their eviction."""
+        expired = []
+        heap = self._expiry_heap
+        while heap and heap[0][0] < now:
+            expiry, serial = heapq.heappop(heap)
+            if self.active.get(serial) != expiry:
+                continue  # Superseded by a later touch
+
+            del self.active[serial]
+            evict_at = expiry + self.idle_eviction
+            self.idle[serial] = evict_at
+            heapq.heappush(self._eviction_heap, (evict_at, serial))
+            expired.append(serial)
+
+        return expired
+
+    def pop_evictable(self, now: float) -> list:
+        """Returns serials that stayed idle long enough to drop their state."""
+        evictable = []
+        heap = self._eviction_heap
+        while heap and heap[0][0] < now:
+            evict_at, serial = heapq.heappop(heap)
+            if self.idle.get(serial) != evict_at:
+                continue  # Woken up again since it went idle
+
+            del self.idle[serial]
+            evictable.append(serial)
+
+        return evictable
@@ -1,5 +1,100 @@
+from collections import Counter
+
 import socketio
 
 # Initialize Socket.IO with permissive CORS for development
 # async_mode='asgi' is critical for integration with Uvicorn/FastAPI
 sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins="*")
+
+# Every twin's telemetry; clients join it on connect until they subscribe
+FLEET_ROOM = "fleet"
+# Aggregated fleet metrics only
+SUMMARY_ROOM = "fleet_summary"
+
+
+def twin_room(serial_number: str) -> str:
+    return f"twin:{serial_number}"
+
+
+def region_room(region: str) -> str:
+    return f"region:{region}"
+
+
+# sid -> rooms it subscribed to, and how many clients sit in each room, so the
+# broadcaster can skip rooms nobody listens to
+_subscriptions: dict[str, set[str]] = {}
+room_members: Counter = Counter()
+
+# rooms -> latest broadcast state of the twins they cover. Set by the
+# telemetry broadcaster: its frames only carry changed fields, so a client
+# joining a room is first sent the state it missed.
+_snapshot_source = None
+
+
+def set_snapshot_source(source):
+    global _snapshot_source
+    _snapshot_source = source
+
+
+def _release(room: str):
+    room_members[room] -= 1
+    if room_members[room] <= 0:
+        del room_members[room]
+
+
+async def _set_rooms(sid: str, rooms: set[str]) -> set[str]:
+    """Moves a client to `rooms`; returns the rooms it newly joined."""
+    current = _subscriptions.get(sid, set())
+    for room in current - rooms:
+        await sio.leave_room(sid, room)
+        _release(room)
+    for room in rooms - current:
+        await sio.enter_room(sid, room)
+        room_members[room] += 1
+    _subscriptions[sid] = rooms
+    return rooms - current
+
+
+def _requested_rooms(data: dict | None) -> set[str]:
+    data = data or {}
+    rooms = {twin_room(s) for s in data.get("serials", [])}
+    rooms |= {region_room(r) for r in data.get("regions", [])}
+    if data.get("fleet_summary"):
+        rooms.add(SUMMARY_ROOM)
+    return rooms
+
+
+@sio.event
+async def connect(sid, environ, auth=None):
+    await _set_rooms(sid, {FLEET_ROOM})
+
+
+@sio.event
+async def disconnect(sid, *args):
+    # Socket.IO drops the sid from its rooms itself; only the counts need updating
+    for room in _subscriptions.pop(sid, set()):
+        _release(room)
+
+
+@sio.event
+async def subscribe(sid, data=None):
+    """
+    Replaces the client's subscriptions.
+    Payload: {"serials": [...], "regions": [...], "fleet_summary": bool}.
+    An empty payload goes back to receiving the whole fleet.
+    """
+    rooms = _requested_rooms(data)
+    joined = await _set_rooms(sid, rooms or {FLEET_ROOM})
+    if joined and _snapshot_source:
+        snapshot = _snapshot_source(joined)
+        if snapshot:
+            await sio.emit("telemetry_batch", snapshot, room=sid)
+    return {"rooms": sorted(_subscriptions[sid])}
+
+
+@sio.event
+async def unsubscribe(sid, data=None):
+    """Drops some subscriptions; same payload shape as `subscribe`."""
+    rooms = _requested_rooms(data)
+    await _set_rooms(sid, _subscriptions.get(sid, set()) - rooms)
+    return {"rooms": sorted(_subscriptions[sid])}
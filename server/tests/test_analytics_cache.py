@@ -0,0 +1,69 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from services.analytics_cache import AnalyticsCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_results_are_reused_until_telemetry_or_expiry():
+    clock = Clock()
+    cache = AnalyticsCache(ttl=30, clock=clock)
+    compute = AsyncMock(return_value={"trend": "stable"})
+
+    assert await cache.get_or_compute("forecast", "QX1", compute) == {"trend": "stable"}
+    await cache.get_or_compute("forecast", "QX1", compute)
+    assert compute.await_count == 1
+
+    await cache.get_or_compute("forecast", "QX1", compute, fresh=True)
+    assert compute.await_count == 2
+
+    cache.invalidate(["QX1"])
+    await cache.get_or_compute("forecast", "QX1", compute)
+    assert compute.await_count == 3
+
+    clock.now += 30
+    await cache.get_or_compute("forecast", "QX1", compute)
+    assert compute.await_count == 4
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_entries_are_evicted():
+    cache = AnalyticsCache(max_size=2, clock=Clock())
+    cache.put("anomalies", "QX1", [])
+    cache.put("anomalies", "QX2", [])
+    cache.get("anomalies", "QX1")
+    cache.put("anomalies", "QX3", [])
+
+    assert len(cache) == 2
+    assert cache.get("anomalies", "QX2") is None
+    assert cache.get("anomalies", "QX1") == []
+
+
+@pytest.mark.asyncio
+async def test_result_computed_across_new_telemetry_is_not_stored():
+    cache = AnalyticsCache(clock=Clock())
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def compute():
+        started.set()
+        await release.wait()
+        return ["stale"]
+
+    task = asyncio.create_task(cache.get_or_compute("anomalies", "QX1", compute))
+    await started.wait()
+    cache.invalidate(["QX1"])
+    release.set()
+
+    assert await task == ["stale"]
+    assert cache.get("anomalies", "QX1") is None
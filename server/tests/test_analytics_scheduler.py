@@ -0,0 +1,111 @@
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from services import analytics_scheduler as scheduler_module
+from services.analytics_scheduler import AnalyticsScheduler
+from services.analytics_worker import AnalyticsWorker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_only_dirty_devices_without_a_pending_job_are_due():
+    clock = Clock()
+    scheduler = AnalyticsScheduler(clock=clock)
+
+    scheduler.mark_dirty(["QX1", "QX2"])
+    assert sorted(scheduler.due()) == ["QX1", "QX2"]
+
+    # New telemetry while the job is queued doesn't enqueue a second one
+    scheduler.mark_dirty(["QX1"])
+    assert scheduler.due() == []
+
+    scheduler.complete("QX1", {"health_score": 70, "anomalies": []})
+    clock.now += scheduler_module.ANALYTICS_INTERVAL
+    assert scheduler.due() == ["QX1"]
+    # Devices without new telemetry are never re-analysed
+    assert scheduler.due() == []
+
+
+def test_interval_adapts_to_device_health():
+    clock = Clock()
+    scheduler = AnalyticsScheduler(clock=clock)
+    healthy = {"health_score": 95, "anomalies": [], "usage_trend": "stable"}
+
+    scheduler.complete("QX1", healthy)
+    assert scheduler._schedule["QX1"][1] == scheduler_module.ANALYTICS_INTERVAL
+    scheduler.complete("QX1", healthy)
+    assert scheduler._schedule["QX1"][1] == 2 * scheduler_module.ANALYTICS_INTERVAL
+    for _ in range(10):
+        scheduler.complete("QX1", healthy)
+    assert scheduler._schedule["QX1"][1] == scheduler_module.ANALYTICS_MAX_INTERVAL
+
+    scheduler.complete("QX1", {**healthy, "anomalies": [{"value": 60}]})
+    assert scheduler._schedule["QX1"][1] == scheduler_module.ANALYTICS_MIN_INTERVAL
+
+    # An anomalous device is due again well before a quiet one
+    scheduler.complete("QX2", healthy)
+    clock.now += scheduler_module.ANALYTICS_MIN_INTERVAL
+    scheduler.mark_dirty(["QX1", "QX2"])
+    assert scheduler.due() == ["QX1"]
+
+
+def test_lost_jobs_expire():
+    clock = Clock()
+    scheduler = AnalyticsScheduler(clock=clock)
+    scheduler.mark_dirty(["QX1"])
+    scheduler.due()
+
+    scheduler.mark_dirty(["QX1"])
+    clock.now += scheduler_module.PENDING_TIMEOUT + 1
+    assert scheduler.due() == ["QX1"]
+
+
+@pytest.mark.asyncio
+async def test_due_devices_are_published_in_batches():
+    scheduler = AnalyticsScheduler(clock=Clock())
+    scheduler.mark_dirty([f"QX{i}" for i in range(5)])
+
+    publish = AsyncMock(side_effect=[True, False, True])
+    with (
+        patch.object(scheduler_module, "ANALYTICS_JOB_BATCH", 2),
+        patch("services.rabbitmq.publish_analytics_jobs", publish),
+    ):
+        assert await scheduler.publish_due() == 5
+
+    assert [len(call.args[0]) for call in publish.await_args_list] == [2, 2, 1]
+    # The batch that failed to publish is retried on the next tick
+    failed = publish.await_args_list[1].args[0]
+    assert sorted(scheduler.due()) == sorted(failed)
+
+
+@pytest.mark.asyncio
+async def test_worker_accepts_batched_jobs_and_reports_results():
+    worker = AnalyticsWorker(processes=0)
+    message = MagicMock()
+    message.body = json.dumps({"serial_numbers": ["QX1", "QX2"]}).encode()
+    message.ack = AsyncMock()
+    legacy = MagicMock()
+    legacy.body = json.dumps({"serial_number": "QX1"}).encode()
+    legacy.ack = AsyncMock()
+
+    worker._analyze = AsyncMock(return_value=([[], []], [{}, {}]))
+    worker._load_context = AsyncMock(return_value=({}, {}))
+    with (
+        patch("services.analytics_worker.db") as db,
+        patch("services.analytics_worker.analytics_scheduler") as scheduler,
+    ):
+        db.device_analytics.bulk_write = AsyncMock()
+        await worker.process_batch([message, legacy])
+
+    worker._analyze.assert_awaited_once_with(["QX1", "QX2"])
+    assert [c.args[0] for c in scheduler.complete.call_args_list] == ["QX1", "QX2"]
+    message.ack.assert_awaited_once()
+    legacy.ack.assert_awaited_once()
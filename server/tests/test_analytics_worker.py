@@ -0,0 +1,152 @@
+import json
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from services.analytics_worker import AnalyticsWorker
+from services.forecasting import forecast_windows
+from services.telemetry_buffer import TelemetryBuffers
+
+T0 = datetime(2026, 3, 4, 15)
+
+
+def make_job(serial: str):
+    message = MagicMock()
+    message.body = json.dumps({"serial_number": serial}).encode()
+    message.redelivered = False
+    message.ack = AsyncMock()
+    message.nack = AsyncMock()
+    message.reject = AsyncMock()
+    return message
+
+
+def async_iter(items):
+    cursor = MagicMock()
+    cursor.__aiter__.return_value = items
+    return cursor
+
+
+@pytest.fixture
+def buffers():
+    buffers = TelemetryBuffers(capacity=64)
+    for serial, spike in (("QX1", 80.0), ("QX2", 31.0)):
+        temperatures = [30.0, 31.0] * 15 + [spike]
+        buffers.extend(
+            {
+                "serial_number": serial,
+                "last_synced": T0 + timedelta(seconds=2 * i),
+                "temperature": temperature,
+                "battery_health": 90,
+            }
+            for i, temperature in enumerate(temperatures)
+        )
+    with (
+        patch("services.analytics_worker.telemetry_buffers", new=buffers),
+        patch.object(buffers, "backfill_many", AsyncMock()),
+    ):
+        yield buffers
+
+
+@pytest.mark.asyncio
+async def test_batch_is_written_with_one_bulk_write(buffers):
+    worker = AnalyticsWorker(processes=0)
+    jobs = [make_job("QX1"), make_job("QX2"), make_job("QX1")]
+
+    with patch("services.analytics_worker.db") as db:
+        db.twins.find = MagicMock(
+            return_value=async_iter(
+                [
+                    {"serial_number": "QX1", "battery_health": 90},
+                    {"serial_number": "QX2", "battery_health": 30},
+                ]
+            )
+        )
+        db.sale_records.aggregate = MagicMock(
+            return_value=async_iter(
+                [{"_id": "QX2", "sold_at": T0, "total_revenue": 1000.0}]
+            )
+        )
+        db.device_analytics.bulk_write = AsyncMock()
+
+        await worker.process_batch(jobs)
+
+    # The duplicate QX1 job is analysed once
+    [updates] = db.device_analytics.bulk_write.await_args.args
+    records = {u._filter["serial_number"]: u._doc["$set"] for u in updates}
+    assert list(records) == ["QX1", "QX2"]
+    assert records["QX1"]["health_score"] == 85
+    assert records["QX1"]["anomalies"][0]["temperature"] == 80.0
+    assert records["QX1"]["revenue_at_risk"] is None
+    assert records["QX2"]["revenue_at_risk"] == 700.0
+    for job in jobs:
+        job.ack.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_is_requeued(buffers):
+    worker = AnalyticsWorker(processes=0)
+    job = make_job("QX1")
+
+    with patch("services.analytics_worker.db") as db:
+        db.twins.find = MagicMock(return_value=async_iter([]))
+        db.sale_records.aggregate = MagicMock(return_value=async_iter([]))
+        db.device_analytics.bulk_write = AsyncMock(side_effect=Exception("down"))
+
+        await worker.process_batch([job])
+
+    job.nack.assert_awaited_once_with(requeue=True)
+    job.ack.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_one_bad_device_is_isolated_and_dropped_on_redelivery(buffers):
+    worker = AnalyticsWorker(processes=0)
+    good, bad = make_job("QX2"), make_job("QX1")
+    bad.redelivered = True
+
+    async def bulk_write(updates, ordered):
+        if any(u._filter["serial_number"] == "QX1" for u in updates):
+            raise Exception("rejected")
+
+    with (
+        patch("services.analytics_worker.db") as db,
+        patch("services.analytics_worker.analytics_scheduler") as scheduler,
+    ):
+        db.twins.find = MagicMock(side_effect=lambda *a: async_iter([]))
+        db.sale_records.aggregate = MagicMock(side_effect=lambda *a: async_iter([]))
+        db.device_analytics.bulk_write = AsyncMock(side_effect=bulk_write)
+
+        await worker.process_batch([good, bad])
+
+    good.ack.assert_awaited_once()
+    bad.reject.assert_awaited_once_with(requeue=False)
+    bad.nack.assert_not_awaited()
+    assert [c.args[0] for c in scheduler.complete.call_args_list] == ["QX2"]
+    scheduler.fail.assert_called_once_with("QX1")
+
+
+@pytest.mark.asyncio
+async def test_only_devices_without_a_warm_model_are_refitted(buffers):
+    worker = AnalyticsWorker(processes=0)
+    model_forecast = {"trend": "increasing", "forecast_temperature": 33.0}
+
+    def forecast(serial_number):
+        if serial_number == "QX1":
+            return model_forecast
+        return {"error": "Not enough data to forecast"}
+
+    with (
+        patch("services.analytics_worker.device_models") as models,
+        patch(
+            "services.analytics_worker.forecast_windows", wraps=forecast_windows
+        ) as fit,
+    ):
+        models.forecast.side_effect = forecast
+        anomalies, forecasts = await worker._analyze(["QX1", "QX2"])
+
+    [(t, values), _] = fit.call_args
+    assert len(t) == 1
+    assert len(anomalies) == 2
+    assert forecasts[0] is model_forecast
+    assert forecasts[1]["trend"] in ("increasing", "decreasing", "stable")
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.anomalies import detect_fleet_anomalies, zscore_anomalies
+from services.telemetry_buffer import TelemetryBuffers, stack_windows
+
+T0 = datetime(2026, 3, 4, 15)
+
+
+def readings(serial: str, temperatures: list[float]) -> list[dict]:
+    return [
+        {
+            "serial_number": serial,
+            "last_synced": T0 + timedelta(seconds=2 * i),
+            "temperature": temperature,
+        }
+        for i, temperature in enumerate(temperatures)
+    ]
+
+
+def pandas_anomalies(data: list[dict]) -> list[dict]:
+    """The original row-by-row implementation, as a reference."""
+    df = pd.DataFrame(data)
+    mean_temp = df["temperature"].mean()
+    std_temp = df["temperature"].std()
+    anomalies = []
+    for _, row in df.iterrows():
+        z_score = (row["temperature"] - mean_temp) / std_temp
+        if abs(z_score) > 2:
+            anomalies.append(
+                {
+                    "timestamp": row["last_synced"].to_pydatetime(),
+                    "temperature": row["temperature"],
+                    "z_score": float(z_score),
+                    "type": "High Temp" if z_score > 0 else "Low Temp",
+                }
+            )
+    return anomalies
+
+
+def test_vectorized_matches_row_by_row_reference():
+    rng = np.random.default_rng(7)
+    buffers = TelemetryBuffers(capacity=50)
+    fleet = {}
+    for d in range(5):
+        temperatures = np.round(rng.normal(35, 2, 40 + d), 1).tolist()
+        temperatures[d * 3] = 60.0
+        fleet[f"QX{d}"] = readings(f"QX{d}", temperatures)
+        buffers.extend(fleet[f"QX{d}"])
+
+    windows = [buffers.get(serial).window(50) for serial in fleet]
+    t, values = stack_windows(windows, 50)
+    result = zscore_anomalies(t, values["temperature"])
+
+    for found, data in zip(result, fleet.values()):
+        expected = pandas_anomalies(data)
+        assert found
+        assert [a["timestamp"] for a in found] == [a["timestamp"] for a in expected]
+        assert [a["z_score"] for a in found] == pytest.approx(
+            [a["z_score"] for a in expected]
+        )
+
+
+def test_short_and_flat_windows_are_not_scored():
+    t, values = stack_windows(
+        [
+            {
+                "t": np.array([T0] * 5, dtype="datetime64[ms]"),
+                "temperature": [99.0] * 5,
+            },
+            {
+                "t": np.array([T0] * 20, dtype="datetime64[ms]"),
+                "temperature": [30.0] * 20,
+            },
+        ],
+        50,
+    )
+    assert zscore_anomalies(t, values["temperature"]) == [[], []]
+
+
+@pytest.mark.asyncio
+async def test_fleet_batch_writes_all_devices_in_one_bulk_write():
+    buffers = TelemetryBuffers(capacity=50)
+    buffers.extend(readings("QX1", [30.0] * 20 + [80.0]))
+    buffers.extend(readings("QX2", [30.0, 31.0] * 10))
+
+    with (
+        patch("services.anomalies.telemetry_buffers", new=buffers),
+        patch("services.anomalies.db") as db,
+        patch.object(buffers, "backfill_many", AsyncMock()),
+    ):
+        db.device_analytics.bulk_write = AsyncMock()
+        report = await detect_fleet_anomalies(["QX1", "QX2", "QX3"])
+
+    [updates] = db.device_analytics.bulk_write.await_args.args
+    assert [u._filter["serial_number"] for u in updates] == ["QX1", "QX2", "QX3"]
+    assert report["devices"] == 3
+    assert list(report["anomalies"]) == ["QX1"]
+    assert report["anomalies"]["QX1"][0]["temperature"] == 80.0
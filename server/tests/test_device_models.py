@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+import pytest
+
+from services.device_models import DecayedRegression, DeviceModelStore
+
+T0 = datetime(2026, 3, 4, 15)
+
+
+def reading(i: int, temperature: float, battery: float) -> dict:
+    return {
+        "serial_number": "QX1",
+        "last_synced": T0 + timedelta(seconds=2 * i),
+        "temperature": temperature,
+        "battery_health": battery,
+    }
+
+
+def test_incremental_fit_matches_weighted_least_squares():
+    rng = np.random.default_rng(5)
+    times = np.cumsum(rng.uniform(1, 5, 40))
+    values = 30 + 0.02 * times + rng.normal(0, 0.3, 40)
+    decay_rate = 0.01
+
+    model = DecayedRegression()
+    for t, y in zip(times, values):
+        model.update(T0 + timedelta(seconds=float(t)), float(y), decay_rate)
+    slope, intercept = model.fit()
+
+    x = times - times[-1]
+    weights = np.exp(decay_rate * x)
+    expected = np.polyfit(x, values, 1, w=np.sqrt(weights))
+    assert [slope, intercept] == pytest.approx(expected)
+
+
+def test_store_forecasts_and_persists_compactly():
+    store = DeviceModelStore(half_life=600)
+    store.observe([reading(i, 30 + i / 10, 90 - i) for i in range(30)])
+
+    forecast = store.forecast("QX1", horizons=(60,))
+
+    assert forecast["current_temperature"] == pytest.approx(32.9)
+    assert forecast["forecast_temperature"] == pytest.approx(35.9)
+    assert forecast["trend"] == "increasing"
+    assert forecast["forecasts"]["battery_health"]["predictions"][0]["value"] == 31
+    assert "error" in store.forecast("QX2")
+
+
+@pytest.mark.asyncio
+async def test_models_survive_a_restart():
+    store = DeviceModelStore(half_life=600)
+    store.observe([reading(i, 30 + i / 10, 90) for i in range(30)])
+
+    with patch("services.device_models.db") as db:
+        db.device_models.bulk_write = AsyncMock()
+        await store.flush()
+        [update] = db.device_models.bulk_write.await_args.args[0]
+        doc = {"serial_number": "QX1", **update._doc["$set"]}
+
+        cursor = MagicMock()
+        cursor.__aiter__.return_value = [doc]
+        db.device_models.find = MagicMock(return_value=cursor)
+        restored = DeviceModelStore(half_life=600)
+        await restored.load()
+
+    assert restored.forecast("QX1") == store.forecast("QX1")
+    # Nothing changed since the flush, so nothing is written again
+    db.device_models.bulk_write.reset_mock()
+    await store.flush()
+    db.device_models.bulk_write.assert_not_awaited()
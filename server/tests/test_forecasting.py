@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from services.forecasting import fit_lines, forecast_windows
+from services.telemetry_buffer import TelemetryBuffers, stack_windows
+
+T0 = datetime(2026, 3, 4, 15)
+
+
+def fill(buffers: TelemetryBuffers, serial: str, temperatures, batteries):
+    buffers.extend(
+        {
+            "serial_number": serial,
+            "last_synced": T0 + timedelta(seconds=2 * i),
+            "temperature": temperature,
+            "battery_health": battery,
+        }
+        for i, (temperature, battery) in enumerate(zip(temperatures, batteries))
+    )
+
+
+def test_batched_fit_matches_polyfit_per_row():
+    rng = np.random.default_rng(3)
+    x = rng.uniform(-100, 0, (4, 30))
+    y = 2.5 * x + rng.normal(0, 1, (4, 30))
+    x[1, :12] = np.nan
+    y[2, 5] = np.nan
+
+    slope, intercept, points = fit_lines(x, y)
+
+    for row in range(4):
+        mask = ~np.isnan(x[row]) & ~np.isnan(y[row])
+        expected = np.polyfit(x[row][mask], y[row][mask], 1)
+        assert [slope[row], intercept[row]] == pytest.approx(expected)
+        assert points[row] == mask.sum()
+
+
+def test_forecast_uses_second_resolution_time_and_horizons():
+    buffers = TelemetryBuffers(capacity=50)
+    # +0.1 °C and -1 % battery per 2 s reading
+    fill(buffers, "QX1", [30 + i / 10 for i in range(50)], [90 - i for i in range(50)])
+    fill(buffers, "QX2", [40.0] * 50, [80] * 50)
+    fill(buffers, "QX3", [30.0] * 5, [80] * 5)
+
+    windows = [buffers.get(s).window(50) for s in ("QX1", "QX2", "QX3")]
+    t, values = stack_windows(windows, 50, ("temperature", "battery_health"))
+    rising, flat, short = forecast_windows(t, values, horizons=(60, 300))
+
+    assert rising["current_temperature"] == pytest.approx(34.9)
+    assert rising["forecast_temperature"] == pytest.approx(37.9)
+    assert rising["trend"] == "increasing"
+    temperature = rising["forecasts"]["temperature"]
+    assert temperature["slope_per_hour"] == pytest.approx(180)
+    assert [p["value"] for p in temperature["predictions"]] == pytest.approx(
+        [37.9, 49.9]
+    )
+    # Battery forecasts are clamped to a valid percentage
+    battery = rising["forecasts"]["battery_health"]
+    assert [p["value"] for p in battery["predictions"]] == [11.0, 0.0]
+
+    assert flat["trend"] == "stable"
+    assert "error" in short
+
+
+def test_trend_follows_the_fitted_slope_not_the_latest_reading():
+    buffers = TelemetryBuffers(capacity=50)
+    # Rising +0.1 °C per reading, but the latest reading spikes above the line
+    temperatures = [30 + i / 10 for i in range(49)] + [60.0]
+    fill(buffers, "QX1", temperatures, [90] * 50)
+
+    t, values = stack_windows([buffers.get("QX1").window(50)], 50)
+    [forecast] = forecast_windows(t, values, horizons=(60,))
+
+    assert forecast["forecast_temperature"] < forecast["current_temperature"]
+    assert forecast["trend"] == "increasing"
@@ -0,0 +1,28 @@
+from services.indexes import INDEXES, SERVICE_QUERIES, plan_stages, winning_plans
+
+
+def test_winning_plan_stages_found_in_aggregate_explain():
+    explain = {
+        "stages": [
+            {
+                "$cursor": {
+                    "queryPlanner": {
+                        "winningPlan": {
+                            "stage": "FETCH",
+                            "inputStage": {"stage": "IXSCAN"},
+                        },
+                        "rejectedPlans": [{"stage": "COLLSCAN"}],
+                    }
+                }
+            }
+        ]
+    }
+
+    stages = [s for plan in winning_plans(explain) for s in plan_stages(plan)]
+
+    # Rejected plans are not reported
+    assert stages == ["FETCH", "IXSCAN"]
+
+
+def test_every_probed_collection_declares_indexes():
+    assert {collection for _, collection, _, _ in SERVICE_QUERIES} <= set(INDEXES)
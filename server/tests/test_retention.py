@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from services import retention
+
+
+def async_cursor(items):
+    cursor = MagicMock()
+    cursor.sort.return_value = cursor
+    cursor.__aiter__.return_value = items
+    return cursor
+
+
+def legacy_doc(i: int) -> dict:
+    return {
+        "_id": i,
+        "serial_number": "QX1",
+        "last_synced": datetime(2026, 1, 1) + timedelta(seconds=2 * i),
+        "temperature": 30.0 + i,
+    }
+
+
+@pytest.fixture
+def mock_db():
+    with (
+        patch("services.retention.db") as db,
+        patch("services.rollups.db", new=db),
+        patch.object(retention, "ARCHIVE_DIR", ""),
+        patch.object(retention.asyncio, "sleep", AsyncMock()),
+    ):
+        db.telemetry_buckets.aggregate.return_value.to_list = AsyncMock(
+            return_value=[{"count": 2, "bytes": 300}]
+        )
+        db.telemetry_buckets.delete_many = AsyncMock(
+            return_value=MagicMock(deleted_count=2)
+        )
+        db.telemetry_history.find.return_value = async_cursor(
+            [legacy_doc(0), legacy_doc(1)]
+        )
+        db.telemetry_history.delete_many = AsyncMock(
+            return_value=MagicMock(deleted_count=2)
+        )
+        db.telemetry_rollups.bulk_write = AsyncMock()
+        yield db
+
+
+@pytest.mark.asyncio
+async def test_legacy_readings_are_deleted_after_their_rollups(mock_db):
+    report = await retention.apply_retention()
+
+    assert report["buckets_deleted"] == 2
+    assert report["legacy_compacted"] == 2
+    assert report["legacy_deleted"] == 2
+    assert report["bytes_reclaimed"] > 300
+    mock_db.telemetry_rollups.bulk_write.assert_awaited_once()
+    mock_db.telemetry_history.delete_many.assert_awaited_once_with(
+        {"_id": {"$in": [0, 1]}}
+    )
+
+
+@pytest.mark.asyncio
+async def test_failed_rollup_write_keeps_legacy_readings(mock_db):
+    mock_db.telemetry_rollups.bulk_write.side_effect = RuntimeError("down")
+
+    report = await retention.apply_retention()
+
+    assert report["buckets_deleted"] == 2
+    assert report["legacy_compacted"] == 0
+    assert report["legacy_deleted"] == 0
+    assert "legacy_error" in report
+    assert (
+        mock_db.telemetry_rollups.bulk_write.await_count == retention._COMPACT_ATTEMPTS
+    )
+    mock_db.telemetry_history.delete_many.assert_not_awaited()
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import random
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from simulation.device_sim import DeviceSimulator, FleetSimulator
+from simulation.headless import run_headless
+from simulation.physics_model import SimulationModel, load_artifact, train_coefficients
+from simulation.sessions import SessionScheduler
+
+
+def test_fleet_matches_per_device_simulators():
+    """
+    A batched fleet step must produce exactly the telemetry that stepping each
+    device on its own would produce.
+    """
+    serials = ["QXA", "QXB", "QXC"]
+
+    random.seed(7)
+    singles = [DeviceSimulator(s) for s in serials]
+    for sim in singles:
+        sim.trigger_diagnostics()
+
+    random.seed(7)
+    fleet = FleetSimulator(capacity=2)
+    for serial in serials:
+        fleet.add(serial)
+        fleet.trigger_diagnostics(serial)
+
+    for _ in range(50):
+        expected = [sim.update() for sim in singles]
+        assert fleet.update(serials) == expected
+
+
+def test_fleet_telemetry_format():
+    np.random.seed(0)
+    fleet = FleetSimulator()
+    fleet.add("QX1")
+
+    [reading] = fleet.update(["QX1", "UNKNOWN"])
+
+    assert set(reading) == {
+        "serial_number",
+        "cpu_usage",
+        "temperature",
+        "battery_health",
+        "is_charging",
+    }
+    assert isinstance(reading["cpu_usage"], int)
+    assert isinstance(reading["temperature"], float)
+    assert isinstance(reading["battery_health"], int)
+    assert isinstance(reading["is_charging"], bool)
+
+
+def test_fleet_reuses_freed_slots():
+    fleet = FleetSimulator(capacity=1)
+    fleet.add("QX1")
+    fleet.add("QX2")
+    assert len(fleet) == 2
+
+    fleet.remove("QX1")
+    assert "QX1" not in fleet
+    fleet.add("QX3")
+
+    assert len(fleet) == 2
+    assert len(fleet.update(["QX2", "QX3"])) == 2
+
+
+def test_physics_artifact_reproducible_from_recorded_seed():
+    artifact = load_artifact()
+    assert artifact is not None
+
+    retrained = train_coefficients(artifact["seed"], artifact["n_samples"])
+    for name in ("temp_model", "battery_model"):
+        np.testing.assert_allclose(retrained[name]["coef"], artifact[name]["coef"])
+        assert retrained[name]["intercept"] == pytest.approx(
+            artifact[name]["intercept"]
+        )
+
+
+def test_physics_predictions_use_stored_coefficients():
+    model = SimulationModel()
+    cpu = np.array([0.0, 50.0, 95.0])
+    temp = np.array([25.0, 40.0, 80.0])
+
+    temp_delta, battery_delta = model.predict_batch(cpu, temp)
+
+    # Hot devices cool toward steady state, batteries always drain
+    assert temp_delta[2] < temp_delta[1]
+    assert (battery_delta < 0).all()
+    np.testing.assert_allclose(model.predict({"cpu": cpu, "temp": temp})[0], temp_delta)
+
+
+def test_session_scheduler_expires_and_evicts_only_due_devices():
+    sessions = SessionScheduler(live_duration=30, idle_eviction=60)
+    sessions.touch("QX1", now=0)
+    sessions.touch("QX2", now=0)
+    # A renewed session invalidates the earlier heap entry
+    sessions.touch("QX2", now=20)
+
+    assert sessions.pop_expired(now=31) == ["QX1"]
+    assert set(sessions.active) == {"QX2"}
+
+    assert sessions.pop_evictable(now=80) == []
+    assert sessions.pop_evictable(now=91) == ["QX1"]
+    assert sessions.idle == {}
+
+
+def test_evicted_device_restores_from_snapshot():
+    fleet = FleetSimulator()
+    fleet.add("QX1")
+    fleet.trigger_diagnostics("QX1")
+    fleet.update(["QX1"])
+    slot = fleet._slots["QX1"]
+    before = (fleet.temp[slot], fleet.battery[slot])
+
+    fleet.evict("QX1")
+    assert "QX1" not in fleet
+
+    slot = fleet.add("QX1")
+    assert (fleet.temp[slot], fleet.battery[slot]) == pytest.approx(before, abs=1e-4)
+
+
+def test_headless_run_is_deterministic(tmp_path):
+    start = datetime(2026, 1, 1)
+    outputs = []
+    for name in ("a.ndjson", "b.ndjson"):
+        path = tmp_path / name
+        written = asyncio.run(
+            run_headless(devices=5, hours=0.1, output=str(path), seed=3, start=start)
+        )
+        outputs.append(path.read_text())
+
+    assert written == 5 * 180
+    assert outputs[0] == outputs[1]
+    first = json.loads(outputs[0].splitlines()[0])
+    assert first["last_synced"] == str(start)
@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from services.telemetry_buffer import TelemetryBuffers, TelemetryRing
+from services.telemetry_store import bucket_updates
+
+T0 = datetime(2026, 3, 4, 15)
+
+
+def make_reading(i: int) -> dict:
+    return {
+        "serial_number": "QX1",
+        "last_synced": T0 + timedelta(seconds=2 * i),
+        "cpu_usage": i,
+        "temperature": 30.0 + i / 10,
+        "battery_health": 90,
+        "is_charging": i % 2 == 0,
+    }
+
+
+def test_ring_keeps_latest_readings_in_order():
+    ring = TelemetryRing("QX1", capacity=4)
+    for i in range(6):
+        ring.append(make_reading(i))
+
+    assert len(ring) == 4
+    assert ring.readings() == [make_reading(i) for i in range(2, 6)]
+    assert ring.readings(2) == [make_reading(4), make_reading(5)]
+    assert ring.window(3)["cpu_usage"].tolist() == [3.0, 4.0, 5.0]
+
+
+def test_prepend_skips_readings_already_buffered():
+    ring = TelemetryRing("QX1", capacity=4)
+    ring.append(make_reading(3))
+    ring.append(make_reading(4))
+
+    ring.prepend([make_reading(i) for i in range(4)])
+
+    assert [r["cpu_usage"] for r in ring.readings()] == [1, 2, 3, 4]
+
+
+def async_iter(items):
+    cursor = MagicMock()
+    cursor.__aiter__.return_value = items
+    return cursor
+
+
+def make_bucket(readings: list[dict]) -> dict:
+    [update] = bucket_updates(readings)
+    bucket = {
+        **update._filter,
+        "count": update._doc["$inc"]["count"],
+        "last": update._doc["$max"]["last"],
+    }
+    for field, push in update._doc["$push"].items():
+        bucket[field] = push["$each"]
+    return bucket
+
+
+@pytest.mark.asyncio
+async def test_cold_devices_are_backfilled_once():
+    buffers = TelemetryBuffers(capacity=8)
+    bucket = make_bucket([make_reading(i) for i in range(2, 5)])
+    legacy = [{"_id": i, **make_reading(i)} for i in (1, 0)]
+
+    with (
+        patch("services.telemetry_buffer.db") as db,
+        patch(
+            "services.telemetry_buffer.read_history", AsyncMock(return_value=[])
+        ) as read_history,
+    ):
+        db.telemetry_buckets.aggregate = MagicMock(return_value=async_iter([bucket]))
+        db.telemetry_history.aggregate = MagicMock(
+            return_value=async_iter([{"_id": "QX1", "readings": legacy}])
+        )
+        buffers.extend([make_reading(5)])
+
+        first = await buffers.recent("QX1", 6)
+        windows = await buffers.windows(["QX1", "QX9"], 8)
+        await buffers.windows(["QX1", "QX9"], 8)
+        # Longer than the ring: served from MongoDB
+        await buffers.recent("QX1", 9)
+
+    assert [r["cpu_usage"] for r in first] == [0, 1, 2, 3, 4, 5]
+    assert len(windows[0]["t"]) == 6
+    assert len(windows[1]["t"]) == 0
+    assert db.telemetry_buckets.aggregate.call_count == 2
+    assert db.telemetry_history.aggregate.call_count == 2
+    [match] = db.telemetry_buckets.aggregate.call_args.args[0][:1]
+    assert match["$match"]["serial_number"]["$in"] == ["QX9"]
+    assert [c.args for c in read_history.await_args_list] == [("QX1", 9)]
+
+
+@pytest.mark.asyncio
+async def test_sparse_buckets_are_read_until_the_ring_is_full():
+    buffers = TelemetryBuffers(capacity=256)
+    # Ten sparse buckets of 15 readings, one per 5-minute window
+    readings = [make_reading(150 * b + i) for b in range(10) for i in range(15)]
+    buckets = [make_bucket(readings[i : i + 15]) for i in range(0, 150, 15)]
+    legacy = [{"_id": i, **make_reading(-i)} for i in range(1, 201)]
+
+    with patch("services.telemetry_buffer.db") as db:
+        db.telemetry_buckets.aggregate = MagicMock(
+            return_value=async_iter(buckets[::-1])
+        )
+        db.telemetry_history.aggregate = MagicMock(
+            return_value=async_iter([{"_id": "QX1", "readings": legacy}])
+        )
+        recent = await buffers.recent("QX1", 100)
+        ring = await buffers.ring("QX1", 256)
+
+    assert recent == readings[-100:]
+    # Buckets ran out before the capacity: legacy readings fill in before them
+    assert len(ring) == 256
+    assert ring.readings()[-150:] == readings
+    assert db.telemetry_buckets.aggregate.call_count == 1
+    [match] = db.telemetry_history.aggregate.call_args.args[0][:1]
+    assert match["$match"]["$or"] == [
+        {"serial_number": "QX1", "last_synced": {"$lt": readings[0]["last_synced"]}}
+    ]
@@ -0,0 +1,77 @@
+import json
+
+from services.command_frames import (
+    COMMAND_CONTENT_TYPE,
+    decode_command,
+    encode_command,
+)
+from services.telemetry_frames import (
+    JSON_CONTENT_TYPE,
+    TELEMETRY_CONTENT_TYPE,
+    chunk_readings,
+    decode_readings,
+    encode_batch,
+    encode_frame,
+)
+
+READING = {
+    "serial_number": "QX1",
+    "cpu_usage": 12,
+    "temperature": 31.4,
+    "battery_health": 80,
+    "is_charging": False,
+}
+
+
+def test_decode_single_device_message():
+    assert decode_readings(json.dumps(READING).encode()) == [READING]
+
+
+def test_batched_frame_round_trip():
+    readings = [{**READING, "serial_number": f"QX{i}"} for i in range(3)]
+    assert decode_readings(encode_batch(readings)) == readings
+
+
+def test_chunk_readings_bounds_frame_size():
+    readings = [READING] * 5
+    assert [len(c) for c in chunk_readings(readings, size=2)] == [2, 2, 1]
+
+
+def test_binary_frame_round_trip_is_smaller_than_json():
+    readings = [
+        {**READING, "serial_number": f"QX{i}", "temperature": 20.0 + i / 10}
+        for i in range(50)
+    ]
+
+    body, content_type = encode_frame(readings, "binary")
+
+    assert content_type == TELEMETRY_CONTENT_TYPE
+    assert decode_readings(body, content_type) == readings
+    assert len(body) * 4 < len(encode_batch(readings))
+
+
+def test_binary_frame_falls_back_to_json_for_unencodable_readings():
+    readings = [READING, {"serial_number": "QX2", "cpu_usage": 5}]
+
+    body, content_type = encode_frame(readings, "binary")
+
+    assert content_type == JSON_CONTENT_TYPE
+    assert decode_readings(body, content_type) == readings
+
+
+def test_command_round_trip():
+    command = {
+        "target_serial": "QX1",
+        "action": "RUN_DIAGNOSTICS",
+        "timestamp": "2026-03-04 15:42:07.123456",
+    }
+
+    body, content_type = encode_command(command, "binary")
+
+    assert content_type == COMMAND_CONTENT_TYPE
+    assert decode_command(body, content_type) == command
+    # Unknown actions are still delivered, as JSON
+    other = {**command, "action": "REBOOT"}
+    body, content_type = encode_command(other, "binary")
+    assert content_type == JSON_CONTENT_TYPE
+    assert decode_command(body, content_type) == other
@@ -0,0 +1,383 @@
+import json
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from bson import ObjectId
+
+import sio_instance
+from services.broadcast import TelemetryBroadcaster
+from services.deadband import DeadbandFilter
+from services.streaming_stats import STREAM_MIN_SAMPLES, StreamingAnomalyDetector
+from services.telemetry_frames import encode_batch
+from services.telemetry_ingest import TelemetryIngestor, partition_for
+from services.twin_index import twin_index
+from sio_instance import FLEET_ROOM, SUMMARY_ROOM, twin_room
+
+
+def make_message(body: bytes):
+    message = MagicMock()
+    message.body = body
+    message.content_type = None
+    message.ack = AsyncMock()
+    message.nack = AsyncMock()
+    message.reject = AsyncMock()
+    return message
+
+
+def reading(serial: str, temperature: float = 30.0) -> dict:
+    return {
+        "serial_number": serial,
+        "cpu_usage": 10,
+        "temperature": temperature,
+        "battery_health": 90,
+        "is_charging": False,
+    }
+
+
+@pytest.fixture
+def mock_db():
+    with (
+        patch("services.telemetry_ingest.db") as db,
+        patch("services.telemetry_store.db", new=db),
+    ):
+        db.twins.bulk_write = AsyncMock()
+        db.telemetry_buckets.bulk_write = AsyncMock()
+        yield db
+
+
+@pytest.mark.asyncio
+async def test_acks_only_after_bulk_flush(mock_db):
+    ingestor = TelemetryIngestor(batch_size=10, partitions=1)
+    message = make_message(encode_batch([reading("QX1"), reading("QX2")]))
+
+    await ingestor.submit(message)
+    message.ack.assert_not_awaited()
+
+    await ingestor.flush()
+
+    message.ack.assert_awaited_once()
+    assert len(mock_db.twins.bulk_write.await_args.args[0]) == 2
+    assert len(mock_db.telemetry_buckets.bulk_write.await_args.args[0]) == 2
+
+
+@pytest.mark.asyncio
+async def test_size_trigger_coalesces_twin_updates(mock_db):
+    ingestor = TelemetryIngestor(batch_size=3)
+    messages = [
+        make_message(json.dumps(reading("QX1", temperature=t)).encode())
+        for t in (30.0, 31.0, 32.0)
+    ]
+
+    for message in messages:
+        await ingestor.submit(message)
+    # Only waits for the size-triggered background flush; nothing is left over
+    await ingestor.flush()
+
+    # One twin update (latest wins), every reading kept in history
+    assert mock_db.twins.bulk_write.await_count == 1
+    [update] = mock_db.twins.bulk_write.await_args.args[0]
+    assert update._doc["$set"]["temperature"] == 32.0
+    [bucket] = mock_db.telemetry_buckets.bulk_write.await_args.args[0]
+    assert bucket._doc["$push"]["temperature"]["$each"] == [30.0, 31.0, 32.0]
+    for message in messages:
+        message.ack.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_partitions_flush_separately_and_ack_frame_once(mock_db):
+    serials = [f"QX{i}" for i in range(20)]
+    ingestor = TelemetryIngestor(batch_size=100, partitions=4)
+    message = make_message(encode_batch([reading(s) for s in serials]))
+
+    await ingestor.submit(message)
+    await ingestor.flush()
+
+    flushed = [
+        {op._filter["serial_number"] for op in call.args[0]}
+        for call in mock_db.twins.bulk_write.await_args_list
+    ]
+    assert 1 < len(flushed) <= 4
+    assert set().union(*flushed) == set(serials)
+    for group in flushed:
+        assert len({partition_for(s, 4) for s in group}) == 1
+    message.ack.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_is_retried_before_newer_readings(mock_db):
+    mock_db.telemetry_buckets.bulk_write.side_effect = RuntimeError("down")
+    ingestor = TelemetryIngestor(batch_size=10, partitions=1)
+    older = make_message(json.dumps(reading("QX1", 30.0)).encode())
+
+    await ingestor.submit(older)
+    await ingestor.flush()
+
+    older.ack.assert_not_awaited()
+    older.nack.assert_not_awaited()
+
+    mock_db.telemetry_buckets.bulk_write.side_effect = None
+    newer = make_message(json.dumps(reading("QX1", 31.0)).encode())
+    await ingestor.submit(newer)
+    await ingestor.flush()
+
+    [update] = mock_db.twins.bulk_write.await_args.args[0]
+    assert update._doc["$set"]["temperature"] == 31.0
+    [bucket] = mock_db.telemetry_buckets.bulk_write.await_args.args[0]
+    assert bucket._doc["$push"]["temperature"]["$each"] == [30.0, 31.0]
+    older.ack.assert_awaited_once()
+    newer.ack.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_broadcast_resolves_ids_from_twin_index(mock_db):
+    twin_id = ObjectId()
+    broadcaster = MagicMock()
+    ingestor = TelemetryIngestor(broadcaster, batch_size=10)
+
+    with patch("services.twin_index.db") as index_db:
+        twin_index.add("QX1", twin_id)
+        try:
+            await ingestor.submit(make_message(json.dumps(reading("QX1")).encode()))
+            await ingestor.flush()
+        finally:
+            twin_index.discard("QX1")
+
+    index_db.twins.find.assert_not_called()
+    published_id, serial_number, update = broadcaster.publish.call_args.args
+    assert published_id == str(twin_id)
+    assert serial_number == "QX1"
+    assert update["temperature"] == 30.0
+
+
+@pytest.fixture
+def fleet_client():
+    with patch.dict("services.broadcast.room_members", {FLEET_ROOM: 1}, clear=True):
+        yield
+
+
+@pytest.mark.asyncio
+async def test_broadcaster_coalesces_and_sends_only_changed_fields(fleet_client):
+    sio = MagicMock()
+    sio.emit = AsyncMock()
+    broadcaster = TelemetryBroadcaster(sio, hz=4)
+
+    broadcaster.publish("t1", "QX1", {"temperature": 30.0, "cpu_usage": 5})
+    broadcaster.publish("t1", "QX1", {"temperature": 31.0, "cpu_usage": 5})
+    broadcaster.publish("t2", "QX2", {"temperature": 40.0})
+    await broadcaster.flush()
+
+    event, frame = sio.emit.await_args.args
+    assert event == "telemetry_batch"
+    assert sio.emit.await_args.kwargs == {"room": FLEET_ROOM}
+    assert frame == [
+        {"_id": "t1", "temperature": 31.0, "cpu_usage": 5},
+        {"_id": "t2", "temperature": 40.0},
+    ]
+
+    broadcaster.publish("t1", "QX1", {"temperature": 31.0, "cpu_usage": 7})
+    broadcaster.publish("t2", "QX2", {"temperature": 40.0})
+    await broadcaster.flush()
+
+    assert sio.emit.await_args.args[1] == [{"_id": "t1", "cpu_usage": 7}]
+
+
+@pytest.mark.asyncio
+async def test_broadcaster_emits_only_to_subscribed_rooms():
+    sio = MagicMock()
+    sio.emit = AsyncMock()
+    broadcaster = TelemetryBroadcaster(sio, hz=4)
+
+    subscribed = {twin_room("QX2"): 1, SUMMARY_ROOM: 1}
+    with patch.dict("services.broadcast.room_members", subscribed, clear=True):
+        broadcaster.publish("t1", "QX1", {"temperature": 30.0})
+        broadcaster.publish("t2", "QX2", {"temperature": 40.0})
+        await broadcaster.flush()
+
+    calls = [(c.args[0], c.kwargs["room"]) for c in sio.emit.await_args_list]
+    assert calls == [
+        ("telemetry_batch", twin_room("QX2")),
+        ("fleet_summary", SUMMARY_ROOM),
+    ]
+    assert sio.emit.await_args_list[0].args[1] == [{"_id": "t2", "temperature": 40.0}]
+    assert sio.emit.await_args.args[1]["avg_temperature"] == 35.0
+
+
+@pytest.mark.asyncio
+async def test_deadband_skips_near_duplicates_but_rolls_them_up(mock_db):
+    rollups = MagicMock()
+    ingestor = TelemetryIngestor(
+        rollups=rollups, deadband=DeadbandFilter(), batch_size=10, partitions=1
+    )
+    messages = [
+        make_message(json.dumps(reading("QX1", temperature=t)).encode())
+        for t in (30.0, 30.1, 30.3)
+    ]
+
+    for message in messages:
+        await ingestor.submit(message)
+    await ingestor.flush()
+
+    # 30.1 is inside the 0.2 °C band around 30.0 and is not persisted
+    [bucket] = mock_db.telemetry_buckets.bulk_write.await_args.args[0]
+    assert bucket._doc["$push"]["temperature"]["$each"] == [30.0, 30.3]
+    [rolled_up] = rollups.add.call_args.args
+    assert [r["temperature"] for r in rolled_up] == [30.0, 30.1, 30.3]
+    for message in messages:
+        message.ack.assert_awaited_once()
+
+    # A repeat of the last value is dropped entirely
+    mock_db.twins.bulk_write.reset_mock()
+    await ingestor.submit(make_message(json.dumps(reading("QX1", 30.3)).encode()))
+    await ingestor.flush()
+    mock_db.twins.bulk_write.assert_not_awaited()
+
+
+def test_deadband_heartbeat_and_charging_flip():
+    deadband = DeadbandFilter(heartbeat=60)
+    t0 = datetime(2026, 3, 4, 15)
+    base = reading("QX1")
+
+    assert deadband.accept("QX1", base, t0)
+    assert not deadband.accept("QX1", base, t0 + timedelta(seconds=30))
+    assert deadband.accept("QX1", {**base, "is_charging": True}, t0)
+    assert deadband.accept(
+        "QX1", {**base, "is_charging": True}, t0 + timedelta(seconds=60)
+    )
+
+
+def test_streaming_detector_alerts_on_spike_only():
+    detector = StreamingAnomalyDetector()
+    t0 = datetime(2026, 3, 4, 15)
+    steady = [
+        {**reading("QX1", 30.0 + (i % 3) / 10), "last_synced": t0}
+        for i in range(STREAM_MIN_SAMPLES)
+    ]
+
+    assert detector.observe(steady) == []
+    [alert] = detector.observe([{**reading("QX1", 45.0), "last_synced": t0}])
+
+    assert alert["serial_number"] == "QX1"
+    assert alert["type"] == "High"
+    assert alert["z_score"] > 3
+
+
+@pytest.mark.asyncio
+async def test_alerts_are_pushed_on_flush(mock_db):
+    sio = MagicMock()
+    sio.emit = AsyncMock()
+    detector = StreamingAnomalyDetector(sio, threshold=0.5)
+    ingestor = TelemetryIngestor(detector=detector, batch_size=100, partitions=1)
+    mock_db.device_analytics.bulk_write = AsyncMock()
+    twin_id = ObjectId()
+    twin_index.add("QX1", twin_id)
+
+    temperatures = [30.0, 31.0] * (STREAM_MIN_SAMPLES // 2) + [40.0]
+    for t in temperatures:
+        await ingestor.submit(make_message(json.dumps(reading("QX1", t)).encode()))
+    with (
+        patch("services.streaming_stats.db", new=mock_db),
+        patch.dict("sio_instance.room_members", {FLEET_ROOM: 1}, clear=True),
+    ):
+        await ingestor.flush()
+
+    [update] = mock_db.device_analytics.bulk_write.await_args.args[0]
+    [alert] = update._doc["$push"]["live_anomalies"]["$each"]
+    assert alert["value"] == 40.0
+    event, payload = sio.emit.await_args.args
+    assert event == "anomaly_alert"
+    assert payload["_id"] == str(twin_id)
+    assert sio.emit.await_args.kwargs["room"] == [FLEET_ROOM]
+    twin_index.discard("QX1")
+
+
+@pytest.mark.asyncio
+async def test_readings_are_stamped_on_receipt(mock_db):
+    t0 = datetime(2026, 3, 4, 15)
+    ingestor = TelemetryIngestor(batch_size=10, partitions=1)
+
+    with patch("services.telemetry_ingest.datetime") as clock:
+        for i, t in enumerate((30.0, 31.0)):
+            clock.utcnow.return_value = t0 + timedelta(seconds=2 * i)
+            await ingestor.submit(make_message(json.dumps(reading("QX1", t)).encode()))
+        clock.utcnow.return_value = t0 + timedelta(seconds=60)
+        await ingestor.flush()
+
+    [bucket] = mock_db.telemetry_buckets.bulk_write.await_args.args[0]
+    assert bucket._doc["$push"]["t"]["$each"] == [t0, t0 + timedelta(seconds=2)]
+
+
+@pytest.mark.asyncio
+async def test_closed_channel_does_not_abort_flush(mock_db):
+    rollups = MagicMock()
+    ingestor = TelemetryIngestor(rollups=rollups, batch_size=10, partitions=1)
+    closed = make_message(json.dumps(reading("QX1")).encode())
+    closed.ack.side_effect = RuntimeError("channel closed")
+    other = make_message(json.dumps(reading("QX2")).encode())
+
+    await ingestor.submit(closed)
+    await ingestor.submit(other)
+    await ingestor.flush()
+
+    other.ack.assert_awaited_once()
+    [rolled_up] = rollups.add.call_args.args
+    assert [r["serial_number"] for r in rolled_up] == ["QX1", "QX2"]
+
+
+@pytest.mark.asyncio
+async def test_forgotten_twin_leaves_broadcast_state(fleet_client):
+    sio = MagicMock()
+    sio.emit = AsyncMock()
+    broadcaster = TelemetryBroadcaster(sio, hz=4)
+    ingestor = TelemetryIngestor(broadcaster, deadband=DeadbandFilter())
+
+    broadcaster.publish("t1", "QX1", {"temperature": 30.0})
+    broadcaster.publish("t2", "QX2", {"temperature": 40.0})
+    await broadcaster.flush()
+    ingestor.forget("QX1", "t1")
+
+    assert broadcaster.fleet_summary()["devices"] == 1
+    assert broadcaster.fleet_summary()["avg_temperature"] == 40.0
+
+
+def test_recreated_serial_starts_a_fresh_baseline():
+    detector = StreamingAnomalyDetector()
+    ingestor = TelemetryIngestor(detector=detector)
+    t0 = datetime(2026, 3, 4, 15)
+    steady = [
+        {**reading("QX1", 30.0 + (i % 3) / 10), "last_synced": t0}
+        for i in range(STREAM_MIN_SAMPLES)
+    ]
+    detector.observe(steady)
+
+    ingestor.forget("QX1", "t1")
+
+    assert detector.observe([{**reading("QX1", 45.0), "last_synced": t0}]) == []
+
+
+@pytest.mark.asyncio
+async def test_subscribing_sends_a_snapshot_of_the_joined_rooms(fleet_client):
+    sio = MagicMock()
+    sio.emit = AsyncMock()
+    broadcaster = TelemetryBroadcaster(sio, hz=4)
+    broadcaster.publish("t1", "QX1", {"temperature": 30.0, "cpu_usage": 5})
+    broadcaster.publish("t2", "QX2", {"temperature": 40.0})
+    await broadcaster.flush()
+    # Only the changed field goes out afterwards
+    broadcaster.publish("t1", "QX1", {"temperature": 31.0, "cpu_usage": 5})
+    await broadcaster.flush()
+
+    with (
+        patch.object(sio_instance, "_snapshot_source", broadcaster.snapshot),
+        patch.object(sio_instance.sio, "enter_room", AsyncMock()),
+        patch.object(sio_instance.sio, "leave_room", AsyncMock()),
+        patch.object(sio_instance.sio, "emit", AsyncMock()) as emit,
+    ):
+        await sio_instance.subscribe("sid1", {"serials": ["QX1"]})
+        sio_instance._subscriptions.pop("sid1", None)
+
+    emit.assert_awaited_once_with(
+        "telemetry_batch",
+        [{"_id": "t1", "temperature": 31.0, "cpu_usage": 5}],
+        room="sid1",
+    )
@@ -0,0 +1,204 @@
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from services.rollups import ROLLUP_RETENTION_DAYS, RollupAccumulator, format_rollup
+from services.telemetry_store import bucket_start, bucket_updates, unpack_bucket
+
+
+def make_reading(serial: str, ts: datetime, temperature: float) -> dict:
+    return {
+        "serial_number": serial,
+        "last_synced": ts,
+        "cpu_usage": 5,
+        "temperature": temperature,
+        "battery_health": 80,
+        "is_charging": False,
+    }
+
+
+def _evaluate(expr, doc: dict):
+    """Evaluates the aggregation operators rollup updates use."""
+    if isinstance(expr, str) and expr.startswith("$"):
+        value = doc
+        for key in expr[1:].split("."):
+            value = value.get(key) if isinstance(value, dict) else None
+        return value
+    if not isinstance(expr, dict):
+        return expr
+    [(op, args)] = expr.items()
+    args = [_evaluate(arg, doc) for arg in args]
+    present = [a for a in args if a is not None]
+    if op == "$add":
+        return sum(args)
+    if op == "$ifNull":
+        return present[0]
+    if op == "$min":
+        return min(present)
+    if op == "$max":
+        return max(present)
+    if op == "$gte":
+        return args[0] >= args[1]
+    if op == "$cond":
+        return args[1] if args[0] else args[2]
+    raise NotImplementedError(op)
+
+
+def apply_pipeline(doc: dict, pipeline: list[dict]) -> dict:
+    """Applies a single-stage $set update pipeline to a document."""
+    [stage] = pipeline
+    updated = {k: dict(v) if isinstance(v, dict) else v for k, v in doc.items()}
+    for path, expr in stage["$set"].items():
+        value = _evaluate(expr, doc)
+        *parents, key = path.split(".")
+        target = updated
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[key] = value
+    return updated
+
+
+def test_bucket_start_floors_to_window():
+    ts = datetime(2026, 3, 4, 15, 42, 7)
+    assert bucket_start(ts, 3600) == datetime(2026, 3, 4, 15, 0, 0)
+    assert bucket_start(ts, 60) == datetime(2026, 3, 4, 15, 42, 0)
+
+
+def test_bucket_updates_group_by_serial_and_window():
+    t0 = datetime(2026, 3, 4, 15, 59, 58)
+    readings = [
+        make_reading("QX1", t0, 30.0),
+        make_reading("QX2", t0, 40.0),
+        make_reading("QX1", t0 + timedelta(seconds=2), 31.0),
+        make_reading("QX1", t0 + timedelta(seconds=4), 32.0),
+    ]
+
+    updates = bucket_updates(readings)
+
+    keys = [(u._filter["serial_number"], u._filter["bucket_start"]) for u in updates]
+    assert keys == [
+        ("QX1", datetime(2026, 3, 4, 15)),
+        ("QX2", datetime(2026, 3, 4, 15)),
+        ("QX1", datetime(2026, 3, 4, 16)),
+    ]
+    assert updates[2]._doc["$inc"] == {"count": 2}
+    assert updates[2]._doc["$push"]["temperature"]["$each"] == [31.0, 32.0]
+
+
+def test_unpack_bucket_restores_readings():
+    t0 = datetime(2026, 3, 4, 15, 0, 0)
+    readings = [
+        make_reading("QX1", t0 + timedelta(seconds=2 * i), 30.0 + i) for i in range(3)
+    ]
+    [update] = bucket_updates(readings)
+
+    bucket = {"serial_number": "QX1"}
+    for field, push in update._doc["$push"].items():
+        bucket[field] = push["$each"]
+
+    assert unpack_bucket(bucket) == readings
+
+
+def test_rollup_accumulator_aggregates_per_tier():
+    t0 = datetime(2026, 3, 4, 15, 0, 50)
+    rollups = RollupAccumulator()
+    rollups.add(
+        [
+            make_reading("QX1", t0, 30.0),
+            make_reading("QX1", t0 + timedelta(seconds=4), 34.0),
+            make_reading("QX1", t0 + timedelta(seconds=12), 32.0),
+        ]
+    )
+
+    updates = {
+        (u._filter["resolution"], u._filter["bucket_start"]): u._doc
+        for u in rollups._updates(rollups._partials)
+    }
+    assert set(updates) == {
+        ("minute", datetime(2026, 3, 4, 15, 0)),
+        ("minute", datetime(2026, 3, 4, 15, 1)),
+        ("hour", datetime(2026, 3, 4, 15)),
+        ("day", datetime(2026, 3, 4)),
+    }
+
+    hour = apply_pipeline({}, updates[("hour", datetime(2026, 3, 4, 15))])
+    assert hour["count"] == 3
+    assert hour["temperature"]["sum"] == 96.0
+    assert hour["temperature"]["min"] == 30.0
+    assert hour["temperature"]["max"] == 34.0
+    assert hour["temperature"]["last"] == 32.0
+
+
+def test_older_readings_do_not_overwrite_rollup_last():
+    t0 = datetime(2026, 3, 4, 15, 30)
+    live = RollupAccumulator()
+    live.add([make_reading("QX1", t0, 40.0)])
+    legacy = RollupAccumulator()
+    legacy.add([make_reading("QX1", t0 - timedelta(minutes=20), 30.0)])
+
+    def hour_update(rollups):
+        [update] = [
+            u._doc
+            for u in rollups._updates(rollups._partials)
+            if u._filter["resolution"] == "hour"
+        ]
+        return update
+
+    doc = apply_pipeline({}, hour_update(live))
+    doc = apply_pipeline(doc, hour_update(legacy))
+
+    assert doc["count"] == 2
+    assert doc["last_t"] == t0
+    assert doc["temperature"]["last"] == 40.0
+    assert doc["temperature"]["min"] == 30.0
+
+
+def test_format_rollup_reports_mean_and_extremes():
+    doc = {
+        "serial_number": "QX1",
+        "resolution": "hour",
+        "bucket_start": datetime(2026, 3, 4, 15),
+        "count": 3,
+        "temperature": {"sum": 96.0, "n": 3, "min": 30.0, "max": 34.0, "last": 32.0},
+    }
+
+    point = format_rollup(doc)
+
+    assert point["last_synced"] == datetime(2026, 3, 4, 15)
+    assert point["temperature"] == 32.0
+    assert point["min"]["temperature"] == 30.0
+    assert point["max"]["temperature"] == 34.0
+    assert "cpu_usage" not in point
+
+
+def test_rollup_tiers_set_expiry_from_retention():
+    start = datetime(2026, 3, 4, 15, 42, 7)
+    rollups = RollupAccumulator()
+    rollups.add([make_reading("QX1", start, 30.0)])
+
+    updates = {
+        u._filter["resolution"]: u._doc for u in rollups._updates(rollups._partials)
+    }
+
+    assert apply_pipeline({}, updates["minute"])["expire_at"] == datetime(
+        2026, 3, 4, 15, 43
+    ) + timedelta(days=ROLLUP_RETENTION_DAYS["minute"])
+    # Day aggregates are kept forever by default
+    assert "expire_at" not in apply_pipeline({}, updates["day"])
+
+
+@pytest.mark.asyncio
+async def test_rollup_flush_restores_only_failed_writes():
+    t0 = datetime(2026, 3, 4, 15, 0, 50)
+    rollups = RollupAccumulator()
+    rollups.add([make_reading("QX1", t0, 30.0)])
+    keys = list(rollups._partials)
+
+    error = BulkWriteError({"writeErrors": [{"index": 1, "errmsg": "boom"}]})
+    with patch("services.rollups.db") as db:
+        db.telemetry_rollups.bulk_write = AsyncMock(side_effect=error)
+        await rollups.flush()
+
+    assert list(rollups._partials) == [keys[1]]